@@ -0,0 +1,57 @@
+'''
+Cost of encoding a list page per encoder of pets.encoders, from the rows the
+service fetched to the bytes of the response, and of the same rows as NDJSON.
+Runs without a database:
+
+    python -m benchmarks.bench_json_encoder --rows 10000 --repeat 20
+'''
+import os
+import sys
+import json
+import time
+import argparse
+from datetime import datetime
+from typing import Callable, Dict
+
+
+def measure(run: Callable[[], bytes], repeat: int) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        best = min(best, time.perf_counter() - start)
+    return best * 1e3
+
+
+def main(rows: int, repeat: int) -> Dict[str, float]:
+    import pets.dtos as dtos
+    from pets.encoders import ENCODERS
+
+    records = [
+        {
+            'id': index, 'name': f'Pet {index}', 'breed': 'Mutt', 'age': index % 20, 'owner_id': 1,
+            'version': 1, 'updated_at': datetime(2024, 1, 1)
+        }
+        for index in range(rows)
+    ]
+    page = dtos.RowPage(dtos.PetPageDto, dtos.PetResponseDto, records, 'cursor')
+
+    result: Dict[str, float] = {'rows': rows}
+    for name, encoder_type in ENCODERS.items():
+        encoder = encoder_type()
+        result[f'{name}_page_ms'] = measure(lambda: encoder.encode(page), repeat)
+        result[f'{name}_ndjson_ms'] = measure(lambda: encoder.encode_lines(dtos.PetResponseDto, records), repeat)
+    return result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    os.environ.setdefault('DATABASE_URL', 'sqlite:///:memory:')
+    os.environ.setdefault('SQLALCHEMY_SILENCE_UBER_WARNING', '1')
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    print(json.dumps(main(args.rows, args.repeat), indent=2))
@@ -0,0 +1,86 @@
+'''
+Per-row cost of building list/retrieve responses.
+
+Compares the ormar path (model instance -> model_dump -> validated DTO) with the
+raw row path (selected columns -> DTO.from_row, validated as well but without
+an ormar model in between). Runs on a throw-away SQLite database:
+
+    python -m benchmarks.bench_row_to_response --rows 10000 --repeat 5
+'''
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+from typing import Awaitable, Callable, Dict, List
+
+
+async def measure(run: Callable[[], Awaitable[int]], repeat: int) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        rows = await run()
+        best = min(best, (time.perf_counter() - start) / rows)
+    return best * 1e6
+
+
+async def main(rows: int, repeat: int) -> Dict[str, float]:
+    from config import DATABASE_URL, database
+    from pets.db import fetch_rows, insert_many
+    from pets.migrations import migrate, sync_engine
+    from pets.models import User, Pet
+    import pets.dtos as dtos
+
+    migrate(sync_engine(DATABASE_URL))
+    async with database:
+        owner_id = (await insert_many(User.ormar_config.table, [{'name': 'Owner', 'email': 'owner@pets.com'}]))[0]
+        await insert_many(
+            Pet.ormar_config.table,
+            [{'name': f'Pet {i}', 'breed': 'Mutt', 'age': i % 20, 'owner_id': owner_id} for i in range(rows)]
+        )
+
+        pets: List[Pet] = await Pet.objects.all()
+        records = await fetch_rows(Pet.objects)
+
+        async def build_ormar() -> int:
+            [dtos.PetResponseDto(**pet.model_dump()) for pet in pets]
+            return len(pets)
+
+        async def build_row() -> int:
+            [dtos.PetResponseDto.from_row(row) for row in records]
+            return len(records)
+
+        async def list_ormar() -> int:
+            result = [dtos.PetResponseDto(**pet.model_dump()) for pet in await Pet.objects.all()]
+            dtos.PetResponseDto.model_dump_json_many(result)
+            return len(result)
+
+        async def list_row() -> int:
+            result = [dtos.PetResponseDto.from_row(row) for row in await fetch_rows(Pet.objects)]
+            dtos.PetResponseDto.model_dump_json_many(result)
+            return len(result)
+
+        return {
+            'rows': rows,
+            'build_us_per_row_before': await measure(build_ormar, repeat),
+            'build_us_per_row_after': await measure(build_row, repeat),
+            'list_us_per_row_before': await measure(list_ormar, repeat),
+            'list_us_per_row_after': await measure(list_row, repeat),
+        }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    os.environ['DATABASE_URL'] = f'sqlite:///{directory}/bench.db'
+    os.environ.setdefault('SQLALCHEMY_SILENCE_UBER_WARNING', '1')
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    result = asyncio.run(main(args.rows, args.repeat))
+    print(json.dumps(result, indent=2))
@@ -0,0 +1,80 @@
+'''
+Cold start of a worker: interpreter plus `import main`, lifespan startup and
+the first request, each run in a fresh process. The schema is migrated once
+beforehand, as a deploy does, so workers never touch it. Runs on a throw-away
+SQLite database by default, pass --database-url for Postgres:
+
+    python -m benchmarks.bench_startup --runs 10
+'''
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import statistics
+import subprocess
+from typing import Dict, List
+
+
+ROOT: str = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+WORKER: str = '''
+import sys, json, time, asyncio
+start = time.perf_counter()
+import main
+imported = time.perf_counter()
+
+import httpx
+
+async def first_request():
+    async with main.app.router.lifespan_context(main.app):
+        started = time.perf_counter()
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://startup.test') as client:
+            response = await client.get('/pet/pet', params={'limit': 1})
+        assert response.status_code == 200, response.text
+        return started, time.perf_counter()
+
+started, answered = asyncio.run(first_request())
+print(json.dumps({
+    'import_ms': (imported - start) * 1000,
+    'lifespan_ms': (started - imported) * 1000,
+    'first_request_ms': (answered - started) * 1000,
+}))
+'''
+
+
+def run_worker(env: Dict[str, str]) -> Dict[str, float]:
+    start = time.perf_counter()
+    output = subprocess.run(
+        [sys.executable, '-c', WORKER], cwd=ROOT, env=env, check=True, capture_output=True, text=True
+    ).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    result['process_ms'] = (time.perf_counter() - start) * 1000
+    return result
+
+
+def main(runs: int, env: Dict[str, str]) -> Dict[str, Dict[str, float]]:
+    subprocess.run([sys.executable, '-m', 'pets.commands.migrate'], cwd=ROOT, env=env, check=True, capture_output=True)
+    samples: List[Dict[str, float]] = [run_worker(env) for _ in range(runs)]
+    return {
+        key: {
+            'median': statistics.median(sample[key] for sample in samples),
+            'max': max(sample[key] for sample in samples),
+        }
+        for key in samples[0]
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--database-url', help='defaults to a temporary SQLite file')
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    env['DATABASE_URL'] = args.database_url or f'sqlite:///{tempfile.mkdtemp()}/startup.db'
+    env.setdefault('SQLALCHEMY_SILENCE_UBER_WARNING', '1')
+
+    print(json.dumps({'runs': args.runs, **main(args.runs, env)}, indent=2))
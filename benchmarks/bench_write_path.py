@@ -0,0 +1,113 @@
+'''
+Cost of the update and delete paths of the services.
+
+Compares the former read-then-write versions (transaction, SELECT or exists(),
+then the write) with the single-statement ones now in `PetServiceDB` and
+`UserServiceDB`. The user delete checks `deleting` and the pet count (up to
+USER_DELETE_BATCH_SIZE + 1) inside its two DELETEs, the seeded users all take
+that path. Reports the SQL statements and microseconds per operation.
+Runs on a throw-away SQLite database by default, pass --database-url for Postgres:
+
+    python -m benchmarks.bench_write_path --operations 2000
+'''
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+from typing import Awaitable, Callable, Dict, List, Tuple
+
+
+async def measure(run: Callable[[int], Awaitable[None]], ids: List[int]) -> Dict[str, float]:
+    from pets.metrics import Timings, _timings
+
+    timings = Timings()
+    token = _timings.set(timings)
+    try:
+        start = time.perf_counter()
+        for id in ids:
+            await run(id)
+        elapsed = time.perf_counter() - start
+    finally:
+        _timings.reset(token)
+    return {'queries_per_op': timings.queries / len(ids), 'us_per_op': elapsed / len(ids) * 1e6}
+
+
+async def main(operations: int) -> Dict[str, Dict[str, float]]:
+    from config import DATABASE_URL, database
+    from pets.db import insert_many
+    from pets.migrations import drop_all, migrate, sync_engine
+    from pets.models import User, Pet
+    from pets.dtos.pet_dtos import OwnerDto, PetUpdateRequestDto
+    from pets.services.pet_service import PetServiceDB
+    from pets.services.user_service import UserServiceDB
+
+    engine = sync_engine(DATABASE_URL)
+    drop_all(engine)
+    migrate(engine)
+    pet_service, user_service = PetServiceDB(), UserServiceDB()
+
+    async def seed() -> Tuple[List[int], List[int]]:
+        user_ids = await insert_many(
+            User.ormar_config.table,
+            [{'name': f'User {i}', 'email': f'user{i}-{time.perf_counter_ns()}@bench.test'} for i in range(operations)]
+        )
+        pet_ids = await insert_many(
+            Pet.ormar_config.table,
+            [{'name': f'Pet {i}', 'breed': 'Mutt', 'age': 1, 'owner_id': user_id} for i, user_id in enumerate(user_ids)]
+        )
+        return user_ids, pet_ids
+
+    async def update_before(id: int) -> None:
+        async with database.transaction():
+            pet = await Pet.objects.filter(id=id).first_or_none()
+            await pet.update(name=f'Pet {id}', breed='Beagle', age=2)
+
+    async def update_after(id: int) -> None:
+        pet = PetUpdateRequestDto.model_construct(
+            name=f'Pet {id}', breed='Beagle', age=2, owner=OwnerDto(id=owner_id)
+        )
+        await pet_service.update(id, pet)
+
+    async def delete_pet_before(id: int) -> None:
+        async with database.transaction():
+            await Pet.objects.filter(id=id).exists()
+            await Pet.objects.delete(id=id)
+
+    async def delete_user_before(id: int) -> None:
+        async with database.transaction():
+            await User.objects.filter(id=id).exists()
+            await Pet.objects.filter(owner=id).values_list('id', flatten=True)
+            await Pet.objects.delete(owner=id)
+            await User.objects.delete(id=id)
+
+    async with database:
+        result: Dict[str, Dict[str, float]] = {}
+        user_ids, pet_ids = await seed()
+        owner_id = user_ids[0]
+        result['update_pet_before'] = await measure(update_before, pet_ids)
+        result['update_pet_after'] = await measure(update_after, pet_ids)
+        result['delete_pet_before'] = await measure(delete_pet_before, pet_ids)
+        user_ids, pet_ids = await seed()
+        result['delete_pet_after'] = await measure(pet_service.delete, pet_ids)
+        user_ids, pet_ids = await seed()
+        result['delete_user_before'] = await measure(delete_user_before, user_ids)
+        user_ids, pet_ids = await seed()
+        result['delete_user_after'] = await measure(user_service.delete, user_ids)
+        return result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--operations', type=int, default=2000)
+    parser.add_argument('--database-url', help='defaults to a temporary SQLite file')
+    args = parser.parse_args()
+
+    os.environ['DATABASE_URL'] = args.database_url or f'sqlite:///{tempfile.mkdtemp()}/bench.db'
+    os.environ.setdefault('SQLALCHEMY_SILENCE_UBER_WARNING', '1')
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    result = asyncio.run(main(args.operations))
+    print(json.dumps(result, indent=2))
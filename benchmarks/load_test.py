@@ -0,0 +1,257 @@
+'''
+Load test for every route of PetController and UserController.
+
+Seeds a database with a reproducible data set and fires requests at a configurable
+concurrency, either in process through the ASGI app or against a running server
+with --url. Prints (or writes with --output) p50/p95/p99 latency, throughput and
+peak RSS as JSON. With --baseline the run fails when a route got slower or lost
+throughput beyond --tolerance:
+
+    python -m benchmarks.load_test --users 200 --pets 5000 --requests 500 --concurrency 32
+    python -m benchmarks.load_test --output base.json
+    python -m benchmarks.load_test --baseline base.json --tolerance 0.2
+
+The default database is a throw-away SQLite file, pass --database-url to run on
+Postgres (or anything asyncpg speaks to). SQLite takes one writer at a time, so on
+SQLite the write routes run with a concurrency of 1.
+'''
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import resource
+import tempfile
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+
+BREEDS: List[str] = ['Mixed Breed', 'Labrador Retriever', 'German Shepherd', 'Golden Retriever', 'Bulldog', 'Beagle']
+ANIMALS: List[str] = ['dog', 'cat', 'bird', 'fish', 'reptile', 'rabbit', 'hamster']
+
+Request = Callable[[httpx.AsyncClient, int], Awaitable[httpx.Response]]
+WRITE_METHODS: Tuple[str, ...] = ('POST', 'PUT', 'DELETE')
+
+
+def percentile(samples: List[float], percent: float) -> float:
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(percent / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in KiB on Linux and in bytes on macOS.
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024
+
+
+class DataSet:
+    def __init__(self, users: int, pets: int, seed: int):
+        self.random = random.Random(seed)
+        self.users: List[Dict[str, Any]] = [
+            {'name': f'User {i}', 'email': f'user{i}@load.test'} for i in range(users)
+        ]
+        self.pets: List[Dict[str, Any]] = [
+            {
+                'name': f'Pet {i}',
+                'breed': self.random.choice(BREEDS),
+                'age': self.random.randint(0, 20),
+                'owner_id': self.random.randint(1, users)
+            }
+            for i in range(pets)
+        ]
+
+    async def seed(self) -> None:
+        from config import DATABASE_URL
+        from pets.db import insert_many
+        from pets.migrations import drop_all, migrate, sync_engine
+        from pets.models import User, Pet
+
+        engine = sync_engine(DATABASE_URL)
+        drop_all(engine)
+        migrate(engine)
+        await insert_many(User.ormar_config.table, self.users)
+        await insert_many(Pet.ormar_config.table, self.pets)
+
+    def pet_body(self, owner_id: Optional[int] = None) -> Dict[str, Any]:
+        return {
+            'name': f'Load {self.random.randint(0, 1_000_000)}',
+            'breed': self.random.choice(BREEDS),
+            'age': self.random.randint(0, 20),
+            'owner': {'id': owner_id or self.random.randint(1, len(self.users))}
+        }
+
+
+async def run_route(
+        client: httpx.AsyncClient,
+        request: Request,
+        total: int,
+        concurrency: int
+        ) -> Dict[str, Any]:
+    latencies: List[float] = []
+    errors: int = 0
+    counter = iter(range(total))
+
+    async def worker() -> None:
+        nonlocal errors
+        for i in counter:
+            start = time.perf_counter()
+            response = await request(client, i)
+            latencies.append(time.perf_counter() - start)
+            if response.status_code >= 400:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - start
+
+    return {
+        'requests': total,
+        'concurrency': concurrency,
+        'errors': errors,
+        'throughput_rps': total / elapsed,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p95_ms': percentile(latencies, 95) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+    }
+
+
+def routes(data: DataSet) -> List[Tuple[str, Request]]:
+    pets = len(data.pets)
+    users = len(data.users)
+    created_pets: List[int] = []
+    # (id, email), PUT sends the email back unchanged so concurrent updates never collide on it.
+    created_users: List[Tuple[int, str]] = []
+
+    async def create_pet(client: httpx.AsyncClient, i: int) -> httpx.Response:
+        response = await client.post('/pet/pet', json=data.pet_body())
+        if response.status_code == 200:
+            created_pets.append(response.json()['id'])
+        return response
+
+    async def create_user(client: httpx.AsyncClient, i: int) -> httpx.Response:
+        email = f'new{i}@load.test'
+        response = await client.post('/user/user', json={'name': f'New {i}', 'email': email})
+        if response.status_code == 200:
+            created_users.append((response.json()['id'], email))
+        return response
+
+    def update_user(client: httpx.AsyncClient, i: int) -> Awaitable[httpx.Response]:
+        id, email = created_users[i % len(created_users)]
+        return client.put(f'/user/user/{id}', json={'id': id, 'name': f'Updated {i}', 'email': email})
+
+    # Writes only touch rows created during the run, so the seeded data set stays the same for reads.
+    return [
+        ('GET /pet/pet', lambda client, i: client.get('/pet/pet', params={'limit': 50})),
+        ('GET /pet/pet/{id}', lambda client, i: client.get(f'/pet/pet/{i % pets + 1}')),
+        ('GET /pet/breeds/{animal}', lambda client, i: client.get(f'/pet/breeds/{ANIMALS[i % len(ANIMALS)]}')),
+        ('POST /pet/pet', create_pet),
+        ('PUT /pet/pet/{id}', lambda client, i: client.put(
+            f'/pet/pet/{created_pets[i % len(created_pets)]}', json=data.pet_body()
+        )),
+        ('DELETE /pet/pet/{id}', lambda client, i: client.delete(f'/pet/pet/{created_pets[i]}')),
+        ('GET /user/user', lambda client, i: client.get('/user/user', params={'limit': 50})),
+        ('GET /user/user/{id}', lambda client, i: client.get(f'/user/user/{i % users + 1}')),
+        ('POST /user/user', create_user),
+        ('PUT /user/user/{id}', update_user),
+        ('DELETE /user/user/{id}', lambda client, i: client.delete(f'/user/user/{created_users[i][0]}')),
+    ]
+
+
+def compare(result: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    regressions: List[str] = []
+    for route, current in result['routes'].items():
+        previous = baseline.get('routes', {}).get(route)
+        if previous is None:
+            continue
+        if current['p95_ms'] > previous['p95_ms'] * (1 + tolerance):
+            regressions.append(f"{route}: p95 {previous['p95_ms']:.2f}ms -> {current['p95_ms']:.2f}ms")
+        if current['throughput_rps'] < previous['throughput_rps'] * (1 - tolerance):
+            regressions.append(
+                f"{route}: throughput {previous['throughput_rps']:.0f} -> {current['throughput_rps']:.0f} rps"
+            )
+    return regressions
+
+
+async def main(args: argparse.Namespace) -> Dict[str, Any]:
+    from config import database
+
+    data = DataSet(args.users, args.pets, args.seed)
+
+    async with database:
+        # `databases` keeps the connection in a context variable, seeding in the main task would
+        # hand that one connection (and its transaction stack) to every worker task.
+        await asyncio.create_task(data.seed())
+
+        if args.url:
+            client = httpx.AsyncClient(base_url=args.url, timeout=args.timeout)
+        else:
+            from main import app
+            client = httpx.AsyncClient(
+                transport=httpx.ASGITransport(app=app, raise_app_exceptions=False),
+                base_url='http://load.test',
+                timeout=args.timeout
+            )
+
+        result: Dict[str, Any] = {
+            'config': {
+                'users': args.users,
+                'pets': args.pets,
+                'requests': args.requests,
+                'concurrency': args.concurrency,
+                'seed': args.seed,
+                'target': args.url or 'asgi',
+            },
+            'routes': {}
+        }
+        single_writer = str(database.url).startswith('sqlite')
+        async with client:
+            for name, request in routes(data):
+                concurrency = 1 if single_writer and name.startswith(WRITE_METHODS) else args.concurrency
+                result['routes'][name] = await run_route(client, request, args.requests, concurrency)
+
+        result['peak_rss_mb'] = peak_rss_mb()
+        return result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--pets', type=int, default=1000)
+    parser.add_argument('--requests', type=int, default=200, help='requests per route')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--timeout', type=float, default=30.0)
+    parser.add_argument('--url', help='base url of a running server, the app runs in process when omitted')
+    parser.add_argument('--database-url', help='defaults to a temporary SQLite file')
+    parser.add_argument('--output', help='write the JSON result to this file')
+    parser.add_argument('--baseline', help='JSON result of a previous run to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed relative regression')
+    args = parser.parse_args()
+
+    if args.database_url:
+        os.environ['DATABASE_URL'] = args.database_url
+    else:
+        os.environ['DATABASE_URL'] = f'sqlite:///{tempfile.mkdtemp()}/load.db'
+    os.environ.setdefault('SQLALCHEMY_SILENCE_UBER_WARNING', '1')
+    # All requests come from one client, the per client rate limits would only measure 429s.
+    os.environ.setdefault('RATE_LIMIT_PER_SECOND', '0')
+    os.environ.setdefault('LIST_RATE_LIMIT_PER_SECOND', '0')
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    result = asyncio.run(main(args))
+    output = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, 'w') as file:
+            file.write(output)
+    print(output)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare(result, json.load(file), args.tolerance)
+        for regression in regressions:
+            print(f'REGRESSION {regression}', file=sys.stderr)
+        sys.exit(1 if regressions else 0)
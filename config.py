@@ -3,33 +3,152 @@ import contextlib
 
 import sqlalchemy
 from ormar import OrmarConfig
-from sqlalchemy.engine import Engine
 from databases import Database
 
 from cafeto import App
-from cafeto.staticfiles import StaticFiles
+
+from pets.admission import AdmissionControl, AdmissionMiddleware, RateLimit, RouteGroup
+from pets.compression import CompressionMiddleware, PrecompressedStaticFiles
+from pets.errors import PoolExhausted
+from pets.metrics import instrument
+from pets.pool import PooledDatabase, PoolLimiter, pool_exhausted_handler
+from pets.replicas import ReadYourWritesMiddleware, ReplicaSet, RoutedDatabase
 
 DATABASE_URL = os.getenv("DATABASE_URL")
+DATABASE_READ_URLS = [url.strip() for url in os.getenv("DATABASE_READ_URLS", "").split(",") if url.strip()]
+DATABASE_READ_STRATEGY = os.getenv("DATABASE_READ_STRATEGY", "round_robin")
+READ_YOUR_WRITES_SECONDS = float(os.getenv("READ_YOUR_WRITES_SECONDS", "5"))
+
+CACHE_MAX_SIZE = int(os.getenv("CACHE_MAX_SIZE", "10000"))
+CACHE_TTL = float(os.getenv("CACHE_TTL", "60"))
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS")) if os.getenv("SLOW_QUERY_MS") else None
+
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "1"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+DB_POOL_ACQUIRE_TIMEOUT = float(os.getenv("DB_POOL_ACQUIRE_TIMEOUT", "1"))
+DB_POOL_MAX_LIFETIME = float(os.getenv("DB_POOL_MAX_LIFETIME", "1800"))
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "100"))
+
+HOST = os.getenv("HOST", "0.0.0.0")
+PORT = int(os.getenv("PORT", "8000"))
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY")) if os.getenv("WEB_CONCURRENCY") else None
+GRACEFUL_SHUTDOWN_SECONDS = int(os.getenv("GRACEFUL_SHUTDOWN_SECONDS", "25"))
+
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+# auto, orjson or pydantic, see pets.encoders.
+JSON_ENCODER = os.getenv("JSON_ENCODER", "auto")
+
+# Users with more pets are deleted by a background job, in batches of this size.
+USER_DELETE_BATCH_SIZE = int(os.getenv("USER_DELETE_BATCH_SIZE", "1000"))
+DELETION_JOB_LEASE_SECONDS = float(os.getenv("DELETION_JOB_LEASE_SECONDS", "60"))
+
+# Per client (API key or IP) and worker, 0 disables a limit.
+RATE_LIMIT_PER_SECOND = float(os.getenv("RATE_LIMIT_PER_SECOND", "100"))
+RATE_LIMIT_BURST = int(os.getenv("RATE_LIMIT_BURST", "200"))
+LIST_RATE_LIMIT_PER_SECOND = float(os.getenv("LIST_RATE_LIMIT_PER_SECOND", "20"))
+LIST_RATE_LIMIT_BURST = int(os.getenv("LIST_RATE_LIMIT_BURST", "40"))
+API_KEY_HEADER = os.getenv("API_KEY_HEADER", "X-API-Key")
+# Comma separated, a request with another key is limited by its IP.
+API_KEYS = [key for key in os.getenv("API_KEYS", "").split(",") if key]
+# Per worker, requests over the caps wait in a bounded queue.
+MAX_CONCURRENT_REQUESTS = int(os.getenv("MAX_CONCURRENT_REQUESTS", "200"))
+MAX_CONCURRENT_LISTS = int(os.getenv("MAX_CONCURRENT_LISTS", "20"))
+ADMISSION_QUEUE_SIZE = int(os.getenv("ADMISSION_QUEUE_SIZE", "100"))
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "1"))
 
-engine: Engine = sqlalchemy.create_engine(DATABASE_URL)
+# SQLite opens a connection per checkout, the pool options only apply to servers.
+def database_options(url: str) -> dict:
+    if url.startswith("sqlite"):
+        return {}
+    return {
+        "min_size": DB_POOL_MIN_SIZE,
+        "max_size": DB_POOL_MAX_SIZE,
+        "max_inactive_connection_lifetime": DB_POOL_MAX_LIFETIME,
+        "statement_cache_size": DB_STATEMENT_CACHE_SIZE,
+    }
 
-database: Database = Database(DATABASE_URL)
+replicas: ReplicaSet = ReplicaSet(
+    [
+        PooledDatabase(
+            url,
+            limiter=PoolLimiter(DB_POOL_MAX_SIZE, DB_POOL_ACQUIRE_TIMEOUT),
+            slow_query_ms=SLOW_QUERY_MS,
+            **database_options(url)
+        )
+        for url in DATABASE_READ_URLS
+    ],
+    strategy=DATABASE_READ_STRATEGY,
+    pin_seconds=READ_YOUR_WRITES_SECONDS
+)
+
+database: Database = RoutedDatabase(
+    DATABASE_URL,
+    replicas=replicas,
+    limiter=PoolLimiter(DB_POOL_MAX_SIZE, DB_POOL_ACQUIRE_TIMEOUT),
+    slow_query_ms=SLOW_QUERY_MS,
+    **database_options(DATABASE_URL)
+)
 
+# No engine: the schema is managed by `python -m pets.commands.migrate`, importing the
+# app never opens a synchronous connection.
 base_ormar_config: OrmarConfig = OrmarConfig(
     metadata=sqlalchemy.MetaData(),
-    database=database,
-    engine=engine
+    database=database
 )
 
 @contextlib.asynccontextmanager
 async def lifespan(app):  # pragma: no cover
+    from pets.jobs import deletion_jobs
+    from pets.breeds import breeds_catalog
+
+    # Everything is loaded before the worker accepts its first request.
+    breeds_catalog.load()
     await database.connect()
-    yield
-    await database.disconnect()
-    
+    try:
+        await database.warm_up()
+        openapi = getattr(app.state, "openapi", None)
+        if openapi is not None:
+            openapi.render()
+        await deletion_jobs.start()
+        try:
+            yield
+        finally:
+            await deletion_jobs.stop()
+    finally:
+        await database.disconnect()
+
 
 app: App = App(
     lifespan=lifespan
 )
 
-app.mount("/static", StaticFiles(directory="static"), name="static")
+instrument(app)
+app.add_exception_handler(PoolExhausted, pool_exhausted_handler)
+app.add_middleware(ReadYourWritesMiddleware, database=database)
+app.add_middleware(CompressionMiddleware, minimum_size=COMPRESSION_MIN_SIZE)
+
+admission: AdmissionControl = AdmissionControl(
+    [
+        # Scraped by monitoring, never shed.
+        RouteGroup("metrics", r"^/metrics"),
+        # Full pages and exports, the expensive reads.
+        RouteGroup(
+            "lists",
+            r"^/(pet/pet|user/user|pet/search)$",
+            methods=("GET",),
+            rate_limit=RateLimit(LIST_RATE_LIMIT_PER_SECOND, LIST_RATE_LIMIT_BURST),
+            max_concurrency=MAX_CONCURRENT_LISTS
+        ),
+        RouteGroup("default", r"", rate_limit=RateLimit(RATE_LIMIT_PER_SECOND, RATE_LIMIT_BURST)),
+    ],
+    max_concurrency=MAX_CONCURRENT_REQUESTS,
+    max_waiting=ADMISSION_QUEUE_SIZE,
+    queue_timeout=ADMISSION_QUEUE_TIMEOUT,
+    api_key_header=API_KEY_HEADER,
+    api_keys=API_KEYS
+)
+# Outermost, a shed request costs nothing else.
+app.add_middleware(AdmissionMiddleware, admission=admission)
+
+app.mount("/static", PrecompressedStaticFiles(directory="static"), name="static")
@@ -1,4 +1,5 @@
 import os
+import asyncio
 import pytest
 from cafeto.testclient import TestClient
 
@@ -10,16 +11,20 @@ def setup_app():
     os.environ['DATABASE_URL'] = 'sqlite:///test.db'
     os.environ['SQLALCHEMY_SILENCE_UBER_WARNING'] = '1'
 
-    from main import app, base_ormar_config, engine
+    from main import app
+    from pets.cache import cache
+    from pets.migrations import drop_all, migrate, sync_engine
 
     client = TestClient(app)
+    asyncio.run(cache.clear())
 
-    base_ormar_config.metadata.drop_all(engine)
-    base_ormar_config.metadata.create_all(engine)
+    engine = sync_engine(os.environ['DATABASE_URL'])
+    drop_all(engine)
+    migrate(engine)
 
     yield client
 
-    base_ormar_config.metadata.drop_all(engine)
+    drop_all(engine)
     if DATABASE_URL:
         os.environ['DATABASE_URL'] = DATABASE_URL
     
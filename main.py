@@ -1,10 +1,8 @@
-from config import app, base_ormar_config, engine
+from config import app
 
 from pets.controllers import *
+from pets.openapi import use_schema, use_swagger
 
 
-base_ormar_config.metadata.create_all(engine)
-
 app.map_controllers()
-app.use_schema()
-app.use_swagger()
+use_swagger(app, use_schema(app))
@@ -0,0 +1,233 @@
+'''
+Admission control in front of the controllers: per client rate limits and
+caps on the requests in flight, so one noisy client or an expensive route
+sheds load with a quick 429/503 and a `Retry-After` instead of queueing
+everybody behind it.
+
+A request belongs to the first `RouteGroup` matching its method and path.
+The group can rate limit every client (token bucket per known API key,
+else per IP) and cap its own requests in flight; all groups with a limit share the
+global cap, a group without any (such as the metrics scraped by monitoring)
+is never shed. A request over a cap waits in a bounded queue for up to
+`queue_timeout`.
+
+All state is in memory, every worker process enforces the limits on its own.
+'''
+import re
+import math
+import time
+import asyncio
+from collections import OrderedDict
+from typing import Collection, Dict, FrozenSet, List, NamedTuple, Optional, Pattern, Sequence, Tuple
+
+from starlette.responses import JSONResponse
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from cafeto.errors import Error, format_errors
+
+from pets.errors import Overloaded, RateLimited
+from pets.metrics import metrics
+
+
+class RateLimit(NamedTuple):
+    rate: float  # requests per second
+    burst: int
+
+
+class RouteGroup(NamedTuple):
+    name: str
+    path: str  # regular expression, searched in the path
+    methods: Tuple[str, ...] = ()  # any method when empty
+    rate_limit: Optional[RateLimit] = None
+    max_concurrency: Optional[int] = None
+
+
+class TokenBucket:
+    def __init__(self, limit: RateLimit, now: float):
+        self.limit: RateLimit = limit
+        self.tokens: float = limit.burst
+        self.updated: float = now
+
+    def take(self, now: float) -> float:
+        '''
+        Takes a token, returns 0 when there was one, else the seconds until there is.
+        '''
+        self.tokens = min(self.limit.burst, self.tokens + (now - self.updated) * self.limit.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.limit.rate
+
+
+class ConcurrencyLimiter:
+    '''
+    Caps the requests in flight. Over the cap a request waits for a slot, at
+    most `max_waiting` of them for at most `timeout`, else `Overloaded`.
+    '''
+    def __init__(self, max_concurrency: int, max_waiting: int, timeout: float):
+        self.max_concurrency: int = max_concurrency
+        self.max_waiting: int = max_waiting
+        self.timeout: float = timeout
+        self.in_flight: int = 0
+        self.waiting: int = 0
+        self._semaphore: asyncio.Semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def acquire(self) -> None:
+        if not self._semaphore.locked():
+            await self._semaphore.acquire()
+        elif self.waiting >= self.max_waiting:
+            raise Overloaded()
+        else:
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), self.timeout)
+            except asyncio.TimeoutError:
+                raise Overloaded()
+            finally:
+                self.waiting -= 1
+        self.in_flight += 1
+
+    def release(self) -> None:
+        self.in_flight -= 1
+        self._semaphore.release()
+
+
+class AdmissionControl:
+    def __init__(
+            self,
+            groups: Sequence[RouteGroup],
+            max_concurrency: Optional[int] = None,
+            max_waiting: int = 100,
+            queue_timeout: float = 1.0,
+            api_key_header: str = 'X-API-Key',
+            api_keys: Collection[str] = (),
+            max_clients: int = 10000
+            ):
+        for group in groups:
+            # With no burst the bucket never holds a whole token, every request would be limited.
+            if group.rate_limit is not None and group.rate_limit.rate > 0 and group.rate_limit.burst < 1:
+                raise ValueError(f'Rate limit of {group.name} needs a burst of at least 1')
+        self.groups: List[RouteGroup] = list(groups)
+        self.api_key_header: str = api_key_header.lower()
+        # Only the keys handed out get a bucket of their own. Anybody can send any key,
+        # a new one per request would otherwise get a full bucket every time.
+        self.api_keys: FrozenSet[str] = frozenset(api_keys)
+        # Least recently seen clients are forgotten first, a forgotten client starts with a full bucket.
+        self.max_clients: int = max_clients
+        self._patterns: List[Pattern] = [re.compile(group.path) for group in self.groups]
+        self._buckets: 'OrderedDict[Tuple[str, str], TokenBucket]' = OrderedDict()
+        self._global: Optional[ConcurrencyLimiter] = (
+            ConcurrencyLimiter(max_concurrency, max_waiting, queue_timeout) if max_concurrency else None
+        )
+        self._limiters: Dict[str, ConcurrencyLimiter] = {
+            group.name: ConcurrencyLimiter(group.max_concurrency, max_waiting, queue_timeout)
+            for group in self.groups if group.max_concurrency
+        }
+
+    def group(self, method: str, path: str) -> Optional[RouteGroup]:
+        for group, pattern in zip(self.groups, self._patterns):
+            if (not group.methods or method in group.methods) and pattern.search(path):
+                return group
+        return None
+
+    def client_key(self, scope: Scope) -> str:
+        api_key = Headers(scope=scope).get(self.api_key_header)
+        if api_key and api_key in self.api_keys:
+            return f'key:{api_key}'
+        client = scope.get('client')
+        return f'ip:{client[0]}' if client else 'ip:unknown'
+
+    def check_rate(self, group: RouteGroup, client: str) -> None:
+        if group.rate_limit is None or group.rate_limit.rate <= 0:
+            return
+        now = time.monotonic()
+        key = (group.name, client)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(group.rate_limit, now)
+            if len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+        wait = bucket.take(now)
+        if wait:
+            raise RateLimited(wait)
+
+    async def acquire(self, group: RouteGroup) -> List[ConcurrencyLimiter]:
+        '''
+        The group's slot first, so requests queued on a busy group do not hold global slots.
+        A group without limits takes no slot at all.
+        '''
+        acquired: List[ConcurrencyLimiter] = []
+        if group.rate_limit is None and not group.max_concurrency:
+            return acquired
+        try:
+            for limiter in (self._limiters.get(group.name), self._global):
+                if limiter is not None:
+                    await limiter.acquire()
+                    acquired.append(limiter)
+        except BaseException:
+            self.release(acquired)
+            raise
+        return acquired
+
+    def release(self, acquired: List[ConcurrencyLimiter]) -> None:
+        for limiter in acquired:
+            limiter.release()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'in_flight': self._global.in_flight if self._global else 0,
+            'waiting': self._global.waiting if self._global else 0,
+            'clients': len(self._buckets),
+        }
+
+    def group_stats(self) -> Dict[str, Dict[str, int]]:
+        '''
+        Requests in flight and waiting per group with its own cap.
+        '''
+        return {
+            name: {'in_flight': limiter.in_flight, 'waiting': limiter.waiting}
+            for name, limiter in self._limiters.items()
+        }
+
+
+class AdmissionMiddleware:
+    def __init__(self, app: ASGIApp, admission: AdmissionControl):
+        self.app: ASGIApp = app
+        self.admission: AdmissionControl = admission
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        group = self.admission.group(scope['method'], scope['path'])
+        if group is None:
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            self.admission.check_rate(group, self.admission.client_key(scope))
+            acquired = await self.admission.acquire(group)
+        except RateLimited as e:
+            metrics.shed_requests.inc(labels=(group.name, 'rate_limited'))
+            response = JSONResponse(
+                format_errors([Error('rate-limited', e.msg)]),
+                status_code=429,
+                headers={'Retry-After': str(max(1, math.ceil(e.retry_after)))}
+            )
+            await response(scope, receive, send)
+            return
+        except Overloaded as e:
+            metrics.shed_requests.inc(labels=(group.name, 'overloaded'))
+            response = JSONResponse(format_errors([Error('overloaded', e.msg)]), status_code=503, headers={'Retry-After': '1'})
+            await response(scope, receive, send)
+            return
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.admission.release(acquired)
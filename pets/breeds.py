@@ -0,0 +1,68 @@
+import os
+import json
+import time
+from types import MappingProxyType
+from typing import Mapping, Optional, Tuple
+
+from pets.errors import BreedsFileNotFound
+
+
+BREEDS_FILE: str = os.path.join('static', 'breeds.json')
+
+
+class BreedsCatalog:
+    '''
+    Immutable in-memory index of the breeds file, keyed by animal.
+
+    The file is parsed once and swapped atomically when its mtime changes, the
+    mtime itself is checked at most once every `check_interval` seconds.
+    '''
+    def __init__(self, path: str = BREEDS_FILE, check_interval: float = 1.0):
+        self.path: str = path
+        self.check_interval: float = check_interval
+        self._index: Mapping[str, Tuple[str, ...]] = MappingProxyType({})
+        self._mtime: Optional[float] = None
+        self._checked_at: float = 0.0
+
+    @property
+    def loaded(self) -> bool:
+        return self._mtime is not None
+
+    def load(self) -> None:
+        try:
+            mtime = os.stat(self.path).st_mtime
+            with open(self.path, 'r', encoding='utf-8') as file:
+                breeds = json.load(file)
+        except FileNotFoundError:
+            raise BreedsFileNotFound()
+        except ValueError:
+            if self.loaded:
+                return
+            raise
+
+        self._index = MappingProxyType({animal: tuple(names) for animal, names in breeds.items()})
+        self._mtime = mtime
+        self._checked_at = time.monotonic()
+
+    def refresh(self) -> None:
+        now = time.monotonic()
+        if self.loaded and now - self._checked_at < self.check_interval:
+            return
+        self._checked_at = now
+
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except FileNotFoundError:
+            if self.loaded:
+                return
+            raise BreedsFileNotFound()
+
+        if mtime != self._mtime:
+            self.load()
+
+    def get(self, animal: str) -> Tuple[str, ...]:
+        self.refresh()
+        return self._index.get(animal, ())
+
+
+breeds_catalog: BreedsCatalog = BreedsCatalog()
@@ -0,0 +1,137 @@
+import time
+import functools
+from abc import ABC
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from config import CACHE_MAX_SIZE, CACHE_TTL
+from pets.singleflight import SingleFlight, single_flight
+
+
+MISSING = object()
+
+
+def cache_key(namespace: str, id: int) -> str:
+    return f'{namespace}:{id}'
+
+
+class ACacheBackend(ABC):
+    '''
+    Storage used by `Cache`. Values are response DTOs, a backend living out of
+    process (Redis, memcached) is expected to serialize them itself.
+    '''
+    async def get(self, key: str) -> Any: ...  # pragma: no cover
+
+    async def set(self, key: str, value: Any, ttl: float) -> None: ...  # pragma: no cover
+
+    async def delete(self, key: str) -> None: ...  # pragma: no cover
+
+    async def clear(self) -> None: ...  # pragma: no cover
+
+    def stats(self) -> Dict[str, int]:  # pragma: no cover
+        return {}
+
+
+class MemoryCacheBackend(ACacheBackend):
+    '''
+    Bounded LRU with per entry TTL, local to the worker process.
+    '''
+    def __init__(self, max_size: int = CACHE_MAX_SIZE):
+        self.max_size: int = max_size
+        self.evictions: int = 0
+        self._entries: OrderedDict[str, Tuple[float, Any]] = OrderedDict()
+
+    async def get(self, key: str) -> Any:
+        entry = self._entries.get(key)
+        if entry is None:
+            return MISSING
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return MISSING
+        self._entries.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value: Any, ttl: float) -> None:
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    async def delete(self, key: str) -> None:
+        self._entries.pop(key, None)
+
+    async def clear(self) -> None:
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {'size': len(self._entries), 'evictions': self.evictions}
+
+
+class Cache:
+    '''
+    Read-through cache in front of the service `retrieve` methods.
+
+    Every invalidation bumps a generation counter, a value loaded while an
+    invalidation happened is returned but not stored, so a slow read can not
+    put back a row that was updated or deleted in the meantime. Invalidations
+    also reach `flights`, the reads in flight are not shared any more.
+    '''
+    def __init__(self, backend: ACacheBackend, ttl: float = CACHE_TTL, flights: Optional[SingleFlight] = None):
+        self.backend: ACacheBackend = backend
+        self.ttl: float = ttl
+        self.flights: Optional[SingleFlight] = flights
+        self.hits: int = 0
+        self.misses: int = 0
+        self.invalidations: int = 0
+        self._generation: int = 0
+
+    async def get_or_load(self, key: str, loader: Callable[[], Awaitable[Any]]) -> Any:
+        value = await self.backend.get(key)
+        if value is not MISSING:
+            self.hits += 1
+            return value
+
+        self.misses += 1
+        generation = self._generation
+        value = await loader()
+        if generation == self._generation:
+            await self.backend.set(key, value, self.ttl)
+        return value
+
+    async def invalidate(self, *keys: str) -> None:
+        self._generation += 1
+        if self.flights is not None:
+            self.flights.invalidate()
+        self.invalidations += len(keys)
+        for key in keys:
+            await self.backend.delete(key)
+
+    async def clear(self) -> None:
+        self._generation += 1
+        if self.flights is not None:
+            self.flights.invalidate()
+        await self.backend.clear()
+
+    def cached(self, namespace: str) -> Callable:
+        '''
+        Caches a service method under `<namespace>:<first argument>`.
+        '''
+        def decorator(method: Callable[..., Awaitable[Any]]) -> Callable[..., Awaitable[Any]]:
+            @functools.wraps(method)
+            async def wrapper(service, id, *args, **kwargs):
+                return await self.get_or_load(cache_key(namespace, id), lambda: method(service, id, *args, **kwargs))
+            return wrapper
+        return decorator
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'invalidations': self.invalidations,
+            **self.backend.stats()
+        }
+
+
+cache: Cache = Cache(MemoryCacheBackend(), flights=single_flight)
@@ -0,0 +1,49 @@
+'''
+Writes compressed siblings (`.gz`, and `.br`/`.zst` when brotli/zstandard are
+installed) of the compressible files under static/, served by
+`PrecompressedStaticFiles` instead of compressing on every request. Run it at
+build time, a sibling older than its file is ignored:
+
+    python -m pets.commands.compress_static
+'''
+import os
+import sys
+import argparse
+import mimetypes
+
+from pets.compression import ENCODINGS, SUFFIXES, compress, compressible
+
+
+def compress_directory(directory: str, minimum_size: int) -> int:
+    written = 0
+    for root, _, files in os.walk(directory):
+        for name in files:
+            path = os.path.join(root, name)
+            if name.endswith(tuple(SUFFIXES.values())) or not compressible(mimetypes.guess_type(path)[0]):
+                continue
+            with open(path, 'rb') as file:
+                body = file.read()
+            if len(body) < minimum_size:
+                continue
+            for encoding in ENCODINGS:
+                compressed = compress(body, encoding)
+                if len(compressed) >= len(body):
+                    continue
+                with open(f'{path}{SUFFIXES[encoding]}', 'wb') as file:
+                    file.write(compressed)
+                written += 1
+    return written
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('directory', nargs='?', default='static')
+    parser.add_argument('--minimum-size', type=int, default=1024, help='bytes')
+    args = parser.parse_args()
+
+    print(f'Wrote {compress_directory(args.directory, args.minimum_size)} files')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
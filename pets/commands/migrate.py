@@ -0,0 +1,46 @@
+'''
+Brings the database schema up to date, run it once per deploy before the workers start:
+
+    python -m pets.commands.migrate
+    python -m pets.commands.migrate --list
+    python -m pets.commands.migrate --target 2
+'''
+import sys
+import argparse
+
+from sqlalchemy.exc import IntegrityError
+
+from config import DATABASE_URL
+from pets.migrations import applied, migrate, migrations, sync_engine
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--list', action='store_true', help='show the migrations and whether they are applied')
+    parser.add_argument('--target', type=int, help='stop after this version')
+    args = parser.parse_args()
+
+    engine = sync_engine(DATABASE_URL)
+    if args.list:
+        with engine.connect() as connection:
+            done = applied(connection)
+        for migration in migrations():
+            state = 'applied' if migration.version in done else 'pending'
+            print(f'{migration.version:04d} {migration.name} {state}')
+        return 0
+
+    try:
+        done = migrate(engine, args.target)
+    except IntegrityError as e:
+        print(f'Migration failed, remove the conflicting rows first: {e.orig}', file=sys.stderr)
+        return 1
+
+    for migration in done:
+        print(f'Applied {migration.version:04d} {migration.name}')
+    if not done:
+        print('The schema is up to date')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,42 @@
+'''
+Writes the OpenAPI schema of the controllers to pets/openapi.json, which the
+workers serve instead of generating it at startup. Run it after changing a
+controller or a DTO; --check fails when the file is out of date (CI):
+
+    python -m pets.commands.openapi
+    python -m pets.commands.openapi --check
+'''
+import sys
+import argparse
+
+from main import app
+from pets.openapi import SCHEMA_FILE, dump_schema, generate_schema
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--check', action='store_true', help='fail when the file differs from the controllers')
+    parser.add_argument('--output', default=SCHEMA_FILE)
+    args = parser.parse_args()
+
+    content = dump_schema(generate_schema(app))
+    if args.check:
+        try:
+            with open(args.output, 'r', encoding='utf-8') as file:
+                current = file.read()
+        except FileNotFoundError:
+            current = None
+        if current != content:
+            print(f'{args.output} is out of date, run python -m pets.commands.openapi', file=sys.stderr)
+            return 1
+        print(f'{args.output} is up to date')
+        return 0
+
+    with open(args.output, 'w', encoding='utf-8') as file:
+        file.write(content)
+    print(f'Wrote {args.output}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,33 @@
+'''
+Recomputes the aggregate tables behind `GET /pet/stats` from the pets, in one
+transaction. The triggers keep them up to date, run it when the counts drifted
+(a restore, rows edited with the triggers disabled):
+
+    python -m pets.commands.rebuild_stats
+'''
+import sys
+import argparse
+
+import sqlalchemy
+
+from config import DATABASE_URL
+from pets.migrations import sync_engine
+from pets.stats import rebuild
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.parse_args()
+
+    engine = sync_engine(DATABASE_URL)
+    with engine.begin() as connection:
+        rebuild(connection)
+        breeds, pets = connection.execute(
+            sqlalchemy.text('SELECT COUNT(*), COALESCE(SUM(pets), 0) FROM pet_stats_breeds')
+        ).one()
+    print(f'Counted {pets} pets of {breeds} breeds')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,64 @@
+'''
+Production entry point, `uvicorn main:app --reload` stays the development one:
+
+    python -m pets.commands.migrate && python -m pets.commands.serve
+    python -m pets.commands.serve --workers 4 --port 8080
+
+Runs WEB_CONCURRENCY worker processes, one per available CPU by default, with
+uvloop and httptools when they are installed. A worker only accepts requests
+once the lifespan warmed it up (database pool, breeds catalog, OpenAPI schema).
+On SIGTERM the workers stop accepting connections, give in-flight requests up to
+GRACEFUL_SHUTDOWN_SECONDS to finish and close the database in the lifespan.
+
+Every worker has its own connection pool, the database sees up to
+workers x DB_POOL_MAX_SIZE connections.
+'''
+import os
+import sys
+import argparse
+import importlib.util
+
+import uvicorn
+
+from config import GRACEFUL_SHUTDOWN_SECONDS, HOST, PORT, WEB_CONCURRENCY
+
+
+def available_cpus() -> int:
+    # The affinity mask honours cpusets (containers), cpu_count does not.
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def event_loop() -> str:
+    return 'uvloop' if importlib.util.find_spec('uvloop') else 'asyncio'
+
+
+def http_protocol() -> str:
+    return 'httptools' if importlib.util.find_spec('httptools') else 'h11'
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default=HOST)
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--workers', type=int, default=WEB_CONCURRENCY or available_cpus())
+    parser.add_argument('--graceful-shutdown', type=int, default=GRACEFUL_SHUTDOWN_SECONDS, help='seconds')
+    args = parser.parse_args()
+
+    uvicorn.run(
+        'main:app',
+        host=args.host,
+        port=args.port,
+        workers=max(1, args.workers),
+        loop=event_loop(),
+        http=http_protocol(),
+        lifespan='on',
+        timeout_graceful_shutdown=args.graceful_shutdown,
+        access_log=False
+    )
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
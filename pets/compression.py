@@ -0,0 +1,243 @@
+'''
+Content negotiation and compression for `Accept-Encoding`: gzip always, brotli
+and zstd when their modules are installed.
+
+`CompressionMiddleware` compresses responses on the fly, `PrecompressedStaticFiles`
+serves the `.br`/`.zst`/`.gz` siblings written ahead of time by
+`python -m pets.commands.compress_static`.
+'''
+import os
+import gzip
+import zlib
+import mimetypes
+from typing import Dict, Iterable, List, Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from pets.formats import APPLICATION_NDJSON
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
+
+
+BROTLI: str = 'br'
+ZSTD: str = 'zstd'
+GZIP: str = 'gzip'
+IDENTITY: str = 'identity'
+
+# Best first, brotli and zstd only when their modules are installed.
+ENCODINGS: tuple = (
+    ((BROTLI,) if brotli is not None else ())
+    + ((ZSTD,) if zstandard is not None else ())
+    + (GZIP,)
+)
+
+SUFFIXES: Dict[str, str] = {BROTLI: '.br', ZSTD: '.zst', GZIP: '.gz'}
+
+COMPRESSIBLE_TYPES: tuple = (
+    'text/',
+    'application/json',
+    APPLICATION_NDJSON.value,
+    'application/javascript',
+    'application/xml',
+    'application/yaml',
+    'image/svg+xml',
+)
+
+
+def accepted_encodings(accept_encoding: Optional[str]) -> Dict[str, float]:
+    '''
+    Parses `Accept-Encoding` into encoding -> q value.
+    '''
+    accepted: Dict[str, float] = {}
+    for item in (accept_encoding or '').split(','):
+        name, _, params = item.strip().partition(';')
+        if not name:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name.strip().lower()] = q
+    return accepted
+
+
+def preferred(accept_encoding: Optional[str], available: Iterable[str] = ENCODINGS) -> List[str]:
+    '''
+    The encodings of `available` the client accepts, highest q first, ties in `available` order.
+    '''
+    accepted = accepted_encodings(accept_encoding)
+    wildcard = accepted.get('*', 0.0)
+    ranked = [(accepted.get(encoding, wildcard), index, encoding) for index, encoding in enumerate(available)]
+    return [encoding for q, _, encoding in sorted(ranked, key=lambda item: (-item[0], item[1])) if q > 0]
+
+
+def negotiate(accept_encoding: Optional[str], available: Iterable[str] = ENCODINGS) -> str:
+    '''
+    The best of `available` the client accepts, `identity` when none.
+    '''
+    encodings = preferred(accept_encoding, available)
+    return encodings[0] if encodings else IDENTITY
+
+
+def compress(body: bytes, encoding: str, fast: bool = False) -> bytes:
+    '''
+    `fast` trades a few percent of size for much less CPU, for bodies compressed
+    while serving rather than ahead of time.
+    '''
+    if encoding == GZIP:
+        return gzip.compress(body, 6 if fast else 9, mtime=0)
+    if encoding == BROTLI and brotli is not None:
+        return brotli.compress(body, quality=5 if fast else 11)
+    if encoding == ZSTD and zstandard is not None:
+        return zstandard.ZstdCompressor(level=3 if fast else 19).compress(body)
+    raise ValueError(f'Unsupported encoding: {encoding}')
+
+
+class _BrotliStream:
+    def __init__(self, quality: int):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.finish()
+
+
+def compressor(encoding: str, fast: bool = True):
+    '''
+    An incremental compressor with `compress(chunk)` and `flush()`, the output of
+    a stream of chunks is never held in memory as a whole.
+    '''
+    if encoding == GZIP:
+        return zlib.compressobj(6 if fast else 9, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    if encoding == BROTLI and brotli is not None:
+        return _BrotliStream(5 if fast else 11)
+    if encoding == ZSTD and zstandard is not None:
+        return zstandard.ZstdCompressor(level=3 if fast else 19).compressobj()
+    raise ValueError(f'Unsupported encoding: {encoding}')
+
+
+def compressible(content_type: Optional[str]) -> bool:
+    return bool(content_type) and content_type.lower().startswith(COMPRESSIBLE_TYPES)
+
+
+class CompressionMiddleware:
+    '''
+    Compresses responses with the best encoding the client accepts. Bodies under
+    `minimum_size`, already encoded or of binary types are sent as they are. A
+    response sent in one message is compressed in one go, a streamed one chunk
+    by chunk. Strong ETags become weak, the representation changed.
+    '''
+    def __init__(self, app: ASGIApp, minimum_size: int = 1024, encodings: Iterable[str] = ENCODINGS):
+        self.app: ASGIApp = app
+        self.minimum_size: int = minimum_size
+        self.encodings: tuple = tuple(encodings)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        encoding = negotiate(Headers(scope=scope).get('accept-encoding'), self.encodings)
+        start: Optional[Message] = None
+        stream = None
+
+        async def send_compressed(message: Message) -> None:
+            nonlocal start, stream
+
+            if message['type'] == 'http.response.start':
+                headers = Headers(raw=message['headers'])
+                if compressible(headers.get('content-type')):
+                    if 'accept-encoding' not in headers.get('vary', '').lower():
+                        MutableHeaders(scope=message).add_vary_header('Accept-Encoding')
+                    if (
+                        encoding != IDENTITY
+                        and 'content-encoding' not in headers
+                        and message['status'] not in (204, 304)
+                        and int(headers.get('content-length') or self.minimum_size) >= self.minimum_size
+                    ):
+                        # Held back until the first body message decides.
+                        start = message
+                        return
+                await send(message)
+                return
+
+            if message['type'] != 'http.response.body' or start is None:
+                await send(message)
+                return
+
+            body = message.get('body', b'')
+            more_body = message.get('more_body', False)
+            headers = MutableHeaders(scope=start)
+
+            if stream is None:
+                if not more_body and len(body) < self.minimum_size:
+                    await send(start)
+                    await send(message)
+                    start = None
+                    return
+
+                stream = compressor(encoding)
+                headers['Content-Encoding'] = encoding
+                etag = headers.get('etag')
+                if etag and not etag.startswith('W/'):
+                    headers['ETag'] = f'W/{etag}'
+                if not more_body:
+                    body = stream.compress(body) + stream.flush()
+                    headers['Content-Length'] = str(len(body))
+                    await send(start)
+                    await send({'type': 'http.response.body', 'body': body})
+                    return
+                del headers['Content-Length']
+                await send(start)
+
+            body = stream.compress(body)
+            if not more_body:
+                body += stream.flush()
+            if body or not more_body:
+                await send({'type': 'http.response.body', 'body': body, 'more_body': more_body})
+
+        await self.app(scope, receive, send_compressed)
+
+
+class PrecompressedStaticFiles(StaticFiles):
+    '''
+    Serves `name.br`, `name.zst` or `name.gz` in place of `name` when the client
+    accepts the encoding and the sibling is not older than the file.
+    '''
+    def file_response(self, full_path, stat_result: os.stat_result, scope: Scope, status_code: int = 200) -> Response:
+        request_headers = Headers(scope=scope)
+        if status_code == 200:
+            for encoding in preferred(request_headers.get('accept-encoding'), tuple(SUFFIXES)):
+                try:
+                    sibling = os.stat(f'{full_path}{SUFFIXES[encoding]}')
+                except OSError:
+                    continue
+                if sibling.st_mtime < stat_result.st_mtime:
+                    continue
+                response = FileResponse(
+                    f'{full_path}{SUFFIXES[encoding]}',
+                    stat_result=sibling,
+                    media_type=mimetypes.guess_type(str(full_path))[0] or 'text/plain',
+                    headers={'Content-Encoding': encoding, 'Vary': 'Accept-Encoding'}
+                )
+                if self.is_not_modified(response.headers, request_headers):
+                    return NotModifiedResponse(response.headers)
+                return response
+
+        return super().file_response(full_path, stat_result, scope, status_code)
@@ -1,2 +1,4 @@
 from .pet_controller import PetController
 from .user_controller import UserController
+from .cache_controller import CacheController
+from .metrics_controller import MetricsController
@@ -0,0 +1,23 @@
+from typing import Dict
+
+from cafeto.mvc import BaseController
+from cafeto.responses import Ok
+from cafeto.dtos import GenericResponseDto
+
+from config import app
+from pets.cache import cache
+
+
+@app.controller()
+class CacheController(BaseController):
+    @app.get('/stats')
+    async def stats(self) -> GenericResponseDto[Dict[str, int]]:
+        '''
+        summary: Cache statistics
+        description: Hit, miss, invalidation and eviction counters of the user and pet read cache
+        responses:
+            200:
+                description: Cache counters
+                default: true
+        '''
+        return Ok(GenericResponseDto(data=cache.stats()))
@@ -0,0 +1,33 @@
+from cafeto.mvc import BaseController
+from cafeto.responses import Ok, Format
+from cafeto.responses.formats import TEXT_PLAIN
+
+from config import admission, app, database
+from pets.cache import cache
+from pets.metrics import metrics, render_gauges, render_stats
+from pets.singleflight import single_flight
+
+
+@app.controller('/metrics')
+class MetricsController(BaseController):
+    @app.get('')
+    async def index(self) -> Format[str, TEXT_PLAIN]:
+        '''
+        summary: Prometheus metrics
+        description: >
+            Request latency, SQL query, connection pool, cache, request coalescing and admission metrics
+            of this worker in the Prometheus text format
+        responses:
+            200:
+                description: Metrics
+                default: true
+        '''
+        lines = (
+            metrics.render()
+            + render_stats('pets_db_pool', database.limiter.stats(), gauges=('max_size', 'in_use', 'waiting'))
+            + render_stats('pets_cache', cache.stats())
+            + render_stats('pets_single_flight', single_flight.stats(), gauges=('in_flight',))
+            + render_stats('pets_admission', admission.stats(), gauges=('in_flight', 'waiting', 'clients'))
+            + render_gauges('pets_admission_group', 'group', admission.group_stats())
+        )
+        return Ok('\n'.join(lines) + '\n', format=TEXT_PLAIN)
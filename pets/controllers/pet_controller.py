@@ -1,32 +1,228 @@
 from typing import List
 
-import httpx
-
 from cafeto.mvc import BaseController
-from cafeto.responses import Ok, NoContent, NotFound
+from cafeto.responses import Ok, NoContent, NotFound, BadRequest
 from cafeto.errors import Error
 from cafeto.dtos import GenericResponseDto
 
 import pets.dtos as dtos
 
 from config import app
-from pets.errors import PetNotFound
+from pets.errors import (
+    PetNotFound, InvalidCursor, InvalidSort, InvalidFields, InvalidQuery, NotModified, VersionMismatch
+)
+from pets.etags import (
+    expected_version, not_modified, not_modified_response, page_etag, precondition_failed, version_etag,
+    with_validators
+)
+from pets.encoders import json_response
+from pets.formats import APPLICATION_NDJSON, wants_ndjson
 from pets.services import APetService
 from pets.services.breeds_service import ABreedsService
 
 
 @app.controller()
 class PetController(BaseController):
-    @app.get('/pet')
-    async def list(self, service: APetService) -> List[dtos.PetResponseDto]:
-        response = await service.list()
-        return Ok(response)
+    @app.get(
+        '/pet',
+        query=[
+            'limit', 'after', 'stream', 'expand', 'breed', 'age_min', 'age_max', 'owner_id', 'name_prefix',
+            'sort', 'fields'
+        ]
+    )
+    async def list(
+        self,
+        service: APetService,
+        limit: int = None,
+        after: str = None,
+        stream: str = None,
+        expand: str = None,
+        breed: str = None,
+        age_min: int = None,
+        age_max: int = None,
+        owner_id: int = None,
+        name_prefix: str = None,
+        sort: str = None,
+        fields: str = None
+    ) -> dtos.PetPageDto:
+        '''
+        summary: List pets
+        description: >
+            Keyset pagination ordered by id. `limit` defaults to 50 (max 500) and `after` takes the
+            `next_cursor` of the previous page; `next_cursor` is null on the last page.
+            With `stream=1` or `Accept: application/x-ndjson` the whole table is streamed
+            as NDJSON instead, one object per line.
+            `expand=owner` embeds the owner of every pet, joined in the same query.
+            `breed`, `age_min`, `age_max`, `owner_id` and `name_prefix` filter the pets, also when streaming.
+            `sort` takes one of id, name, breed or age, prefixed with `-` for descending order;
+            a cursor only continues the sort it was created with.
+            `fields=id,name` only returns the listed fields (id, name, breed, age, owner).
+            Pages carry a strong `ETag`, `If-None-Match` answers 304 without building the page.
+        responses:
+            200:
+                description: A page of pets
+                default: true
+            304:
+                description: The page did not change
+            400:
+                description: Invalid cursor, expand, sort or fields
+        '''
+        if expand not in (None, 'owner'):
+            return BadRequest([Error('invalid-expand', "Only 'owner' can be expanded", 'expand')])
+
+        filters = dtos.PetFilterDto(
+            breed=breed,
+            age_min=age_min,
+            age_max=age_max,
+            owner_id=owner_id,
+            name_prefix=name_prefix
+        )
+        if wants_ndjson(self.request, stream):
+            return Ok(service.stream(filters), format=APPLICATION_NDJSON)
+
+        try:
+            response = await service.list(
+                limit, after, with_owner=expand == 'owner', filters=filters, sort=sort, fields=fields,
+                if_none_match=self.request.headers.get('if-none-match')
+            )
+            return with_validators(json_response(response), response.etag)
+        except NotModified as e:
+            return not_modified_response(e.etag)
+        except InvalidCursor as e:
+            return BadRequest([Error('invalid-cursor', e.msg, 'after')])
+        except InvalidSort as e:
+            return BadRequest([Error('invalid-sort', e.msg, 'sort')])
+        except InvalidFields as e:
+            return BadRequest([Error('invalid-fields', e.msg, 'fields')])
     
-    @app.get('/pet/{id}')
-    async def retrieve(self, id: int, service: APetService) -> dtos.PetResponseDto:
+    @app.get('/search', query=['q', 'limit', 'after'])
+    async def search(self, service: APetService, q: str = None, limit: int = None, after: str = None) -> dtos.PetPageDto:
+        '''
+        summary: Search pets
+        description: >
+            Pets whose name or breed contains the words of `q`, also with typos, best matches
+            first and names starting with the first word before the rest. Words shorter than
+            3 characters are ignored. `limit` defaults to 50 (max 500), `after` takes the
+            `next_cursor` of the previous page, at most 1000 results are paged through.
+        responses:
+            200:
+                description: A page of matching pets
+                default: true
+            400:
+                description: Invalid query or cursor
+        '''
+        try:
+            response = await service.search(q, limit, after)
+            return json_response(response)
+        except InvalidQuery as e:
+            return BadRequest([Error('invalid-query', e.msg, 'q')])
+        except InvalidCursor as e:
+            return BadRequest([Error('invalid-cursor', e.msg, 'after')])
+
+    @app.get('/stats')
+    async def stats(self, service: APetService) -> dtos.PetStatsDto:
+        '''
+        summary: Pet statistics
+        description: >
+            Pets per breed (most first), an age histogram in buckets of 5 years and how many
+            owners have 1, 2, ... pets. Read from counters the database keeps up to date with
+            every write, the cost does not grow with the number of pets.
+        responses:
+            200:
+                description: Counts of the pets
+                default: true
+        '''
+        response = await service.stats()
+        return Ok(response)
+
+    @app.post('/pet/bulk')
+    async def bulk_create(
+        self,
+        pets_request: dtos.PetBulkCreateRequestDto,
+        service: APetService
+    ) -> dtos.BulkResponseDto[dtos.PetResponseDto]:
+        '''
+        summary: Create pets in bulk
+        description: >
+            Validates all items with one query per check and inserts the valid ones in a single
+            transaction. Each result carries either the created pet or the errors of that item.
+        responses:
+            200:
+                description: Per item results
+                default: true
+        '''
+        response = await service.bulk_create(pets_request)
+        return Ok(response)
+
+    @app.put('/pet/bulk')
+    async def bulk_update(
+        self,
+        pets_request: dtos.PetBulkUpdateRequestDto,
+        service: APetService
+    ) -> dtos.BulkResponseDto[dtos.PetResponseDto]:
+        '''
+        summary: Update pets in bulk
+        description: >
+            Validates all items with one query per check and updates the valid ones in a single
+            transaction. Each result carries either the updated pet or the errors of that item.
+        responses:
+            200:
+                description: Per item results
+                default: true
+        '''
+        response = await service.bulk_update(pets_request)
+        return Ok(response)
+
+    @app.delete('/pet/bulk')
+    async def bulk_delete(
+        self,
+        pets_request: dtos.BulkDeleteRequestDto,
+        service: APetService
+    ) -> dtos.BulkResponseDto[int]:
+        '''
+        summary: Delete pets in bulk
+        description: Deletes the existing ids in a single transaction, unknown ids are reported per item.
+        responses:
+            200:
+                description: Per item results
+                default: true
+        '''
+        response = await service.bulk_delete(pets_request)
+        return Ok(response)
+
+    @app.get('/pet/{id}', query=['expand'])
+    async def retrieve(self, id: int, service: APetService, expand: str = None) -> dtos.PetResponseDto:
+        '''
+        summary: Retrieve a pet
+        description: >
+            `expand=owner` embeds the owner of the pet.
+            Answers 304 when `If-None-Match` has the current `ETag`, or when `If-Modified-Since`
+            is not older than `Last-Modified`.
+        responses:
+            200:
+                description: The pet
+                default: true
+            304:
+                description: The pet did not change
+            400:
+                description: Invalid expand
+            404:
+                description: Pet not found
+        '''
+        if expand not in (None, 'owner'):
+            return BadRequest([Error('invalid-expand', "Only 'owner' can be expanded", 'expand')])
+
         try:
-            response = await service.retrieve(id)
-            return Ok(response)
+            if expand is not None:
+                response = await service.retrieve_with_owner(id)
+                etag = page_etag([(response.id, response.version), (response.owner.id, response.owner.version)], None)
+                last_modified = max(response.updated_at, response.owner.updated_at)
+            else:
+                response = await service.retrieve(id)
+                etag, last_modified = version_etag(response.version), response.updated_at
+            if not_modified(self.request, etag, last_modified):
+                return not_modified_response(etag, last_modified)
+            return with_validators(Ok(response), etag, last_modified)
         except PetNotFound as e:
             return NotFound([Error('pet-not-found', e.msg, '__model__')])
 
@@ -37,11 +233,28 @@ class PetController(BaseController):
 
     @app.put('/pet/{id}')
     async def update(self, id: int, pet_request: dtos.PetUpdateRequestDto, service: APetService) -> dtos.PetResponseDto:
+        '''
+        summary: Update a pet
+        description: >
+            With `If-Match` set to the `ETag` of the pet, the update only goes through while
+            nobody else changed the pet in between.
+        responses:
+            200:
+                description: The updated pet
+                default: true
+            404:
+                description: Pet not found
+            412:
+                description: The pet changed since the ETag in `If-Match`
+        '''
         try:
-            pet_response: dtos.UserResponseDto = await service.update(id, pet_request)
-            return Ok(pet_response)
+            version = expected_version(self.request.headers.get('if-match'))
+            pet_response: dtos.PetResponseDto = await service.update(id, pet_request, version)
+            return with_validators(Ok(pet_response), version_etag(pet_response.version), pet_response.updated_at)
         except PetNotFound as e:
             return NotFound([Error('pet-not-found', e.msg, '__model__')])
+        except VersionMismatch as e:
+            return precondition_failed(e)
 
     @app.delete('/pet/{id}')
     async def delete(self, id: int, service: APetService) -> None:
@@ -1,48 +1,257 @@
 from typing import List
 
 from cafeto.mvc import BaseController
-from cafeto.responses import Ok, NoContent, NotFound
-from cafeto.errors import Error
+from cafeto.responses import Ok, NoContent, NotFound, BadRequest, ModelResponse
+from cafeto.errors import Error, format_errors
 
 import pets.dtos as dtos
 
 from config import app
-from pets.errors import UserNotFound
+from pets.errors import (
+    UserNotFound, InvalidCursor, InvalidSort, InvalidFields, EmailExists, JobNotFound, NotModified, VersionMismatch
+)
+from pets.etags import (
+    expected_version, not_modified, not_modified_response, page_etag, precondition_failed, version_etag,
+    with_validators
+)
+from pets.encoders import json_response
+from pets.formats import APPLICATION_NDJSON, wants_ndjson
 from pets.services import AUserService
 
 
 @app.controller()
 class UserController(BaseController):
-    @app.get('/user')
-    async def list(self, service: AUserService) -> List[dtos.UserResponseDto]:
-        response = await service.list()
-        return Ok(response)
+    @app.get('/user', query=['limit', 'after', 'stream', 'expand', 'sort', 'fields'])
+    async def list(
+        self,
+        service: AUserService,
+        limit: int = None,
+        after: str = None,
+        stream: str = None,
+        expand: str = None,
+        sort: str = None,
+        fields: str = None
+    ) -> dtos.UserPageDto:
+        '''
+        summary: List users
+        description: >
+            Keyset pagination ordered by id. `limit` defaults to 50 (max 500) and `after` takes the
+            `next_cursor` of the previous page; `next_cursor` is null on the last page.
+            With `stream=1` or `Accept: application/x-ndjson` the whole table is streamed
+            as NDJSON instead, one object per line.
+            `expand=pets` embeds the pets of every user, loaded with one extra query for the whole page.
+            `sort` takes id or email, prefixed with `-` for descending order;
+            a cursor only continues the sort it was created with.
+            `fields=id,name` only returns the listed fields (id, name, email).
+            Pages carry a strong `ETag`, `If-None-Match` answers 304 without building the page.
+        responses:
+            200:
+                description: A page of users
+                default: true
+            304:
+                description: The page did not change
+            400:
+                description: Invalid cursor, expand, sort or fields
+        '''
+        if expand not in (None, 'pets'):
+            return BadRequest([Error('invalid-expand', "Only 'pets' can be expanded", 'expand')])
+
+        if wants_ndjson(self.request, stream):
+            return Ok(service.stream(), format=APPLICATION_NDJSON)
+
+        try:
+            response = await service.list(
+                limit, after, with_pets=expand == 'pets', sort=sort, fields=fields,
+                if_none_match=self.request.headers.get('if-none-match')
+            )
+            return with_validators(json_response(response), response.etag)
+        except NotModified as e:
+            return not_modified_response(e.etag)
+        except InvalidCursor as e:
+            return BadRequest([Error('invalid-cursor', e.msg, 'after')])
+        except InvalidSort as e:
+            return BadRequest([Error('invalid-sort', e.msg, 'sort')])
+        except InvalidFields as e:
+            return BadRequest([Error('invalid-fields', e.msg, 'fields')])
     
-    @app.get('/user/{id}')
-    async def retrieve(self, id: int, service: AUserService) -> dtos.UserResponseDto:
+    @app.post('/user/bulk')
+    async def bulk_create(
+        self,
+        users_request: dtos.UserBulkCreateRequestDto,
+        service: AUserService
+    ) -> dtos.BulkResponseDto[dtos.UserResponseDto]:
+        '''
+        summary: Create users in bulk
+        description: >
+            Validates all items with one query per check and inserts the valid ones in a single
+            transaction. Each result carries either the created user or the errors of that item.
+        responses:
+            200:
+                description: Per item results
+                default: true
+        '''
         try:
-            response = await service.retrieve(id)
+            response = await service.bulk_create(users_request)
             return Ok(response)
+        except EmailExists as e:
+            return BadRequest(format_errors([Error('email-exists', e.msg, 'email')]))
+
+    @app.put('/user/bulk')
+    async def bulk_update(
+        self,
+        users_request: dtos.UserBulkUpdateRequestDto,
+        service: AUserService
+    ) -> dtos.BulkResponseDto[dtos.UserResponseDto]:
+        '''
+        summary: Update users in bulk
+        description: >
+            Validates all items with one query per check and updates the valid ones in a single
+            transaction. Each result carries either the updated user or the errors of that item.
+        responses:
+            200:
+                description: Per item results
+                default: true
+        '''
+        try:
+            response = await service.bulk_update(users_request)
+            return Ok(response)
+        except EmailExists as e:
+            return BadRequest(format_errors([Error('email-exists', e.msg, 'email')]))
+
+    @app.delete('/user/bulk')
+    async def bulk_delete(
+        self,
+        users_request: dtos.BulkDeleteRequestDto,
+        service: AUserService
+    ) -> dtos.UserBulkDeleteResponseDto:
+        '''
+        summary: Delete users in bulk
+        description: >
+            Every user is deleted like with `DELETE /user/{id}`: users with few pets right away, in
+            transactions of a bounded number of pets, the others by a deletion job returned in `job`
+            of their result. Unknown ids are reported per item.
+        responses:
+            200:
+                description: Per item results
+                default: true
+        '''
+        response = await service.bulk_delete(users_request)
+        return Ok(response)
+
+    @app.get('/user/{id}', query=['expand'])
+    async def retrieve(self, id: int, service: AUserService, expand: str = None) -> dtos.UserResponseDto:
+        '''
+        summary: Retrieve a user
+        description: >
+            `expand=pets` embeds the pets of the user.
+            Answers 304 when `If-None-Match` has the current `ETag`, or when `If-Modified-Since`
+            is not older than `Last-Modified`.
+        responses:
+            200:
+                description: The user
+                default: true
+            304:
+                description: The user did not change
+            400:
+                description: Invalid expand
+            404:
+                description: User not found
+        '''
+        if expand not in (None, 'pets'):
+            return BadRequest([Error('invalid-expand', "Only 'pets' can be expanded", 'expand')])
+
+        try:
+            if expand is not None:
+                response = await service.retrieve_with_pets(id)
+                etag = page_etag([(response.id, response.version), *[(pet.id, pet.version) for pet in response.pets]], None)
+                last_modified = max([response.updated_at, *[pet.updated_at for pet in response.pets]])
+            else:
+                response = await service.retrieve(id)
+                etag, last_modified = version_etag(response.version), response.updated_at
+            if not_modified(self.request, etag, last_modified):
+                return not_modified_response(etag, last_modified)
+            return with_validators(Ok(response), etag, last_modified)
         except UserNotFound as e:
             return NotFound([Error('user-not-found', e.msg, '__model__')])
 
     @app.post('/user')
     async def create(self, user_request: dtos.UserCreateRequestDto, service: AUserService) -> dtos.UserResponseDto:
-        user_response: dtos.UserResponseDto = await service.create(user_request)
-        return Ok(user_response)
+        try:
+            user_response: dtos.UserResponseDto = await service.create(user_request)
+            return Ok(user_response)
+        except EmailExists as e:
+            return BadRequest(format_errors([Error('email-exists', e.msg, 'email')]))
 
     @app.put('/user/{id}')
     async def update(self, id: int, user_request: dtos.UserUpdateRequestDto, service: AUserService) -> dtos.UserResponseDto:
+        '''
+        summary: Update a user
+        description: >
+            With `If-Match` set to the `ETag` of the user, the update only goes through while
+            nobody else changed the user in between.
+        responses:
+            200:
+                description: The updated user
+                default: true
+            400:
+                description: Email already exists
+            404:
+                description: User not found
+            412:
+                description: The user changed since the ETag in `If-Match`
+        '''
         try:
-            user_response: dtos.UserResponseDto = await service.update(id, user_request)
-            return Ok(user_response)
+            version = expected_version(self.request.headers.get('if-match'))
+            user_response: dtos.UserResponseDto = await service.update(id, user_request, version)
+            return with_validators(Ok(user_response), version_etag(user_response.version), user_response.updated_at)
         except UserNotFound as e:
             return NotFound([Error('user-not-found', e.msg, '__model__')])
+        except EmailExists as e:
+            return BadRequest(format_errors([Error('email-exists', e.msg, 'email')]))
+        except VersionMismatch as e:
+            return precondition_failed(e)
 
     @app.delete('/user/{id}')
     async def delete(self, id: int, service: AUserService) -> None:
+        '''
+        summary: Delete a user and its pets
+        description: >
+            A user with many pets is deleted in the background, the answer is then 202 with the
+            deletion job, its progress at `/user/deletions/{job_id}` (`Location`). The user can not
+            get new pets meanwhile. Deleting a user already being deleted returns its job.
+        responses:
+            202:
+                description: Deletion job
+            204:
+                description: The user and its pets were deleted
+                default: true
+            404:
+                description: User not found
+        '''
         try:
-            await service.delete(id)
-            return NoContent()
+            job = await service.delete(id)
+            if job is None:
+                return NoContent()
+            return ModelResponse(job, status_code=202, headers={'Location': f'/user/deletions/{job.id}'})
         except UserNotFound as e:
             return NotFound([Error('user-not-found', e.msg, '__model__')])
+
+    @app.get('/deletions/{id}')
+    async def retrieve_deletion(self, id: int, service: AUserService) -> dtos.DeletionJobDto:
+        '''
+        summary: Progress of a user deletion
+        description: >
+            `status` is pending, running, done or failed (with `error`), `pets_deleted` counts
+            up to about `pets_total`.
+        responses:
+            200:
+                description: The deletion job
+                default: true
+            404:
+                description: Job not found
+        '''
+        try:
+            response = await service.retrieve_deletion(id)
+            return Ok(response)
+        except JobNotFound as e:
+            return NotFound([Error('job-not-found', e.msg, '__model__')])
@@ -0,0 +1,187 @@
+import sqlite3
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Type
+
+import sqlalchemy
+from ormar import Model, QuerySet
+from asyncpg.exceptions import UniqueViolationError
+
+from config import database
+
+
+BULK_CHUNK_SIZE: int = 500
+
+
+def utcnow() -> datetime:
+    '''
+    Naive UTC, what the `DateTime` columns store on both SQLite and Postgres.
+    '''
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def is_unique_violation(error: Exception) -> bool:
+    if isinstance(error, UniqueViolationError):
+        return True
+    return isinstance(error, sqlite3.IntegrityError) and 'UNIQUE' in str(error)
+
+
+def relation_prefix(model: Type[Model], relation: str) -> str:
+    '''
+    Prefix of the columns `select_related(relation)` adds to the raw rows of `model`.
+    '''
+    return model.ormar_config.alias_manager.resolve_relation_alias(model, relation)
+
+
+async def fetch_rows(queryset: QuerySet) -> List[Mapping[str, Any]]:
+    '''
+    Runs the queryset and returns the raw rows, skipping ormar model instantiation.
+    '''
+    return [row._mapping for row in await database.fetch_all(queryset.build_select_expression())]
+
+
+async def fetch_row(queryset: QuerySet) -> Optional[Mapping[str, Any]]:
+    row = await database.fetch_one(queryset.limit(1, limit_raw_sql=True).build_select_expression())
+    return row._mapping if row is not None else None
+
+
+async def insert_many(table: sqlalchemy.Table, rows: List[Dict[str, Any]]) -> List[int]:
+    '''
+    Multi-row INSERT ... RETURNING, one statement per BULK_CHUNK_SIZE rows.
+
+    Returns the generated primary keys in the order of `rows`: keys are handed
+    out in VALUES order within a single statement on both SQLite and Postgres.
+    '''
+    pk: str = table.primary_key.columns.keys()[0]
+    # The text INSERT skips the Python side column defaults (version, updated_at), they are
+    # passed explicitly as not every database got them as server defaults.
+    defaults: Dict[str, Any] = {
+        column.name: column.default.arg(None) if column.default.is_callable else column.default.arg
+        for column in table.columns
+        if column.default is not None and (column.default.is_scalar or column.default.is_callable)
+        and column.name not in rows[0]
+    }
+    columns: List[str] = [*rows[0], *defaults]
+    ids: List[int] = []
+
+    for start in range(0, len(rows), BULK_CHUNK_SIZE):
+        chunk = rows[start:start + BULK_CHUNK_SIZE]
+        values: List[str] = []
+        params: Dict[str, Any] = {}
+        for i, row in enumerate(chunk):
+            values.append('(' + ', '.join(f':{column}_{i}' for column in columns) + ')')
+            params.update({f'{column}_{i}': row[column] if column in row else defaults[column] for column in columns})
+
+        query = (
+            f'INSERT INTO {table.name} ({", ".join(columns)}) '
+            f'VALUES {", ".join(values)} RETURNING {pk}'
+        )
+        result = await database.fetch_all(query, params)
+        ids.extend(sorted(row[0] for row in result))
+
+    return ids
+
+
+async def update_versioned(
+        table: sqlalchemy.Table,
+        id: int,
+        values: Dict[str, Any],
+        version: Optional[int] = None
+        ) -> Optional[Mapping[str, Any]]:
+    '''
+    Single UPDATE ... RETURNING that also bumps `version` and `updated_at`.
+
+    With `version` the row is only updated while it still has that version.
+    Returns the updated row, or None when no row matched.
+    '''
+    assignments = [f'{column} = :{column}' for column in values]
+    assignments += ['version = version + 1', 'updated_at = :updated_at']
+    where = 'id = :id' if version is None else 'id = :id AND version = :expected_version'
+    params: Dict[str, Any] = {**values, 'id': id}
+    if version is not None:
+        params['expected_version'] = version
+
+    query = sqlalchemy.text(
+        f'UPDATE {table.name} SET {", ".join(assignments)} WHERE {where} '
+        f'RETURNING {", ".join(table.columns.keys())}'
+    ).bindparams(
+        sqlalchemy.bindparam('updated_at', utcnow(), type_=table.c.updated_at.type),
+        **params
+    ).columns(*table.columns)
+    row = await database.fetch_one(query)
+    return row._mapping if row is not None else None
+
+
+async def update_many_versioned(
+        table: sqlalchemy.Table,
+        rows: List[Dict[str, Any]]
+        ) -> List[Optional[Mapping[str, Any]]]:
+    '''
+    UPDATE ... FROM (VALUES ...) RETURNING, one statement per BULK_CHUNK_SIZE rows,
+    that bumps `version` and `updated_at` like `update_versioned`. Every row holds
+    the `id` to update and the same columns.
+
+    Returns the updated rows in the order of `rows`, None where no row matched
+    (deleted meanwhile). An id repeated in `rows` starts a new statement, so the
+    updates apply one after the other as with `update_versioned`.
+    '''
+    columns: List[str] = list(rows[0])
+    # Postgres types the parameters of a VALUES list as text, the casts keep the column types.
+    casts: Dict[str, str] = {column: table.c[column].type.compile() for column in columns}
+    assignments = [f'{column} = changes.{column}' for column in columns if column != 'id']
+    assignments += ['version = version + 1', 'updated_at = :updated_at']
+    returning = ', '.join(f'{table.name}.{column}' for column in table.columns.keys())
+
+    chunks: List[List[int]] = [[]]
+    for i, row in enumerate(rows):
+        chunk = chunks[-1]
+        if len(chunk) == BULK_CHUNK_SIZE or any(rows[j]['id'] == row['id'] for j in chunk):
+            chunks.append([i])
+        else:
+            chunk.append(i)
+
+    updated: List[Optional[Mapping[str, Any]]] = [None] * len(rows)
+    for chunk in chunks:
+        values: List[str] = []
+        params: Dict[str, Any] = {}
+        for i in chunk:
+            values.append('(' + ', '.join(f'CAST(:{column}_{i} AS {casts[column]})' for column in columns) + ')')
+            params.update({f'{column}_{i}': rows[i][column] for column in columns})
+
+        query = sqlalchemy.text(
+            f'WITH changes ({", ".join(columns)}) AS (VALUES {", ".join(values)}) '
+            f'UPDATE {table.name} SET {", ".join(assignments)} FROM changes '
+            f'WHERE {table.name}.id = changes.id RETURNING {returning}'
+        ).bindparams(
+            sqlalchemy.bindparam('updated_at', utcnow(), type_=table.c.updated_at.type),
+            **params
+        ).columns(*table.columns)
+        by_id = {row._mapping['id']: row._mapping for row in await database.fetch_all(query)}
+        for i in chunk:
+            updated[i] = by_id.get(rows[i]['id'])
+
+    return updated
+
+
+async def delete_returning(table: sqlalchemy.Table, column: str, values: Sequence[Any]) -> List[int]:
+    '''
+    Single DELETE ... WHERE column IN (...) RETURNING id, the ids of the deleted rows.
+    '''
+    if not values:
+        return []
+    query = sqlalchemy.text(
+        f'DELETE FROM {table.name} WHERE {column} IN :values RETURNING id'
+    ).bindparams(
+        sqlalchemy.bindparam('values', list(values), expanding=True)
+    ).columns(table.c.id)
+    return [row[0] for row in await database.fetch_all(query)]
+
+
+async def delete_limited(table: sqlalchemy.Table, column: str, value: Any, limit: int) -> List[int]:
+    '''
+    Deletes at most `limit` rows where column = value, lowest ids first, and returns their ids.
+    '''
+    query = sqlalchemy.text(
+        f'DELETE FROM {table.name} WHERE id IN '
+        f'(SELECT id FROM {table.name} WHERE {column} = :value ORDER BY id LIMIT :limit) RETURNING id'
+    ).bindparams(value=value, limit=limit).columns(table.c.id)
+    return [row[0] for row in await database.fetch_all(query)]
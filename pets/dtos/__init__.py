@@ -1,2 +1,15 @@
-from .pet_dtos import PetCreateRequestDto, PetUpdateRequestDto, PetResponseDto
-from .user_dtos import UserCreateRequestDto, UserUpdateRequestDto, UserResponseDto
+from .bulk_dtos import BulkItemResultDto, BulkResponseDto, BulkDeleteRequestDto
+from .page_dtos import PartialPageDto, RowPage
+from .pet_dtos import (
+    PetBaseDto, PetCreateRequestDto, PetUpdateRequestDto, PetResponseDto, PetPageDto, PetFilterDto,
+    PetBulkCreateRequestDto, PetBulkUpdateRequestDto
+)
+from .user_dtos import (
+    UserBaseDto, UserCreateRequestDto, UserUpdateRequestDto, UserResponseDto, UserPageDto,
+    UserBulkCreateRequestDto, UserBulkUpdateRequestDto, UserBulkDeleteResultDto, UserBulkDeleteResponseDto
+)
+from .expanded_dtos import (
+    PetWithOwnerResponseDto, PetWithOwnerPageDto, UserWithPetsResponseDto, UserWithPetsPageDto
+)
+from .job_dtos import DeletionJobDto
+from .stats_dtos import PetStatsDto
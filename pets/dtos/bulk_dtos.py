@@ -0,0 +1,43 @@
+from typing import Generic, List, Optional, TypeVar
+
+from cafeto.models import BaseModel, validate
+from cafeto.errors import FieldError, Error
+
+
+MAX_BULK_SIZE: int = 1000
+
+TData = TypeVar('TData')
+
+
+class ErrorDto(BaseModel):
+    type: str
+    msg: str
+    loc: List[str]
+
+
+class BulkItemResultDto(BaseModel, Generic[TData]):
+    index: int
+    data: Optional[TData] = None
+    errors: List[ErrorDto] = []
+
+
+class BulkResponseDto(BaseModel, Generic[TData]):
+    results: List[BulkItemResultDto[TData]]
+
+
+class BulkRequestDto(BaseModel):
+    @validate('items')
+    def validate_items(value: list, _: dict) -> list:
+        if len(value) > MAX_BULK_SIZE:
+            raise FieldError(Error('too-many-items', f'At most {MAX_BULK_SIZE} items are allowed'))
+        return value
+
+
+class BulkDeleteRequestDto(BaseModel):
+    ids: List[int]
+
+    @validate('ids')
+    def validate_ids(value: List[int], _: dict) -> List[int]:
+        if len(value) > MAX_BULK_SIZE:
+            raise FieldError(Error('too-many-items', f'At most {MAX_BULK_SIZE} items are allowed'))
+        return value
@@ -0,0 +1,49 @@
+from typing import Any, List, Mapping, Optional
+
+from pydantic import Field
+from cafeto.models import BaseModel
+
+from pets.dtos.pet_dtos import PetResponseDto
+from pets.dtos.user_dtos import UserResponseDto
+
+
+class PetWithOwnerResponseDto(PetResponseDto):
+    owner: UserResponseDto
+
+    @classmethod
+    def from_joined_row(cls, row: Mapping[str, Any], owner: str) -> 'PetWithOwnerResponseDto':
+        '''
+        Builds the response from a `pets` row joined with `users`, `owner` is the prefix
+        ormar gives the columns of the joined table.
+        '''
+        return cls(
+            id=row['id'],
+            name=row['name'],
+            breed=row['breed'],
+            age=row['age'],
+            owner={
+                'id': row['owner_id'],
+                'name': row[f'{owner}_name'],
+                'email': row[f'{owner}_email'],
+                'version': row[f'{owner}_version'],
+                'updated_at': row[f'{owner}_updated_at']
+            },
+            version=row['version'],
+            updated_at=row['updated_at']
+        )
+
+
+class PetWithOwnerPageDto(BaseModel):
+    data: List[PetWithOwnerResponseDto]
+    next_cursor: Optional[str] = None
+    etag: Optional[str] = Field(default=None, exclude=True)
+
+
+class UserWithPetsResponseDto(UserResponseDto):
+    pets: List[PetResponseDto] = []
+
+
+class UserWithPetsPageDto(BaseModel):
+    data: List[UserWithPetsResponseDto]
+    next_cursor: Optional[str] = None
+    etag: Optional[str] = Field(default=None, exclude=True)
@@ -0,0 +1,29 @@
+from datetime import datetime
+from typing import Any, Mapping, Optional
+
+from cafeto.models import BaseModel
+
+
+class DeletionJobDto(BaseModel):
+    id: int
+    user_id: int
+    status: str
+    # Counted up to USER_DELETE_BATCH_SIZE + 1 until the job starts, then exactly.
+    pets_total: int
+    pets_deleted: int
+    error: Optional[str] = None
+    created_at: datetime
+    updated_at: datetime
+
+    @classmethod
+    def from_row(cls, row: Mapping[str, Any]) -> 'DeletionJobDto':
+        return cls(
+            id=row['id'],
+            user_id=row['user_id'],
+            status=row['status'],
+            pets_total=row['pets_total'],
+            pets_deleted=row['pets_deleted'],
+            error=row['error'],
+            created_at=row['created_at'],
+            updated_at=row['updated_at']
+        )
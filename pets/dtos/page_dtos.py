@@ -0,0 +1,33 @@
+from typing import Any, Dict, List, Mapping, NamedTuple, Optional, Sequence, Type
+
+from pydantic import Field
+from cafeto.models import BaseModel
+
+
+class PartialPageDto(BaseModel):
+    '''
+    Page of a list endpoint called with `fields`, each item only has the requested fields.
+    '''
+    data: List[Dict[str, Any]]
+    next_cursor: Optional[str] = None
+    etag: Optional[str] = Field(default=None, exclude=True)
+
+
+class RowPage(NamedTuple):
+    '''
+    Page of a list endpoint still as database rows, `pets.encoders` writes the
+    JSON of `page` straight from them, in the field order of `item`. `item`
+    builds the DTO of a row with `from_row`.
+    '''
+    page: Type[BaseModel]
+    item: Type[BaseModel]
+    rows: Sequence[Mapping[str, Any]]
+    next_cursor: Optional[str] = None
+    etag: Optional[str] = None
+
+    def to_dto(self) -> BaseModel:
+        return self.page(
+            data=[self.item.from_row(row) for row in self.rows],
+            next_cursor=self.next_cursor,
+            etag=self.etag
+        )
@@ -1,8 +1,12 @@
+from datetime import datetime
+from typing import Any, List, Mapping, Optional
+
+from pydantic import Field
 from cafeto.models import BaseModel, validate
 from cafeto.errors import FieldError, Error
 
-from pets.errors import UserNotFound
 from pets.services import AUserService
+from pets.dtos.bulk_dtos import BulkRequestDto
 
 
 class OwnerDto(BaseModel):
@@ -18,14 +22,45 @@ class PetBaseDto(BaseModel):
 
 class PetResponseDto(PetBaseDto):
     id: int
+    # Only travel in the ETag and Last-Modified headers.
+    version: int = Field(default=1, exclude=True)
+    updated_at: Optional[datetime] = Field(default=None, exclude=True)
+
+    @classmethod
+    def from_row(cls, row: Mapping[str, Any]) -> 'PetResponseDto':
+        '''
+        Builds the response straight from a `pets` row, without an ormar model in between.
+        Validating plain columns in pydantic-core is cheaper than the Python `model_construct`.
+        '''
+        return cls(
+            id=row['id'],
+            name=row['name'],
+            breed=row['breed'],
+            age=row['age'],
+            owner={'id': row['owner_id']},
+            version=row['version'],
+            updated_at=row['updated_at']
+        )
+
+
+class PetFilterDto(BaseModel):
+    breed: Optional[str] = None
+    age_min: Optional[int] = None
+    age_max: Optional[int] = None
+    owner_id: Optional[int] = None
+    name_prefix: Optional[str] = None
+
+
+class PetPageDto(BaseModel):
+    data: List[PetResponseDto]
+    next_cursor: Optional[str] = None
+    etag: Optional[str] = Field(default=None, exclude=True)
 
 
 class PetRequestDto(PetBaseDto):
     @validate('owner')
     async def validate_owner(value: OwnerDto, _: dict, service: AUserService) -> int:
-        try:
-            await service.retrieve(value.id)
-        except UserNotFound:
+        if not await service.can_own_pets(value.id):
             raise FieldError(Error('owner-not-found', 'Owner not found'))
         return value
 
@@ -36,3 +71,15 @@ class PetCreateRequestDto(PetRequestDto):
 
 class PetUpdateRequestDto(PetRequestDto):
     ...
+
+
+class PetBulkUpdateItemDto(PetBaseDto):
+    id: int
+
+
+class PetBulkCreateRequestDto(BulkRequestDto):
+    items: List[PetBaseDto]
+
+
+class PetBulkUpdateRequestDto(BulkRequestDto):
+    items: List[PetBulkUpdateItemDto]
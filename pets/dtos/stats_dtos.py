@@ -0,0 +1,31 @@
+from typing import List
+
+from cafeto.models import BaseModel
+
+
+class BreedCountDto(BaseModel):
+    breed: str
+    pets: int
+
+
+class AgeBucketDto(BaseModel):
+    age_min: int
+    age_max: int
+    pets: int
+
+
+class OwnerCountDto(BaseModel):
+    '''
+    `owners` own exactly `pets` pets each.
+    '''
+    pets: int
+    owners: int
+
+
+class PetStatsDto(BaseModel):
+    pets: int
+    # Owners with at least one pet.
+    owners: int
+    breeds: List[BreedCountDto]
+    ages: List[AgeBucketDto]
+    pets_per_owner: List[OwnerCountDto]
@@ -1,7 +1,13 @@
+from datetime import datetime
+from typing import Any, List, Mapping, Optional
+
+from pydantic import Field
 from cafeto.models import BaseModel, validate
 from cafeto.errors import FieldError, Error
 
 from pets.services import AUserService
+from pets.dtos.bulk_dtos import BulkItemResultDto, BulkRequestDto
+from pets.dtos.job_dtos import DeletionJobDto
 
 
 class UserBaseDto(BaseModel):
@@ -35,3 +41,49 @@ class UserUpdateRequestDto(UserRequestDto):
 
 class UserResponseDto(UserBaseDto):
     id: int
+    # Only travel in the ETag and Last-Modified headers.
+    version: int = Field(default=1, exclude=True)
+    updated_at: Optional[datetime] = Field(default=None, exclude=True)
+    # Internal, pets can not be added to a user being deleted.
+    deleting: bool = Field(default=False, exclude=True)
+
+    @classmethod
+    def from_row(cls, row: Mapping[str, Any]) -> 'UserResponseDto':
+        '''
+        Builds the response straight from a `users` row, without an ormar model in between.
+        '''
+        return cls(
+            id=row['id'],
+            name=row['name'],
+            email=row['email'],
+            version=row['version'],
+            updated_at=row['updated_at'],
+            deleting=row['deleting']
+        )
+
+
+class UserPageDto(BaseModel):
+    data: List[UserResponseDto]
+    next_cursor: Optional[str] = None
+    etag: Optional[str] = Field(default=None, exclude=True)
+
+
+class UserBulkDeleteResultDto(BulkItemResultDto[int]):
+    # The deletion job of a user with many pets, see DELETE /user/{id}.
+    job: Optional[DeletionJobDto] = None
+
+
+class UserBulkDeleteResponseDto(BaseModel):
+    results: List[UserBulkDeleteResultDto]
+
+
+class UserBulkUpdateItemDto(UserBaseDto):
+    id: int
+
+
+class UserBulkCreateRequestDto(BulkRequestDto):
+    items: List[UserBaseDto]
+
+
+class UserBulkUpdateRequestDto(BulkRequestDto):
+    items: List[UserBulkUpdateItemDto]
@@ -8,3 +8,77 @@ class PetNotFound(Exception):
     def __init__(self, msg='Pet not found'):
         super().__init__(msg)
         self.msg = msg
+
+
+class BreedsFileNotFound(Exception):
+    def __init__(self, msg='Breeds file not found'):
+        super().__init__(msg)
+        self.msg = msg
+
+
+class InvalidCursor(Exception):
+    def __init__(self, msg='Invalid cursor'):
+        super().__init__(msg)
+        self.msg = msg
+
+
+class EmailExists(Exception):
+    def __init__(self, msg='Email already exists'):
+        super().__init__(msg)
+        self.msg = msg
+
+
+class PoolExhausted(Exception):
+    def __init__(self, msg='No database connection available, try again later'):
+        super().__init__(msg)
+        self.msg = msg
+
+
+class InvalidSort(Exception):
+    def __init__(self, msg='Invalid sort'):
+        super().__init__(msg)
+        self.msg = msg
+
+
+class InvalidFields(Exception):
+    def __init__(self, msg='Invalid fields'):
+        super().__init__(msg)
+        self.msg = msg
+
+
+class VersionMismatch(Exception):
+    def __init__(self, msg='The resource was modified, fetch it again and retry'):
+        super().__init__(msg)
+        self.msg = msg
+
+
+class NotModified(Exception):
+    def __init__(self, etag: str, msg='Not modified'):
+        super().__init__(msg)
+        self.etag = etag
+        self.msg = msg
+
+
+class InvalidQuery(Exception):
+    def __init__(self, msg='Invalid query'):
+        super().__init__(msg)
+        self.msg = msg
+
+
+class JobNotFound(Exception):
+    def __init__(self, msg='Job not found'):
+        super().__init__(msg)
+        self.msg = msg
+
+
+class RateLimited(Exception):
+    def __init__(self, retry_after: float, msg='Too many requests, try again later'):
+        super().__init__(msg)
+        self.retry_after = retry_after
+        self.msg = msg
+
+
+class Overloaded(Exception):
+    def __init__(self, msg='The server is busy, try again later'):
+        super().__init__(msg)
+        self.msg = msg
@@ -0,0 +1,109 @@
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Iterable, List, Optional, Tuple, Union
+
+from starlette.responses import JSONResponse, Response
+
+from cafeto.errors import Error
+from cafeto.requests import Request
+from cafeto.responses import BaseResponse
+
+from pets.errors import VersionMismatch
+
+
+def version_etag(version: int) -> str:
+    return f'"{version}"'
+
+
+def page_etag(versions: Iterable[Tuple[int, int]], next_cursor: Optional[str]) -> str:
+    '''
+    Strong ETag of a page, it changes when a row of the page is added, removed or
+    updated, or when the page ends somewhere else.
+    '''
+    digest = hashlib.blake2b(digest_size=16)
+    for id, version in versions:
+        digest.update(f'{id}:{version};'.encode('ascii'))
+    digest.update((next_cursor or '').encode('ascii'))
+    return f'"{digest.hexdigest()}"'
+
+
+def _tags(header: str) -> List[str]:
+    return [tag.strip() for tag in header.split(',') if tag.strip()]
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    '''
+    Weak comparison, as `If-None-Match` asks for.
+    '''
+    if not if_none_match:
+        return False
+    return any(tag == '*' or tag.removeprefix('W/') == etag for tag in _tags(if_none_match))
+
+
+def expected_version(if_match: Optional[str]) -> Optional[int]:
+    '''
+    The version an `If-Match` header requires, None when any version will do.
+    Only a single strong version tag can be checked with one UPDATE.
+    '''
+    if if_match is None or if_match.strip() == '*':
+        return None
+    tags = _tags(if_match)
+    if len(tags) != 1 or not (tags[0].startswith('"') and tags[0].endswith('"')):
+        raise VersionMismatch()
+    try:
+        return int(tags[0][1:-1])
+    except ValueError:
+        raise VersionMismatch()
+
+
+def http_date(value: datetime) -> str:
+    return format_datetime(value.replace(tzinfo=timezone.utc, microsecond=0), usegmt=True)
+
+
+def not_modified(request: Request, etag: str, last_modified: Optional[datetime] = None) -> bool:
+    '''
+    Conditional GET, `If-Modified-Since` only counts without `If-None-Match`.
+    '''
+    if_none_match = request.headers.get('if-none-match')
+    if if_none_match is not None:
+        return etag_matches(if_none_match, etag)
+    if_modified_since = request.headers.get('if-modified-since')
+    if if_modified_since and last_modified is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is not None:
+            since = since.astimezone(timezone.utc).replace(tzinfo=None)
+        return last_modified.replace(microsecond=0) <= since
+    return False
+
+
+def validators(etag: str, last_modified: Optional[datetime] = None) -> dict:
+    headers = {'ETag': etag}
+    if last_modified is not None:
+        headers['Last-Modified'] = http_date(last_modified)
+    return headers
+
+
+def not_modified_response(etag: str, last_modified: Optional[datetime] = None) -> Response:
+    return Response(status_code=304, headers=validators(etag, last_modified))
+
+
+def with_validators(
+        response: Union[BaseResponse, Response], etag: str, last_modified: Optional[datetime] = None
+        ) -> Response:
+    '''
+    Renders a cafeto response, unless already rendered, and adds the `ETag` and `Last-Modified` headers.
+    '''
+    rendered = response if isinstance(response, Response) else response()
+    rendered.headers.update(validators(etag, last_modified))
+    return rendered
+
+
+def precondition_failed(error: VersionMismatch) -> Response:
+    '''
+    412 with the same error list as the other 4xx responses of the controllers.
+    '''
+    return JSONResponse([Error('version-mismatch', error.msg, '__model__')], status_code=412)
@@ -0,0 +1,14 @@
+from typing import ClassVar, Optional
+
+from cafeto.requests import Request
+from cafeto.responses.formats import FORMAT
+
+
+class APPLICATION_NDJSON(FORMAT):  # noqa
+    value: ClassVar[str] = 'application/x-ndjson'
+
+
+def wants_ndjson(request: Request, stream: Optional[str] = None) -> bool:
+    if stream is not None and stream.lower() in ('1', 'true', 'yes'):
+        return True
+    return APPLICATION_NDJSON.value in request.headers.get('accept', '')
@@ -0,0 +1,252 @@
+'''
+Background deletion of users with many pets.
+
+The request only marks the user as deleting and records a job in
+`deletion_jobs`. Every worker runs a `DeletionJobRunner` from the lifespan
+which removes the pets in batches of USER_DELETE_BATCH_SIZE, one short
+transaction each, recording the progress with the batch. The user goes last,
+with the job marked done in the same transaction.
+
+A worker holds a lease on the jobs it runs, renewed with every batch. Jobs
+whose lease expired (their worker died) or that were released on shutdown
+are claimed again by the next poll of any worker and resume where they
+stopped; a batch deleting nothing more than what is left is harmless to repeat.
+'''
+import asyncio
+import logging
+import contextlib
+import contextvars
+from datetime import datetime, timedelta
+from typing import Any, AsyncIterator, Coroutine, Dict, List, Mapping, Optional
+
+import sqlalchemy
+
+from config import DELETION_JOB_LEASE_SECONDS, USER_DELETE_BATCH_SIZE, database
+from pets.cache import cache, cache_key
+from pets.db import delete_limited, delete_returning, fetch_row, insert_many, utcnow
+from pets.errors import UserNotFound
+from pets.models import DeletionJob, Pet, User
+from pets.models.deletion_job_model import DONE, FAILED, PENDING, RUNNING
+
+
+logger = logging.getLogger('pets.jobs')
+
+ACTIVE: tuple = (PENDING, RUNNING)
+
+
+def _create_task(coroutine: Coroutine[Any, Any, None]) -> asyncio.Task:
+    '''
+    Runs `coroutine` in a task of its own with an empty context. `databases` keeps
+    the connection in a context variable, a task created from a request (or from the
+    lifespan after `warm_up`) would share that connection and its transaction stack,
+    and the batch transactions of two jobs would nest into each other.
+    '''
+    # create_task copies the current context, `context=` only exists from Python 3.11.
+    return contextvars.Context().run(asyncio.create_task, coroutine)
+
+
+class DeletionJobRunner:
+    def __init__(self, batch_size: int, lease_seconds: float, pause_seconds: float = 0.0):
+        self.batch_size: int = batch_size
+        self.lease_seconds: float = lease_seconds
+        # Between batches, lets other transactions through on a busy database.
+        self.pause_seconds: float = pause_seconds
+        self._tasks: Dict[int, asyncio.Task] = {}
+        self._poller: Optional[asyncio.Task] = None
+        self._write_lock: Optional[asyncio.Lock] = None
+
+    @property
+    def table(self) -> sqlalchemy.Table:
+        return DeletionJob.ormar_config.table
+
+    async def start(self) -> None:
+        if self._poller is None:
+            # Made on the loop of the jobs, a lock binds to the first loop it waits on.
+            self._write_lock = asyncio.Lock()
+            self._poller = _create_task(self._poll())
+
+    async def stop(self) -> None:
+        '''
+        Cancels the running jobs and releases their leases, the next worker to
+        start resumes them without waiting for the lease to expire.
+        '''
+        if self._poller is None:
+            return
+        self._poller.cancel()
+        ids, tasks = list(self._tasks), list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(self._poller, *tasks, return_exceptions=True)
+        self._poller = None
+        if ids:
+            async with self._write():
+                await database.execute(
+                    sqlalchemy.text(
+                        'UPDATE deletion_jobs SET lease_expires_at = NULL WHERE id IN :ids AND status = :running'
+                    ).bindparams(
+                        sqlalchemy.bindparam('ids', ids, expanding=True),
+                        running=RUNNING
+                    )
+                )
+        self._write_lock = None
+
+    async def schedule(self, user_id: int, pets_total: int) -> Mapping[str, Any]:
+        '''
+        Marks the user as deleting and records its job, or returns the job already
+        deleting it. The job starts right away when the runner is started, else on
+        the next poll of a worker. `pets_total` may be a lower bound, the request only
+        counts far enough to know the user is big, the job counts them all when it starts.
+        '''
+        async with self._write():
+            job = await fetch_row(DeletionJob.objects.filter(user_id=user_id, status__in=list(ACTIVE)))
+            if job is None:
+                marked = await database.fetch_one(
+                    sqlalchemy.text('UPDATE users SET deleting = :deleting WHERE id = :id RETURNING id').bindparams(
+                        sqlalchemy.bindparam('deleting', True, type_=sqlalchemy.Boolean), id=user_id
+                    )
+                )
+                if marked is None:
+                    raise UserNotFound('User not found')
+                ids = await insert_many(self.table, [{'user_id': user_id, 'pets_total': pets_total}])
+                job = await fetch_row(DeletionJob.objects.filter(id=ids[0]))
+        await cache.invalidate(cache_key('user', user_id))
+        if self._poller is not None:
+            self._spawn(job['id'])
+        return job
+
+    async def claim(self, job_id: int) -> bool:
+        now = utcnow()
+        async with self._write():
+            row = await database.fetch_one(
+                sqlalchemy.text(
+                    'UPDATE deletion_jobs SET status = :running, lease_expires_at = :lease, updated_at = :now '
+                    'WHERE id = :id AND status IN :active AND (lease_expires_at IS NULL OR lease_expires_at < :now) '
+                    'RETURNING id'
+                ).bindparams(
+                    sqlalchemy.bindparam('active', list(ACTIVE), expanding=True),
+                    sqlalchemy.bindparam('lease', self.__lease(now), type_=self.table.c.lease_expires_at.type),
+                    sqlalchemy.bindparam('now', now, type_=self.table.c.updated_at.type),
+                    running=RUNNING,
+                    id=job_id
+                )
+            )
+        return row is not None
+
+    async def run(self, job_id: int) -> None:
+        '''
+        Deletes the pets of the job in batches, then the user. The caller holds the lease.
+        '''
+        job = await fetch_row(DeletionJob.objects.filter(id=job_id))
+        user_id = job['user_id']
+        pets_table = Pet.ormar_config.table
+        async with self._write():
+            await database.execute(
+                sqlalchemy.text(
+                    'UPDATE deletion_jobs SET pets_total = pets_deleted + '
+                    '(SELECT COUNT(*) FROM pets WHERE owner_id = :user_id) WHERE id = :id'
+                ).bindparams(user_id=user_id, id=job_id)
+            )
+
+        while True:
+            async with self._write():
+                pet_ids = await delete_limited(pets_table, 'owner_id', user_id, self.batch_size)
+                await self.__progress(job_id, len(pet_ids))
+            if pet_ids:
+                await cache.invalidate(*[cache_key('pet', pet_id) for pet_id in pet_ids])
+            if len(pet_ids) < self.batch_size:
+                break
+            await asyncio.sleep(self.pause_seconds)
+
+        async with self._write():
+            # Owner checks keep new pets away from a deleting user, this only catches a racing insert.
+            pet_ids = await delete_returning(pets_table, 'owner_id', [user_id])
+            await delete_returning(User.ormar_config.table, 'id', [user_id])
+            await self.__finish(job_id, DONE, len(pet_ids))
+        await cache.invalidate(cache_key('user', user_id), *[cache_key('pet', pet_id) for pet_id in pet_ids])
+
+    @contextlib.asynccontextmanager
+    async def _write(self) -> AsyncIterator[None]:
+        '''
+        Transaction around every write of the runner. SQLite has a single writer and
+        answers "database is locked" at once, without waiting, to a write while
+        another connection writes: the jobs of this worker take turns there instead.
+        '''
+        if self._write_lock is None or not str(database.url).startswith('sqlite'):
+            async with database.transaction():
+                yield
+            return
+        async with self._write_lock, database.transaction():
+            yield
+
+    def _spawn(self, job_id: int) -> None:
+        if job_id in self._tasks:
+            return
+        task = _create_task(self._run_claimed(job_id))
+        self._tasks[job_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(job_id, None))
+
+    async def _run_claimed(self, job_id: int) -> None:
+        if not await self.claim(job_id):
+            return
+        try:
+            await self.run(job_id)
+        except Exception as e:
+            logger.exception('Deletion job %s failed', job_id)
+            async with self._write():
+                await self.__finish(job_id, FAILED, 0, str(e))
+
+    async def _poll(self) -> None:
+        while True:
+            try:
+                for job_id in await self.__claimable():
+                    self._spawn(job_id)
+            except Exception:  # pragma: no cover
+                logger.exception('Polling the deletion jobs failed')
+            await asyncio.sleep(self.lease_seconds / 2)
+
+    async def __claimable(self) -> List[int]:
+        now = utcnow()
+        rows = await database.fetch_all(
+            sqlalchemy.text(
+                'SELECT id FROM deletion_jobs '
+                'WHERE status IN :active AND (lease_expires_at IS NULL OR lease_expires_at < :now) ORDER BY id'
+            ).bindparams(
+                sqlalchemy.bindparam('active', list(ACTIVE), expanding=True),
+                sqlalchemy.bindparam('now', now, type_=self.table.c.updated_at.type)
+            )
+        )
+        return [row[0] for row in rows]
+
+    async def __progress(self, job_id: int, deleted: int) -> None:
+        now = utcnow()
+        await database.execute(
+            sqlalchemy.text(
+                'UPDATE deletion_jobs SET pets_deleted = pets_deleted + :deleted, lease_expires_at = :lease, '
+                'updated_at = :now WHERE id = :id'
+            ).bindparams(
+                sqlalchemy.bindparam('lease', self.__lease(now), type_=self.table.c.lease_expires_at.type),
+                sqlalchemy.bindparam('now', now, type_=self.table.c.updated_at.type),
+                deleted=deleted,
+                id=job_id
+            )
+        )
+
+    async def __finish(self, job_id: int, status: str, deleted: int, error: Optional[str] = None) -> None:
+        await database.execute(
+            sqlalchemy.text(
+                'UPDATE deletion_jobs SET status = :status, pets_deleted = pets_deleted + :deleted, error = :error, '
+                'lease_expires_at = NULL, updated_at = :now WHERE id = :id'
+            ).bindparams(
+                sqlalchemy.bindparam('now', utcnow(), type_=self.table.c.updated_at.type),
+                status=status,
+                deleted=deleted,
+                error=error,
+                id=job_id
+            )
+        )
+
+    def __lease(self, now: datetime) -> datetime:
+        return now + timedelta(seconds=self.lease_seconds)
+
+
+deletion_jobs: DeletionJobRunner = DeletionJobRunner(USER_DELETE_BATCH_SIZE, DELETION_JOB_LEASE_SECONDS)
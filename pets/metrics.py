@@ -0,0 +1,318 @@
+import time
+import bisect
+import logging
+from contextvars import ContextVar
+from typing import Any, AsyncGenerator, Dict, List, Mapping, Optional, Sequence, Tuple
+
+from databases import Database
+from starlette.datastructures import MutableHeaders
+from starlette.routing import Mount
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from cafeto import App
+from cafeto.events import OnAfterAction, OnBeforeAction, OnExecuteAction
+
+
+logger = logging.getLogger('pets.sql')
+
+LATENCY_BUCKETS: Tuple[float, ...] = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+QUERY_COUNT_BUCKETS: Tuple[float, ...] = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+Labels = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names: Sequence[str], values: Labels, extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Histogram:
+    '''
+    Prometheus histogram. Observations land in a single bucket, the cumulative
+    counts are only computed when rendering.
+    '''
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name: str = name
+        self.help: str = help
+        self.labels: Tuple[str, ...] = tuple(labels)
+        self.buckets: Tuple[float, ...] = tuple(buckets)
+        # labels -> [count per bucket..., count above the last bucket, sum]
+        self._series: Dict[Labels, List[float]] = {}
+
+    def observe(self, value: float, labels: Labels = ()) -> None:
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [0] * (len(self.buckets) + 2)
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        for labels, series in self._series.items():
+            total = 0
+            for bound, count in zip(self.buckets, series):
+                total += count
+                le = f'le="{bound}"'
+                lines.append(f'{self.name}_bucket{_format_labels(self.labels, labels, le)} {total}')
+            total += series[-2]
+            le = 'le="+Inf"'
+            lines.append(f'{self.name}_bucket{_format_labels(self.labels, labels, le)} {total}')
+            lines.append(f'{self.name}_sum{_format_labels(self.labels, labels)} {series[-1]}')
+            lines.append(f'{self.name}_count{_format_labels(self.labels, labels)} {total}')
+        return lines
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name: str = name
+        self.help: str = help
+        self.labels: Tuple[str, ...] = tuple(labels)
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, amount: float = 1, labels: Labels = ()) -> None:
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        for labels, value in self._values.items():
+            lines.append(f'{self.name}{_format_labels(self.labels, labels)} {value}')
+        return lines
+
+
+class Metrics:
+    '''
+    Metrics of the worker process, every worker exposes its own.
+    '''
+    def __init__(self):
+        self.request_duration = Histogram(
+            'pets_http_request_duration_seconds', 'Time spent handling a request.', ('method', 'route', 'status')
+        )
+        self.request_queries = Histogram(
+            'pets_http_request_db_queries', 'SQL queries run per request.', ('method', 'route'), QUERY_COUNT_BUCKETS
+        )
+        self.request_query_duration = Histogram(
+            'pets_http_request_db_seconds', 'Time spent in SQL queries per request.', ('method', 'route')
+        )
+        self.query_duration = Histogram('pets_db_query_duration_seconds', 'Time spent in a single SQL query.')
+        self.slow_queries = Counter('pets_db_slow_queries_total', 'SQL queries slower than SLOW_QUERY_MS.')
+        self.shed_requests = Counter(
+            'pets_http_requests_shed_total', 'Requests rejected by admission control.', ('group', 'reason')
+        )
+
+    def render(self) -> List[str]:
+        lines: List[str] = []
+        for metric in (
+            self.request_duration,
+            self.request_queries,
+            self.request_query_duration,
+            self.query_duration,
+            self.slow_queries,
+            self.shed_requests
+        ):
+            lines.extend(metric.render())
+        return lines
+
+
+metrics: Metrics = Metrics()
+
+
+def render_stats(prefix: str, stats: Mapping[str, float], gauges: Sequence[str] = ('size',)) -> List[str]:
+    '''
+    Renders a flat dict of counters, such as `Cache.stats()`, in the Prometheus text format.
+    '''
+    lines: List[str] = []
+    for key, value in stats.items():
+        if key in gauges:
+            name, kind = f'{prefix}_{key}', 'gauge'
+        else:
+            name, kind = f'{prefix}_{key}_total', 'counter'
+        lines.extend([f'# TYPE {name} {kind}', f'{name} {value}'])
+    return lines
+
+
+def render_gauges(prefix: str, label: str, stats: Mapping[str, Mapping[str, float]]) -> List[str]:
+    '''
+    Renders gauges per value of `label`, such as `AdmissionControl.group_stats()`, in the Prometheus text format.
+    '''
+    keys: List[str] = list(dict.fromkeys(key for values in stats.values() for key in values))
+    lines: List[str] = []
+    for key in keys:
+        name = f'{prefix}_{key}'
+        lines.append(f'# TYPE {name} gauge')
+        for value, values in stats.items():
+            lines.append(f'{name}{_format_labels((label,), (value,))} {values[key]}')
+    return lines
+
+
+class Timings:
+    '''
+    Time spent by the current request, reported in the `Server-Timing` header.
+
+    `resolve` covers dependency injection and request body validation, `action`
+    the controller action (SQL included) and `render` the response serialization.
+    '''
+    __slots__ = ('start', 'queries', 'query_time', 'before', 'execute', 'after')
+
+    def __init__(self):
+        self.start: float = time.perf_counter()
+        self.queries: int = 0
+        self.query_time: float = 0.0
+        self.before: Optional[float] = None
+        self.execute: Optional[float] = None
+        self.after: Optional[float] = None
+
+    def server_timing(self, now: float) -> str:
+        entries: List[str] = []
+        if self.before is not None and self.execute is not None:
+            entries.append(f'resolve;dur={(self.execute - self.before) * 1000:.2f}')
+        if self.execute is not None and self.after is not None:
+            entries.append(f'action;dur={(self.after - self.execute) * 1000:.2f}')
+        entries.append(f'db;desc="{self.queries} queries";dur={self.query_time * 1000:.2f}')
+        if self.after is not None:
+            entries.append(f'render;dur={(now - self.after) * 1000:.2f}')
+        entries.append(f'total;dur={(now - self.start) * 1000:.2f}')
+        return ', '.join(entries)
+
+
+_timings: ContextVar[Optional[Timings]] = ContextVar('timings', default=None)
+
+
+def _mark(stage: str) -> None:
+    timings = _timings.get()
+    if timings is not None:
+        setattr(timings, stage, time.perf_counter())
+
+
+class InstrumentedDatabase(Database):
+    '''
+    `databases.Database` that counts and times every query, per process and
+    per request. Queries slower than `slow_query_ms` are logged to `pets.sql`.
+    '''
+    def __init__(self, url: str, *, slow_query_ms: Optional[float] = None, **options: Any):
+        super().__init__(url, **options)
+        self.slow_query_ms: Optional[float] = slow_query_ms
+
+    def _record(self, query: Any, start: float) -> None:
+        elapsed = time.perf_counter() - start
+        metrics.query_duration.observe(elapsed)
+
+        timings = _timings.get()
+        if timings is not None:
+            timings.queries += 1
+            timings.query_time += elapsed
+
+        if self.slow_query_ms is not None and elapsed * 1000 >= self.slow_query_ms:
+            metrics.slow_queries.inc()
+            logger.warning('Slow query (%.1f ms): %s', elapsed * 1000, query)
+
+    async def fetch_all(self, query: Any, values: Optional[dict] = None) -> List[Any]:
+        start = time.perf_counter()
+        try:
+            return await super().fetch_all(query, values)
+        finally:
+            self._record(query, start)
+
+    async def fetch_one(self, query: Any, values: Optional[dict] = None) -> Optional[Any]:
+        start = time.perf_counter()
+        try:
+            return await super().fetch_one(query, values)
+        finally:
+            self._record(query, start)
+
+    async def fetch_val(self, query: Any, values: Optional[dict] = None, column: Any = 0) -> Any:
+        start = time.perf_counter()
+        try:
+            return await super().fetch_val(query, values, column=column)
+        finally:
+            self._record(query, start)
+
+    async def execute(self, query: Any, values: Optional[dict] = None) -> Any:
+        start = time.perf_counter()
+        try:
+            return await super().execute(query, values)
+        finally:
+            self._record(query, start)
+
+    async def execute_many(self, query: Any, values: list) -> None:
+        start = time.perf_counter()
+        try:
+            return await super().execute_many(query, values)
+        finally:
+            self._record(query, start)
+
+    async def iterate(self, query: Any, values: Optional[dict] = None) -> AsyncGenerator[Any, None]:
+        start = time.perf_counter()
+        try:
+            async for record in super().iterate(query, values):
+                yield record
+        finally:
+            self._record(query, start)
+
+
+class MetricsMiddleware:
+    '''
+    Records the latency and SQL usage of every HTTP request and adds a
+    `Server-Timing` header. Routes are labeled with their path template, so
+    the number of series stays bounded.
+    '''
+    def __init__(self, app: ASGIApp):
+        self.app: ASGIApp = app
+        self._routes: Dict[Any, str] = {}
+
+    def _route(self, scope: Scope) -> str:
+        endpoint = scope.get('endpoint')
+        if endpoint is None:
+            return 'unmatched'
+        route = self._routes.get(endpoint)
+        if route is None:
+            for candidate in scope['app'].routes:
+                if isinstance(candidate, Mount):
+                    self._routes[candidate.app] = candidate.path
+                else:
+                    self._routes[candidate.endpoint] = candidate.path
+            route = self._routes.setdefault(endpoint, 'unmatched')
+        return route
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        timings = Timings()
+        token = _timings.set(timings)
+        status = 500
+
+        async def send_with_timing(message: Message) -> None:
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+                MutableHeaders(scope=message).append('Server-Timing', timings.server_timing(time.perf_counter()))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            elapsed = time.perf_counter() - timings.start
+            _timings.reset(token)
+
+            route = self._route(scope)
+            method = scope['method']
+            metrics.request_duration.observe(elapsed, (method, route, str(status)))
+            metrics.request_queries.observe(timings.queries, (method, route))
+            metrics.request_query_duration.observe(timings.query_time, (method, route))
+
+
+def instrument(app: App) -> None:
+    '''
+    Installs the metrics middleware and times the stages of every controller action.
+    '''
+    app.add_middleware(MetricsMiddleware)
+    OnBeforeAction.add(lambda controller, action: _mark('before'))
+    OnExecuteAction.add(lambda controller, action, request_model: _mark('execute'))
+    OnAfterAction.add(lambda controller, action, request_model, response: _mark('after'))
@@ -0,0 +1,99 @@
+'''
+Versioned schema migrations, applied by `python -m pets.commands.migrate`.
+
+Every `vNNNN_<name>.py` module of this package is one migration with an
+`upgrade(connection)` function, applied in version order inside a transaction.
+Applied versions are recorded in the `schema_migrations` table. Migrations
+describe the schema as of their version, never the current models, and check
+what exists first, so databases created by the former `create_all` at startup
+are adopted without changes.
+
+This is the only place a synchronous engine is created, the app itself only
+talks to the database through `databases`.
+'''
+import pkgutil
+import importlib
+from types import ModuleType
+from typing import List, NamedTuple, Optional, Set
+
+import sqlalchemy
+from sqlalchemy.engine import Connection, Engine
+
+
+MIGRATIONS_TABLE: str = 'schema_migrations'
+
+_metadata = sqlalchemy.MetaData()
+schema_migrations = sqlalchemy.Table(
+    MIGRATIONS_TABLE,
+    _metadata,
+    sqlalchemy.Column('version', sqlalchemy.Integer, primary_key=True, autoincrement=False),
+    sqlalchemy.Column('name', sqlalchemy.String(100), nullable=False),
+    sqlalchemy.Column('applied_at', sqlalchemy.DateTime, nullable=False, server_default=sqlalchemy.func.current_timestamp()),
+)
+
+
+class Migration(NamedTuple):
+    version: int
+    name: str
+    module: ModuleType
+
+
+def sync_engine(url: str) -> Engine:
+    # No pool, the schema commands run a handful of statements on one connection.
+    return sqlalchemy.create_engine(url, poolclass=sqlalchemy.pool.NullPool)
+
+
+def migrations() -> List[Migration]:
+    found: List[Migration] = []
+    for module in pkgutil.iter_modules(__path__):
+        if not module.name.startswith('v') or '_' not in module.name:
+            continue
+        version, name = module.name[1:].split('_', 1)
+        found.append(Migration(int(version), name, importlib.import_module(f'{__name__}.{module.name}')))
+    return sorted(found)
+
+
+def applied(connection: Connection) -> Set[int]:
+    if not sqlalchemy.inspect(connection).has_table(MIGRATIONS_TABLE):
+        return set()
+    return set(connection.execute(sqlalchemy.select(schema_migrations.c.version)).scalars())
+
+
+def pending(engine: Engine) -> List[Migration]:
+    with engine.connect() as connection:
+        done = applied(connection)
+    return [migration for migration in migrations() if migration.version not in done]
+
+
+def migrate(engine: Engine, target: Optional[int] = None) -> List[Migration]:
+    '''
+    Applies the pending migrations up to `target` (all when None), each one in
+    its own transaction. Returns the applied migrations.
+    '''
+    done: List[Migration] = []
+    for migration in pending(engine):
+        if target is not None and migration.version > target:
+            break
+        with engine.begin() as connection:
+            _metadata.create_all(connection, checkfirst=True)
+            migration.module.upgrade(connection)
+            connection.execute(schema_migrations.insert().values(version=migration.version, name=migration.name))
+        done.append(migration)
+    return done
+
+
+def drop_all(engine: Engine) -> None:
+    '''
+    Drops every table and the migration history, for tests and benchmarks.
+    '''
+    if engine.dialect.name == 'sqlite':
+        # Virtual tables first, they take their shadow tables with them.
+        with engine.begin() as connection:
+            virtual = connection.execute(sqlalchemy.text(
+                "SELECT name FROM sqlite_master WHERE type = 'table' AND sql LIKE 'CREATE VIRTUAL TABLE%'"
+            )).scalars().all()
+            for name in virtual:
+                connection.execute(sqlalchemy.text(f'DROP TABLE {name}'))
+    metadata = sqlalchemy.MetaData()
+    metadata.reflect(engine)
+    metadata.drop_all(engine)
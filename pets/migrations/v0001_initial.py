@@ -0,0 +1,31 @@
+'''
+The `users` and `pets` tables as the first release created them.
+'''
+import sqlalchemy
+from sqlalchemy.engine import Connection
+
+
+def upgrade(connection: Connection) -> None:
+    metadata = sqlalchemy.MetaData()
+    sqlalchemy.Table(
+        'users',
+        metadata,
+        sqlalchemy.Column('id', sqlalchemy.Integer, primary_key=True),
+        sqlalchemy.Column('name', sqlalchemy.String(100), nullable=False),
+        sqlalchemy.Column('email', sqlalchemy.String(100), nullable=False),
+    )
+    sqlalchemy.Table(
+        'pets',
+        metadata,
+        sqlalchemy.Column('id', sqlalchemy.Integer, primary_key=True),
+        sqlalchemy.Column('name', sqlalchemy.String(100), nullable=False),
+        sqlalchemy.Column('breed', sqlalchemy.String(100), nullable=False),
+        sqlalchemy.Column('age', sqlalchemy.Integer, nullable=False),
+        sqlalchemy.Column(
+            'owner_id',
+            sqlalchemy.Integer,
+            sqlalchemy.ForeignKey('users.id', name='fk_pets_users_id_owner'),
+            nullable=True
+        ),
+    )
+    metadata.create_all(connection, checkfirst=True)
@@ -0,0 +1,32 @@
+'''
+Unique index on users.email, index on the pets.owner_id foreign key and the
+(column, id) indexes behind the sorted keyset pages. Replaces the former
+`create_indexes` command.
+
+Fails when users.email has duplicates, they have to be removed first.
+'''
+from typing import Dict, Sequence, Tuple
+
+import sqlalchemy
+from sqlalchemy.engine import Connection
+
+
+INDEXES: Dict[str, Tuple[str, Sequence[str], bool]] = {
+    'ix_users_email': ('users', ('email',), True),
+    'ix_pets_owner_id': ('pets', ('owner_id',), False),
+    'ix_pets_breed_id': ('pets', ('breed', 'id'), False),
+    'ix_pets_age_id': ('pets', ('age', 'id'), False),
+    'ix_pets_name_id': ('pets', ('name', 'id'), False),
+}
+
+
+def upgrade(connection: Connection) -> None:
+    inspector = sqlalchemy.inspect(connection)
+    existing = {
+        index['name'] for table in ('users', 'pets') for index in inspector.get_indexes(table)
+    }
+    metadata = sqlalchemy.MetaData()
+    tables = {name: sqlalchemy.Table(name, metadata, autoload_with=connection) for name in ('users', 'pets')}
+    for name, (table, columns, unique) in INDEXES.items():
+        if name not in existing:
+            sqlalchemy.Index(name, *[tables[table].c[column] for column in columns], unique=unique).create(connection)
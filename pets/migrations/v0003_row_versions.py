@@ -0,0 +1,27 @@
+'''
+`version` and `updated_at` on users and pets, behind the ETags and If-Match.
+
+SQLite can not add a column with a CURRENT_TIMESTAMP default, there the
+existing rows are backfilled and the app always passes updated_at itself.
+'''
+import sqlalchemy
+from sqlalchemy.engine import Connection
+
+
+def upgrade(connection: Connection) -> None:
+    inspector = sqlalchemy.inspect(connection)
+    sqlite = connection.dialect.name == 'sqlite'
+    for table in ('users', 'pets'):
+        columns = {column['name'] for column in inspector.get_columns(table)}
+        if 'version' not in columns:
+            connection.execute(sqlalchemy.text(f'ALTER TABLE {table} ADD COLUMN version INTEGER DEFAULT 1'))
+        if 'updated_at' not in columns:
+            if sqlite:
+                connection.execute(sqlalchemy.text(f'ALTER TABLE {table} ADD COLUMN updated_at DATETIME'))
+                connection.execute(sqlalchemy.text(
+                    f'UPDATE {table} SET updated_at = CURRENT_TIMESTAMP WHERE updated_at IS NULL'
+                ))
+            else:
+                connection.execute(sqlalchemy.text(
+                    f'ALTER TABLE {table} ADD COLUMN updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP'
+                ))
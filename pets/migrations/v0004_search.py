@@ -0,0 +1,39 @@
+'''
+Index behind `GET /pet/search` over pet names and breeds.
+
+SQLite: `pets_search`, an FTS5 table with the trigram tokenizer over the
+name and breed of `pets` (external content, nothing is stored twice). Triggers
+keep it in sync within the statement that changes `pets`, so every write path
+(single, bulk, the cascade of a user delete) updates it in its own transaction.
+
+Postgres: a pg_trgm GIN index on `name || ' ' || breed`, the table itself is
+the index content and nothing needs syncing. Creating the extension needs a
+role allowed to, otherwise it has to be created by hand first.
+'''
+import sqlalchemy
+from sqlalchemy.engine import Connection
+
+
+SQLITE: tuple = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS pets_search USING fts5("
+    "name, breed, content='pets', content_rowid='id', tokenize='trigram')",
+    "INSERT INTO pets_search(pets_search) VALUES ('rebuild')",
+    "CREATE TRIGGER IF NOT EXISTS pets_search_insert AFTER INSERT ON pets BEGIN "
+    "INSERT INTO pets_search(rowid, name, breed) VALUES (new.id, new.name, new.breed); END",
+    "CREATE TRIGGER IF NOT EXISTS pets_search_delete AFTER DELETE ON pets BEGIN "
+    "INSERT INTO pets_search(pets_search, rowid, name, breed) VALUES ('delete', old.id, old.name, old.breed); END",
+    "CREATE TRIGGER IF NOT EXISTS pets_search_update AFTER UPDATE OF name, breed ON pets BEGIN "
+    "INSERT INTO pets_search(pets_search, rowid, name, breed) VALUES ('delete', old.id, old.name, old.breed); "
+    "INSERT INTO pets_search(rowid, name, breed) VALUES (new.id, new.name, new.breed); END",
+)
+
+POSTGRES: tuple = (
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS ix_pets_search_trgm ON pets USING gin ((name || ' ' || breed) gin_trgm_ops)",
+)
+
+
+def upgrade(connection: Connection) -> None:
+    statements = SQLITE if connection.dialect.name == 'sqlite' else POSTGRES
+    for statement in statements:
+        connection.execute(sqlalchemy.text(statement))
@@ -0,0 +1,33 @@
+'''
+`users.deleting` and the `deletion_jobs` table behind the background deletion
+of users with many pets.
+'''
+import sqlalchemy
+from sqlalchemy.engine import Connection
+
+
+def upgrade(connection: Connection) -> None:
+    inspector = sqlalchemy.inspect(connection)
+    if 'deleting' not in {column['name'] for column in inspector.get_columns('users')}:
+        false = '0' if connection.dialect.name == 'sqlite' else 'false'
+        connection.execute(sqlalchemy.text(
+            f'ALTER TABLE users ADD COLUMN deleting BOOLEAN NOT NULL DEFAULT {false}'
+        ))
+
+    metadata = sqlalchemy.MetaData()
+    table = sqlalchemy.Table(
+        'deletion_jobs',
+        metadata,
+        sqlalchemy.Column('id', sqlalchemy.Integer, primary_key=True),
+        # No foreign key, the job outlives the user it deletes.
+        sqlalchemy.Column('user_id', sqlalchemy.Integer, nullable=False),
+        sqlalchemy.Column('status', sqlalchemy.String(20), nullable=False),
+        sqlalchemy.Column('pets_total', sqlalchemy.Integer, nullable=False),
+        sqlalchemy.Column('pets_deleted', sqlalchemy.Integer, nullable=False),
+        sqlalchemy.Column('error', sqlalchemy.Text, nullable=True),
+        sqlalchemy.Column('lease_expires_at', sqlalchemy.DateTime, nullable=True),
+        sqlalchemy.Column('created_at', sqlalchemy.DateTime, nullable=False),
+        sqlalchemy.Column('updated_at', sqlalchemy.DateTime, nullable=False),
+        sqlalchemy.Index('ix_deletion_jobs_user_id', 'user_id'),
+    )
+    table.create(connection, checkfirst=True)
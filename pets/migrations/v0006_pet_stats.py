@@ -0,0 +1,114 @@
+'''
+Aggregate tables behind `GET /pet/stats`, kept by triggers on `pets`:
+
+- `pet_stats_breeds`: pets per breed.
+- `pet_stats_ages`: pets per age.
+- `pet_stats_owners`: pets per owner, only owners with pets.
+- `pet_stats_owner_counts`: owners per number of pets, kept by triggers on
+  `pet_stats_owners`.
+
+Like the search index, the triggers run within the statement that changes
+`pets`, so every write path (single, bulk, the batches of a user deletion)
+updates the counts in its own transaction. A count that drops to 0 loses its
+row, reads stay proportional to the number of breeds, ages and pet counts.
+'''
+import sqlalchemy
+from sqlalchemy.engine import Connection
+
+from pets.stats import rebuild
+
+
+TABLES: tuple = (
+    'CREATE TABLE IF NOT EXISTS pet_stats_breeds (breed VARCHAR(100) PRIMARY KEY, pets INTEGER NOT NULL)',
+    'CREATE TABLE IF NOT EXISTS pet_stats_ages (age INTEGER PRIMARY KEY, pets INTEGER NOT NULL)',
+    'CREATE TABLE IF NOT EXISTS pet_stats_owners (owner_id INTEGER PRIMARY KEY, pets INTEGER NOT NULL)',
+    'CREATE TABLE IF NOT EXISTS pet_stats_owner_counts (pets INTEGER PRIMARY KEY, owners INTEGER NOT NULL)',
+)
+
+
+def _add(table: str, column: str, value: str, counter: str = 'pets') -> str:
+    # Pets without owner are not counted per owner, a NULL key would even get a
+    # generated one from SQLite's INTEGER PRIMARY KEY. The WHERE also keeps SQLite
+    # from reading ON CONFLICT as part of the SELECT.
+    return (
+        f'INSERT INTO {table} ({column}, {counter}) SELECT {value}, 1 WHERE {value} IS NOT NULL '
+        f'ON CONFLICT ({column}) DO UPDATE SET {counter} = {table}.{counter} + 1;'
+    )
+
+
+def _remove(table: str, column: str, value: str, counter: str = 'pets') -> str:
+    return (
+        f'UPDATE {table} SET {counter} = {counter} - 1 WHERE {column} = {value}; '
+        f'DELETE FROM {table} WHERE {column} = {value} AND {counter} <= 0;'
+    )
+
+
+def _add_pet(row: str) -> str:
+    return ' '.join((
+        _add('pet_stats_breeds', 'breed', f'{row}.breed'),
+        _add('pet_stats_ages', 'age', f'{row}.age'),
+        _add('pet_stats_owners', 'owner_id', f'{row}.owner_id'),
+    ))
+
+
+def _remove_pet(row: str) -> str:
+    return ' '.join((
+        _remove('pet_stats_breeds', 'breed', f'{row}.breed'),
+        _remove('pet_stats_ages', 'age', f'{row}.age'),
+        _remove('pet_stats_owners', 'owner_id', f'{row}.owner_id'),
+    ))
+
+
+def _add_owner(row: str) -> str:
+    return _add('pet_stats_owner_counts', 'pets', f'{row}.pets', 'owners')
+
+
+def _remove_owner(row: str) -> str:
+    return _remove('pet_stats_owner_counts', 'pets', f'{row}.pets', 'owners')
+
+
+def _changed(distinct: str) -> str:
+    # NULL safe, `<>` would miss a pet getting or losing its owner.
+    return ' OR '.join(f'old.{column} {distinct} new.{column}' for column in ('breed', 'age', 'owner_id'))
+
+
+SQLITE: tuple = (
+    f'CREATE TRIGGER IF NOT EXISTS pets_stats_insert AFTER INSERT ON pets BEGIN {_add_pet("new")} END',
+    f'CREATE TRIGGER IF NOT EXISTS pets_stats_delete AFTER DELETE ON pets BEGIN {_remove_pet("old")} END',
+    f'CREATE TRIGGER IF NOT EXISTS pets_stats_update AFTER UPDATE OF breed, age, owner_id ON pets '
+    f'WHEN {_changed("IS NOT")} BEGIN {_remove_pet("old")} {_add_pet("new")} END',
+    f'CREATE TRIGGER IF NOT EXISTS pet_stats_owners_insert AFTER INSERT ON pet_stats_owners '
+    f'BEGIN {_add_owner("new")} END',
+    f'CREATE TRIGGER IF NOT EXISTS pet_stats_owners_delete AFTER DELETE ON pet_stats_owners '
+    f'BEGIN {_remove_owner("old")} END',
+    f'CREATE TRIGGER IF NOT EXISTS pet_stats_owners_update AFTER UPDATE OF pets ON pet_stats_owners '
+    f'BEGIN {_remove_owner("old")} {_add_owner("new")} END',
+)
+
+POSTGRES: tuple = (
+    'CREATE OR REPLACE FUNCTION pets_stats_changed() RETURNS trigger AS $$ BEGIN '
+    f"IF TG_OP IN ('DELETE', 'UPDATE') THEN {_remove_pet('OLD')} END IF; "
+    f"IF TG_OP IN ('INSERT', 'UPDATE') THEN {_add_pet('NEW')} END IF; "
+    'RETURN NULL; END $$ LANGUAGE plpgsql',
+    'CREATE OR REPLACE FUNCTION pet_stats_owners_changed() RETURNS trigger AS $$ BEGIN '
+    f"IF TG_OP IN ('DELETE', 'UPDATE') THEN {_remove_owner('OLD')} END IF; "
+    f"IF TG_OP IN ('INSERT', 'UPDATE') THEN {_add_owner('NEW')} END IF; "
+    'RETURN NULL; END $$ LANGUAGE plpgsql',
+    'DROP TRIGGER IF EXISTS pets_stats_insert_delete ON pets',
+    'CREATE TRIGGER pets_stats_insert_delete AFTER INSERT OR DELETE ON pets '
+    'FOR EACH ROW EXECUTE FUNCTION pets_stats_changed()',
+    'DROP TRIGGER IF EXISTS pets_stats_update ON pets',
+    'CREATE TRIGGER pets_stats_update AFTER UPDATE OF breed, age, owner_id ON pets '
+    f'FOR EACH ROW WHEN ({_changed("IS DISTINCT FROM")}) EXECUTE FUNCTION pets_stats_changed()',
+    'DROP TRIGGER IF EXISTS pet_stats_owners_changed ON pet_stats_owners',
+    'CREATE TRIGGER pet_stats_owners_changed AFTER INSERT OR DELETE OR UPDATE OF pets ON pet_stats_owners '
+    'FOR EACH ROW EXECUTE FUNCTION pet_stats_owners_changed()',
+)
+
+
+def upgrade(connection: Connection) -> None:
+    triggers = SQLITE if connection.dialect.name == 'sqlite' else POSTGRES
+    for statement in TABLES + triggers:
+        connection.execute(sqlalchemy.text(statement))
+    # Counts the pets already there, the triggers keep them from now on.
+    rebuild(connection)
@@ -1,2 +1,3 @@
 from .user_model import User
 from .pet_model import Pet
+from .deletion_job_model import DeletionJob
@@ -0,0 +1,28 @@
+from datetime import datetime
+from typing import Optional
+
+import ormar
+
+from config import base_ormar_config
+from pets.db import utcnow
+
+
+PENDING: str = 'pending'
+RUNNING: str = 'running'
+DONE: str = 'done'
+FAILED: str = 'failed'
+
+
+class DeletionJob(ormar.Model):
+    ormar_config = base_ormar_config.copy(tablename='deletion_jobs')
+
+    id: int = ormar.Integer(primary_key=True)
+    # Not a foreign key, the job outlives the user it deletes.
+    user_id: int = ormar.Integer(index=True)
+    status: str = ormar.String(max_length=20, default=PENDING)
+    pets_total: int = ormar.Integer(default=0)
+    pets_deleted: int = ormar.Integer(default=0)
+    error: Optional[str] = ormar.Text(nullable=True)
+    lease_expires_at: Optional[datetime] = ormar.DateTime(nullable=True)
+    created_at: datetime = ormar.DateTime(default=utcnow)
+    updated_at: datetime = ormar.DateTime(default=utcnow)
@@ -1,15 +1,29 @@
+from datetime import datetime
+
 import ormar
+import sqlalchemy
 
 from config import base_ormar_config
+from pets.db import utcnow
 from .user_model import User
 
 
 
 class Pet(ormar.Model):
-    ormar_config = base_ormar_config.copy(tablename='pets')
+    ormar_config = base_ormar_config.copy(
+        tablename='pets',
+        # (column, id) serves both the filter on column and the keyset pagination sorted by it.
+        constraints=[
+            ormar.IndexColumns('breed', 'id', name='ix_pets_breed_id'),
+            ormar.IndexColumns('age', 'id', name='ix_pets_age_id'),
+            ormar.IndexColumns('name', 'id', name='ix_pets_name_id'),
+        ]
+    )
 
     id: int = ormar.Integer(primary_key=True)
     name: str = ormar.String(max_length=100)
     breed: str = ormar.String(max_length=100)
     age: int = ormar.Integer()
-    owner: User = ormar.ForeignKey(User, name='owner_id')
+    owner: User = ormar.ForeignKey(User, name='owner_id', index=True)
+    version: int = ormar.Integer(default=1, server_default='1')
+    updated_at: datetime = ormar.DateTime(default=utcnow, server_default=sqlalchemy.func.current_timestamp())
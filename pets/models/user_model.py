@@ -1,10 +1,18 @@
+from datetime import datetime
+
 import ormar
+import sqlalchemy
 
 from config import base_ormar_config
+from pets.db import utcnow
 
 class User(ormar.Model):
     ormar_config = base_ormar_config.copy(tablename='users')
 
     id: int = ormar.Integer(primary_key=True)
     name: str = ormar.String(max_length=100)
-    email: str = ormar.String(max_length=100)
+    email: str = ormar.String(max_length=100, unique=True, index=True)
+    # Set while a background job deletes the user and its pets, no pet can be added to it.
+    deleting: bool = ormar.Boolean(default=False, server_default=sqlalchemy.false())
+    version: int = ormar.Integer(default=1, server_default='1')
+    updated_at: datetime = ormar.DateTime(default=utcnow, server_default=sqlalchemy.func.current_timestamp())
@@ -0,0 +1,226 @@
+'''
+OpenAPI schema and Swagger UI, served from memory with ETags, precompressed
+variants and cache headers.
+
+The schema is generated at build time into `pets/openapi.json` by
+`python -m pets.commands.openapi`, a worker only loads that file. The same
+command with `--check` (and the test suite) fails when the file drifted from
+the controllers. Without the file the schema is generated at startup.
+
+URLs carrying `?v=<version>` of the current content are cached for a year,
+the Swagger page links the schema and its assets that way.
+'''
+import os
+import json
+import hashlib
+from typing import Any, Dict, Optional
+
+import yaml
+from starlette.requests import Request
+from starlette.responses import HTMLResponse, Response
+
+import cafeto
+from cafeto import App
+from cafeto.schema.openapi import create_schema
+
+from pets.compression import ENCODINGS, IDENTITY, compress, negotiate
+from pets.etags import etag_matches
+
+
+OPENAPI_VERSION: str = '3.0.1'
+SCHEMA_FILE: str = os.path.join(os.path.dirname(__file__), 'openapi.json')
+SWAGGER_ASSETS_DIR: str = os.path.join(os.path.dirname(cafeto.__file__), 'static', 'cafeto')
+SWAGGER_ASSETS: Dict[str, str] = {
+    'swagger-ui.css': 'text/css; charset=utf-8',
+    'swagger-ui-bundle.js': 'text/javascript; charset=utf-8',
+    'swagger-ui-standalone-preset.js': 'text/javascript; charset=utf-8',
+}
+
+IMMUTABLE: str = 'public, max-age=31536000, immutable'
+REVALIDATE: str = 'public, max-age=3600'
+
+SWAGGER_PAGE: str = '''<!DOCTYPE html>
+<html lang="en">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>Swagger UI</title>
+    <link rel="stylesheet" type="text/css" href="{css}">
+</head>
+<body>
+    <div id="swagger-ui"></div>
+    <script src="{bundle}"></script>
+    <script src="{preset}"></script>
+    <script>
+        window.onload = function() {{
+            const ui = SwaggerUIBundle({{
+                url: "{url}",
+                dom_id: '#swagger-ui',
+                presets: [
+                    SwaggerUIBundle.presets.apis,
+                    SwaggerUIStandalonePreset
+                ],
+                layout: "StandaloneLayout"
+            }});
+        }};
+    </script>
+</body>
+</html>
+'''
+
+
+class Asset:
+    '''
+    A response body kept in memory, with a version (content hash) and its
+    compressed variants, built on first use or by `precompress()`.
+    '''
+    def __init__(self, body: bytes, media_type: str, fast: bool = False):
+        self.body: bytes = body
+        self.media_type: str = media_type
+        self.fast: bool = fast
+        self.version: str = hashlib.blake2b(body, digest_size=8).hexdigest()
+        self._variants: Dict[str, bytes] = {IDENTITY: body}
+
+    def etag(self, encoding: str = IDENTITY) -> str:
+        # Every encoding is a different representation, with its own strong ETag.
+        return f'"{self.version}"' if encoding == IDENTITY else f'"{self.version}-{encoding}"'
+
+    def variant(self, encoding: str) -> bytes:
+        body = self._variants.get(encoding)
+        if body is None:
+            body = self._variants[encoding] = compress(self.body, encoding, self.fast)
+        return body
+
+    def precompress(self) -> None:
+        for encoding in ENCODINGS:
+            self.variant(encoding)
+
+    def url(self, path: str) -> str:
+        return f'{path}?v={self.version}'
+
+    def response(self, request: Request) -> Response:
+        encoding = negotiate(request.headers.get('accept-encoding'))
+        etag = self.etag(encoding)
+        headers = {
+            'ETag': etag,
+            'Vary': 'Accept-Encoding',
+            'Cache-Control': IMMUTABLE if request.query_params.get('v') == self.version else REVALIDATE,
+        }
+        if etag_matches(request.headers.get('if-none-match'), etag):
+            return Response(status_code=304, headers=headers)
+        if encoding != IDENTITY:
+            headers['Content-Encoding'] = encoding
+        return Response(self.variant(encoding), media_type=self.media_type, headers=headers)
+
+
+def generate_schema(app: App) -> Dict[str, Any]:
+    # Through JSON, so the response codes are string keys as in the file.
+    return json.loads(json.dumps(create_schema(app, OPENAPI_VERSION, None, None, None)))
+
+
+def dump_schema(schema: Dict[str, Any]) -> str:
+    return json.dumps(schema, indent=2, ensure_ascii=False) + '\n'
+
+
+def load_schema(app: App, path: str = SCHEMA_FILE) -> Dict[str, Any]:
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as file:
+            return json.load(file)
+    return generate_schema(app)
+
+
+class OpenApiDocument:
+    '''
+    The schema as JSON and YAML assets. `render()` is called by the lifespan, so a
+    worker has both compressed before its first request.
+    '''
+    def __init__(self, schema: Dict[str, Any]):
+        self.schema: Dict[str, Any] = schema
+        self.json: Asset = Asset(
+            json.dumps(schema, ensure_ascii=False, allow_nan=False, separators=(',', ':')).encode('utf-8'),
+            'application/json'
+        )
+        self._yaml: Optional[Asset] = None
+
+    @property
+    def yaml(self) -> Asset:
+        if self._yaml is None:
+            self._yaml = Asset(
+                yaml.dump(self.schema, sort_keys=False, indent=2).encode('utf-8'),
+                'text/plain; charset=utf-8'
+            )
+        return self._yaml
+
+    def render(self) -> None:
+        self.json.precompress()
+        self.yaml.precompress()
+
+
+class SwaggerUi:
+    '''
+    The Swagger page and its assets, read from the cafeto package on first use.
+    Served under /schema/assets, /static/cafeto is shadowed by the app's /static mount.
+    '''
+    def __init__(self, document: OpenApiDocument):
+        self.document: OpenApiDocument = document
+        self._assets: Dict[str, Asset] = {}
+        self._page: Optional[Asset] = None
+
+    def asset(self, name: str) -> Optional[Asset]:
+        if name not in SWAGGER_ASSETS:
+            return None
+        asset = self._assets.get(name)
+        if asset is None:
+            with open(os.path.join(SWAGGER_ASSETS_DIR, name), 'rb') as file:
+                asset = self._assets[name] = Asset(file.read(), SWAGGER_ASSETS[name], fast=True)
+        return asset
+
+    @property
+    def page(self) -> Asset:
+        if self._page is None:
+            html = SWAGGER_PAGE.format(
+                css=self.asset('swagger-ui.css').url('/schema/assets/swagger-ui.css'),
+                bundle=self.asset('swagger-ui-bundle.js').url('/schema/assets/swagger-ui-bundle.js'),
+                preset=self.asset('swagger-ui-standalone-preset.js').url('/schema/assets/swagger-ui-standalone-preset.js'),
+                url=self.document.yaml.url('/schema/openapi.yaml')
+            )
+            self._page = Asset(html.encode('utf-8'), 'text/html; charset=utf-8')
+        return self._page
+
+
+def use_schema(app: App) -> OpenApiDocument:
+    '''
+    Same routes as `App.use_schema`, served from an `OpenApiDocument` kept in `app.state.openapi`.
+    '''
+    document = OpenApiDocument(load_schema(app))
+
+    async def openapi_json(request: Request) -> Response:
+        return document.json.response(request)
+
+    async def openapi_yaml(request: Request) -> Response:
+        return document.yaml.response(request)
+
+    app.add_route('/schema/openapi.json', openapi_json, methods=['GET'])
+    app.add_route('/schema/openapi.yaml', openapi_yaml, methods=['GET'])
+    app.state.openapi = document
+    return document
+
+
+def use_swagger(app: App, document: OpenApiDocument) -> SwaggerUi:
+    '''
+    Same page as `App.use_swagger`, with the assets served by the app itself.
+    '''
+    swagger = SwaggerUi(document)
+
+    async def swagger_page(request: Request) -> Response:
+        return swagger.page.response(request)
+
+    async def swagger_asset(request: Request) -> Response:
+        asset = swagger.asset(request.path_params['name'])
+        if asset is None:
+            return HTMLResponse('Not Found', status_code=404)
+        return asset.response(request)
+
+    app.add_route('/schema/swagger-ui.html', swagger_page, methods=['GET'])
+    app.add_route('/schema/assets/{name}', swagger_asset, methods=['GET'])
+    return swagger
@@ -0,0 +1,118 @@
+import asyncio
+from typing import Any, Dict, Optional
+
+from databases.core import Connection
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+
+from cafeto.errors import Error, format_errors
+
+from pets.errors import PoolExhausted
+from pets.metrics import InstrumentedDatabase
+
+
+class PoolLimiter:
+    '''
+    Caps the connections checked out by the async `Database`. A request that
+    waits longer than `acquire_timeout` for one gets `PoolExhausted`, instead of
+    queuing forever behind the driver's own pool.
+    '''
+    def __init__(self, max_size: int, acquire_timeout: float):
+        self.max_size: int = max_size
+        self.acquire_timeout: float = acquire_timeout
+        self.in_use: int = 0
+        self.waiting: int = 0
+        self.timeouts: int = 0
+        self._semaphore: asyncio.Semaphore = asyncio.Semaphore(max_size)
+
+    async def acquire(self) -> None:
+        if not self._semaphore.locked():
+            await self._semaphore.acquire()
+        else:
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), self.acquire_timeout)
+            except asyncio.TimeoutError:
+                self.timeouts += 1
+                raise PoolExhausted()
+            finally:
+                self.waiting -= 1
+        self.in_use += 1
+
+    def release(self) -> None:
+        self.in_use -= 1
+        self._semaphore.release()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'max_size': self.max_size,
+            'in_use': self.in_use,
+            'waiting': self.waiting,
+            'timeouts': self.timeouts
+        }
+
+
+class _LimitedBackendConnection:
+    def __init__(self, connection: Any, database: 'PooledDatabase'):
+        self._connection: Any = connection
+        self._database: PooledDatabase = database
+        self._limiter: Optional[PoolLimiter] = None
+
+    async def acquire(self) -> None:
+        self._limiter = self._database.limiter
+        await self._limiter.acquire()
+        try:
+            await self._connection.acquire()
+        except BaseException:
+            self._limiter.release()
+            raise
+
+    async def release(self) -> None:
+        try:
+            await self._connection.release()
+        finally:
+            self._limiter.release()
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._connection, name)
+
+
+class PooledDatabase(InstrumentedDatabase):
+    '''
+    `InstrumentedDatabase` whose connections are checked out through a `PoolLimiter`.
+    '''
+    def __init__(self, url: str, *, limiter: PoolLimiter, slow_query_ms: Optional[float] = None, **options: Any):
+        super().__init__(url, slow_query_ms=slow_query_ms, **options)
+        self.limiter: PoolLimiter = limiter
+
+    def connection(self) -> Connection:
+        if self._global_connection is not None:
+            return self._global_connection
+
+        try:
+            return self._connection_context.get()
+        except LookupError:
+            connection = Connection(self._backend)
+            connection._connection = _LimitedBackendConnection(connection._connection, self)
+            self._connection_context.set(connection)
+            return connection
+
+    async def warm_up(self) -> None:
+        '''
+        Runs a first query, so an unreachable database fails the worker at startup.
+        '''
+        await self.fetch_val('SELECT 1')
+
+    def in_transaction(self) -> bool:
+        if self._global_connection is not None:
+            return True
+        connection = self._connection_context.get(None)
+        return connection is not None and bool(connection._transaction_stack)
+
+
+async def pool_exhausted_handler(request: Request, exc: PoolExhausted) -> JSONResponse:
+    return JSONResponse(
+        format_errors([Error('pool-exhausted', exc.msg)]),
+        status_code=503,
+        headers={'Retry-After': '1'}
+    )
@@ -0,0 +1,178 @@
+import time
+import inspect
+import functools
+from contextvars import ContextVar
+from typing import Any, AsyncGenerator, Callable, List, Optional
+
+from starlette.datastructures import MutableHeaders
+from starlette.requests import HTTPConnection
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from pets.pool import PooledDatabase
+
+
+ROUND_ROBIN: str = 'round_robin'
+LEAST_BUSY: str = 'least_busy'
+
+LAST_WRITE_COOKIE: str = 'pets_last_write'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+_read_only: ContextVar[bool] = ContextVar('read_only', default=False)
+_pinned: ContextVar[bool] = ContextVar('pinned', default=False)
+
+
+class ReplicaSet:
+    '''
+    Read replicas of the primary database. `round_robin` takes them in turn,
+    `least_busy` the one with the fewest connections checked out.
+    '''
+    def __init__(self, replicas: List[PooledDatabase], strategy: str = ROUND_ROBIN, pin_seconds: float = 0):
+        if strategy not in (ROUND_ROBIN, LEAST_BUSY):
+            raise ValueError(f'Unknown replica strategy: {strategy}')
+        self.replicas: List[PooledDatabase] = replicas
+        self.strategy: str = strategy
+        self.pin_seconds: float = pin_seconds
+        self._next: int = 0
+
+    def __bool__(self) -> bool:
+        return bool(self.replicas)
+
+    def pick(self) -> PooledDatabase:
+        if self.strategy == LEAST_BUSY:
+            return min(self.replicas, key=lambda replica: replica.limiter.in_use)
+        replica = self.replicas[self._next % len(self.replicas)]
+        self._next += 1
+        return replica
+
+
+class RoutedDatabase(PooledDatabase):
+    '''
+    Primary database that hands the reads of `read_replica` methods to a replica.
+
+    Queries stay on the primary inside `database.transaction()`, and for
+    clients pinned by `ReadYourWritesMiddleware`.
+    '''
+    def __init__(self, url: str, *, replicas: Optional[ReplicaSet] = None, **options: Any):
+        super().__init__(url, **options)
+        self.replicas: ReplicaSet = replicas or ReplicaSet([])
+
+    def _reader(self) -> Optional[PooledDatabase]:
+        if not self.replicas or not _read_only.get() or _pinned.get() or self.in_transaction():
+            return None
+        return self.replicas.pick()
+
+    async def connect(self) -> None:
+        await super().connect()
+        for replica in self.replicas.replicas:
+            await replica.connect()
+
+    async def warm_up(self) -> None:
+        await super().warm_up()
+        for replica in self.replicas.replicas:
+            await replica.warm_up()
+
+    async def disconnect(self) -> None:
+        for replica in self.replicas.replicas:
+            await replica.disconnect()
+        await super().disconnect()
+
+    async def fetch_all(self, query: Any, values: Optional[dict] = None) -> List[Any]:
+        reader = self._reader()
+        if reader is not None:
+            return await reader.fetch_all(query, values)
+        return await super().fetch_all(query, values)
+
+    async def fetch_one(self, query: Any, values: Optional[dict] = None) -> Optional[Any]:
+        reader = self._reader()
+        if reader is not None:
+            return await reader.fetch_one(query, values)
+        return await super().fetch_one(query, values)
+
+    async def fetch_val(self, query: Any, values: Optional[dict] = None, column: Any = 0) -> Any:
+        reader = self._reader()
+        if reader is not None:
+            return await reader.fetch_val(query, values, column=column)
+        return await super().fetch_val(query, values, column=column)
+
+    async def iterate(self, query: Any, values: Optional[dict] = None) -> AsyncGenerator[Any, None]:
+        reader = self._reader()
+        source = reader.iterate(query, values) if reader is not None else super().iterate(query, values)
+        async for record in source:
+            yield record
+
+
+def pinned() -> bool:
+    '''
+    Whether the current request reads from the primary to see its own writes.
+    '''
+    return _pinned.get()
+
+
+def read_replica(method: Callable) -> Callable:
+    '''
+    Lets the queries of a read-only service method run on a replica.
+    '''
+    if inspect.isasyncgenfunction(method):
+        @functools.wraps(method)
+        async def generator_wrapper(*args, **kwargs):
+            items = method(*args, **kwargs)
+            while True:
+                token = _read_only.set(True)
+                try:
+                    item = await items.__anext__()
+                except StopAsyncIteration:
+                    return
+                finally:
+                    _read_only.reset(token)
+                yield item
+        return generator_wrapper
+
+    @functools.wraps(method)
+    async def wrapper(*args, **kwargs):
+        token = _read_only.set(True)
+        try:
+            return await method(*args, **kwargs)
+        finally:
+            _read_only.reset(token)
+    return wrapper
+
+
+class ReadYourWritesMiddleware:
+    '''
+    Pins a client to the primary for `pin_seconds` after it wrote, so it reads
+    its own changes even while the replicas lag behind. The time of the last
+    write travels in a cookie, which works across workers.
+    '''
+    def __init__(self, app: ASGIApp, database: RoutedDatabase):
+        self.app: ASGIApp = app
+        self.database: RoutedDatabase = database
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        pin_seconds = self.database.replicas.pin_seconds
+        if scope['type'] != 'http' or not self.database.replicas or pin_seconds <= 0:
+            await self.app(scope, receive, send)
+            return
+
+        now = time.time()
+        try:
+            last_write = float(HTTPConnection(scope).cookies.get(LAST_WRITE_COOKIE, 0))
+        except ValueError:
+            last_write = 0
+        token = _pinned.set(now - last_write < pin_seconds)
+
+        async def send_with_cookie(message: Message) -> None:
+            if (
+                message['type'] == 'http.response.start'
+                and scope['method'] not in SAFE_METHODS
+                and message['status'] < 400
+            ):
+                MutableHeaders(scope=message).append(
+                    'Set-Cookie',
+                    f'{LAST_WRITE_COOKIE}={now}; Max-Age={int(pin_seconds) + 1}; Path=/; HttpOnly; SameSite=Lax'
+                )
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_cookie)
+        finally:
+            _pinned.reset(token)
@@ -0,0 +1,68 @@
+'''
+Ranked search over pet names and breeds, on the index created by the
+`v0004_search` migration.
+
+A query is split into words, words shorter than a trigram are ignored. On
+SQLite a row matches when it contains a word (prefix or substring) or any of
+its trigrams (fuzzy), bm25 ranks the rows sharing more and rarer trigrams
+first. On Postgres pg_trgm's word similarity does the same. Names starting
+with the first word always come first.
+'''
+import re
+from typing import List
+
+import sqlalchemy
+from sqlalchemy.sql.elements import TextClause
+
+
+MIN_TERM_LENGTH: int = 3
+# Ranked results are paged by offset, deep pages get expensive.
+MAX_SEARCH_RESULTS: int = 1000
+# The name counts twice as much as the breed.
+SQLITE_RANK: str = 'bm25(pets_search, 2.0, 1.0)'
+POSTGRES_DOCUMENT: str = "(pets.name || ' ' || pets.breed)"
+
+
+def search_terms(q: str) -> List[str]:
+    words = re.findall(r'[^\W_]+', q.lower())
+    return list(dict.fromkeys(word for word in words if len(word) >= MIN_TERM_LENGTH))
+
+
+def trigrams(word: str) -> List[str]:
+    return [word[index:index + 3] for index in range(len(word) - 2)]
+
+
+def fts_match(terms: List[str]) -> str:
+    '''
+    FTS5 MATCH expression, each word as a whole and each of its trigrams.
+    '''
+    tokens: List[str] = []
+    for term in terms:
+        tokens.append(term)
+        tokens.extend(trigrams(term))
+    return ' OR '.join('"' + token.replace('"', '""') + '"' for token in dict.fromkeys(tokens))
+
+
+def search_query(
+        table: sqlalchemy.Table,
+        dialect: str,
+        terms: List[str],
+        limit: int,
+        offset: int
+        ) -> TextClause:
+    columns = ', '.join(f'pets.{column}' for column in table.columns.keys())
+    if dialect == 'sqlite':
+        query = sqlalchemy.text(
+            f'SELECT {columns} FROM pets_search JOIN pets ON pets.id = pets_search.rowid '
+            f'WHERE pets_search MATCH :match '
+            f'ORDER BY pets.name LIKE :prefix DESC, {SQLITE_RANK}, pets.id '
+            f'LIMIT :limit OFFSET :offset'
+        ).bindparams(match=fts_match(terms))
+    else:
+        query = sqlalchemy.text(
+            f'SELECT {columns} FROM pets '
+            f'WHERE :q <% {POSTGRES_DOCUMENT} '
+            f'ORDER BY pets.name ILIKE :prefix DESC, word_similarity(:q, {POSTGRES_DOCUMENT}) DESC, pets.id '
+            f'LIMIT :limit OFFSET :offset'
+        ).bindparams(q=' '.join(terms))
+    return query.bindparams(prefix=f'{terms[0]}%', limit=limit, offset=offset).columns(*table.columns)
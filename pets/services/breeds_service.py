@@ -2,9 +2,7 @@ from abc import ABC
 from typing import List
 
 from config import app
-from cafeto.responses.codes import CODE_200_OK
-
-import httpx
+from pets.breeds import breeds_catalog
 
 
 class ABreedsService(ABC):
@@ -13,15 +11,8 @@ class ABreedsService(ABC):
 
 
 class BreedsService(ABreedsService):
-    async def list_by_breed(self, base_url: str, breed: str) -> List[str]:  # pragma: no cover
-        json_url = f"{base_url}static/breeds.json"
-
-        async with httpx.AsyncClient() as client:
-            response = await client.get(json_url)
-            if response.status_code == CODE_200_OK.value:
-                breeds = response.json()
-                return breeds.get(breed, [])
-            raise Exception('Breeds file not found')
+    async def list_by_breed(self, base_url: str, breed: str) -> List[str]:
+        return list(breeds_catalog.get(breed))
 
 
 app.add_scoped(ABreedsService, BreedsService)
@@ -0,0 +1,12 @@
+from typing import Any, Dict, List
+
+from cafeto.errors import Error
+
+import pets.dtos as dtos
+
+
+def bulk_response(size: int, data: Dict[int, Any], errors: Dict[int, List[Error]]) -> dtos.BulkResponseDto:
+    return dtos.BulkResponseDto(results=[
+        dtos.BulkItemResultDto(index=index, data=data.get(index), errors=errors.get(index, []))
+        for index in range(size)
+    ])
@@ -0,0 +1,149 @@
+import json
+import base64
+import binascii
+from typing import Any, AsyncIterator, Dict, List, Mapping, NamedTuple, Optional, Sequence, Tuple
+
+import ormar
+from ormar import QuerySet
+
+from pets.db import fetch_rows
+from pets.errors import InvalidCursor, InvalidFields, InvalidSort
+
+
+DEFAULT_PAGE_SIZE: int = 50
+MAX_PAGE_SIZE: int = 500
+EXPORT_BATCH_SIZE: int = 1000
+
+
+class Sort(NamedTuple):
+    column: str
+    descending: bool = False
+
+    def __str__(self) -> str:
+        return f'-{self.column}' if self.descending else self.column
+
+
+ID_SORT: Sort = Sort('id')
+
+
+def page_size(limit: Optional[int]) -> int:
+    if limit is None:
+        return DEFAULT_PAGE_SIZE
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+
+def parse_sort(sort: Optional[str], sortable: Sequence[str]) -> Sort:
+    '''
+    Parses `column` or `-column`. Only indexed columns are sortable, so a page
+    never needs a full scan and sort of the table.
+    '''
+    if not sort:
+        return ID_SORT
+    column = sort[1:] if sort.startswith('-') else sort
+    if column not in sortable:
+        raise InvalidSort(f'Can not sort by {column}, sortable fields are {", ".join(sortable)}')
+    return Sort(column, sort.startswith('-'))
+
+
+def parse_fields(fields: Optional[str], selectable: Sequence[str]) -> Optional[List[str]]:
+    if not fields:
+        return None
+    names = [name.strip() for name in fields.split(',') if name.strip()]
+    unknown = [name for name in names if name not in selectable]
+    if unknown or not names:
+        raise InvalidFields(f'Unknown fields {", ".join(unknown)}, selectable fields are {", ".join(selectable)}')
+    return list(dict.fromkeys(names))
+
+
+def encode_cursor(last_id: int, sort: Sort = ID_SORT, value: Any = None) -> str:
+    cursor: Dict[str, Any] = {'id': last_id}
+    if sort != ID_SORT:
+        cursor.update({'sort': str(sort), 'value': value})
+    raw = json.dumps(cursor, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).rstrip(b'=').decode('ascii')
+
+
+def decode_cursor(cursor: str, sort: Sort = ID_SORT) -> Tuple[int, Any]:
+    '''
+    Returns the id and sort value of the last row of the previous page. A cursor
+    only continues the sort it was created for.
+    '''
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        data = json.loads(raw)
+        last_id = data['id']
+    except (binascii.Error, ValueError, TypeError, KeyError):
+        raise InvalidCursor()
+    if not isinstance(last_id, int) or data.get('sort', str(ID_SORT)) != str(sort):
+        raise InvalidCursor()
+    return last_id, data.get('value')
+
+
+def encode_offset_cursor(offset: int, key: str) -> str:
+    raw = json.dumps({'offset': offset, 'key': key}, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).rstrip(b'=').decode('ascii')
+
+
+def decode_offset_cursor(cursor: str, key: str) -> int:
+    '''
+    Offset of the next page of a ranked result, which has no stable column to
+    continue from. A cursor only continues the query (`key`) it was created for.
+    '''
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        data = json.loads(raw)
+        offset = data['offset']
+    except (binascii.Error, ValueError, TypeError, KeyError):
+        raise InvalidCursor()
+    if not isinstance(offset, int) or offset < 0 or data.get('key') != key:
+        raise InvalidCursor()
+    return offset
+
+
+async def keyset_page(
+        queryset: QuerySet,
+        limit: Optional[int],
+        after: Optional[str],
+        sort: Sort = ID_SORT
+        ) -> Tuple[List[Mapping[str, Any]], Optional[str]]:
+    '''
+    Fetches one page ordered by `sort` then id, and the cursor of the next page.
+    The queryset must not join anything that multiplies rows.
+    '''
+    limit = page_size(limit)
+    direction = '-' if sort.descending else ''
+    order = [f'{direction}id'] if sort.column == 'id' else [f'{direction}{sort.column}', f'{direction}id']
+    query = queryset.order_by(order).limit(limit + 1, limit_raw_sql=True)
+
+    if after is not None:
+        last_id, value = decode_cursor(after, sort)
+        after_op = 'lt' if sort.descending else 'gt'
+        if sort.column == 'id':
+            query = query.filter(**{f'id__{after_op}': last_id})
+        else:
+            query = query.filter(ormar.or_(
+                ormar.and_(**{sort.column: value, f'id__{after_op}': last_id}),
+                **{f'{sort.column}__{after_op}': value}
+            ))
+
+    rows: List[Mapping[str, Any]] = await fetch_rows(query)
+    next_cursor: Optional[str] = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]['id'], sort, rows[-1][sort.column])
+    return rows, next_cursor
+
+
+async def iterate_batches(queryset: QuerySet, batch_size: Optional[int] = None) -> AsyncIterator[List[Mapping[str, Any]]]:
+    batch_size = batch_size or EXPORT_BATCH_SIZE
+    last_id: Optional[int] = None
+    while True:
+        query = queryset.order_by('id').limit(batch_size)
+        if last_id is not None:
+            query = query.filter(id__gt=last_id)
+        rows: List[Mapping[str, Any]] = await fetch_rows(query)
+        if rows:
+            yield rows
+        if len(rows) < batch_size:
+            return
+        last_id = rows[-1]['id']
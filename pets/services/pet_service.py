@@ -1,55 +1,308 @@
 from __future__ import annotations
-from typing import List, Optional, overload
+from typing import Any, AsyncIterator, Dict, List, Mapping, Optional, Set, Tuple, Union, overload
 from abc import ABC
 
-from pets.models import Pet
+from ormar import QuerySet
+from cafeto.errors import Error
+
+from pets.models import Pet, User
+from pets.cache import cache, cache_key
 from config import app, database
 
 import pets.dtos as dtos
-from pets.errors import PetNotFound
+from pets.errors import PetNotFound, InvalidFields, InvalidQuery, NotModified, VersionMismatch
+from pets.encoders import encoder
+from pets.etags import etag_matches, page_etag
+from pets.replicas import read_replica
+from pets.singleflight import single_flight
+from pets.db import (
+    delete_returning, fetch_row, insert_many, relation_prefix, update_many_versioned, update_versioned
+)
+from pets.search import MAX_SEARCH_RESULTS, MIN_TERM_LENGTH, search_query, search_terms
+from pets.services.bulk import bulk_response
+from pets.stats import STATS_QUERY, summarize
+from pets.services.pagination import (
+    decode_offset_cursor, encode_offset_cursor, iterate_batches, keyset_page, page_size, parse_fields, parse_sort
+)
+
+
+PET_SORTABLE: Tuple[str, ...] = ('id', 'name', 'breed', 'age')
+PET_FIELDS: Tuple[str, ...] = ('id', 'name', 'breed', 'age', 'owner')
+# Sorts after every character, `prefix + MAX_CHAR` bounds the names starting with `prefix`.
+MAX_CHAR: str = '\U0010ffff'
 
 
 class APetService(ABC):
     async def retrieve(self, id: int) -> dtos.PetResponseDto: ...
 
-    async def list(self) -> list[dtos.PetResponseDto]: ...
+    async def retrieve_with_owner(self, id: int) -> dtos.PetWithOwnerResponseDto: ...
+
+    async def list(
+        self,
+        limit: Optional[int] = None,
+        after: Optional[str] = None,
+        with_owner: bool = False,
+        filters: Optional[dtos.PetFilterDto] = None,
+        sort: Optional[str] = None,
+        fields: Optional[str] = None,
+        if_none_match: Optional[str] = None
+    ) -> Union[dtos.RowPage, dtos.PetWithOwnerPageDto, dtos.PartialPageDto]: ...
+
+    def stream(self, filters: Optional[dtos.PetFilterDto] = None) -> AsyncIterator[bytes]: ...
+
+    async def search(self, q: str, limit: Optional[int] = None, after: Optional[str] = None) -> dtos.RowPage: ...
+
+    async def stats(self) -> dtos.PetStatsDto: ...
 
     async def create(self, pet: dtos.PetCreateRequestDto) -> dtos.PetResponseDto: ...
 
-    async def update(self, id: int, pet: dtos.PetUpdateRequestDto) -> dtos.PetResponseDto: ...
+    async def update(
+        self,
+        id: int,
+        pet: dtos.PetUpdateRequestDto,
+        version: Optional[int] = None
+    ) -> dtos.PetResponseDto: ...
 
     async def delete(self, pet_id: int) -> None: ...
 
+    async def bulk_create(self, pets: dtos.PetBulkCreateRequestDto) -> dtos.BulkResponseDto: ...
+
+    async def bulk_update(self, pets: dtos.PetBulkUpdateRequestDto) -> dtos.BulkResponseDto: ...
+
+    async def bulk_delete(self, pets: dtos.BulkDeleteRequestDto) -> dtos.BulkResponseDto: ...
+
 
 class PetServiceDB(APetService):
+    @cache.cached('pet')
+    @single_flight.coalesce
+    @read_replica
     async def retrieve(self, id: int) -> dtos.PetResponseDto:
-        pet: Optional[Pet] = await Pet.objects.filter(id=id).first_or_none()
-        if pet:
-            return dtos.PetResponseDto(**pet.model_dump())
+        row = await fetch_row(Pet.objects.filter(id=id))
+        if row:
+            return dtos.PetResponseDto.from_row(row)
+        raise PetNotFound('Pet not found')
+
+    @read_replica
+    async def retrieve_with_owner(self, id: int) -> dtos.PetWithOwnerResponseDto:
+        row = await fetch_row(Pet.objects.select_related('owner').filter(id=id))
+        if row:
+            return dtos.PetWithOwnerResponseDto.from_joined_row(row, relation_prefix(Pet, 'owner'))
         raise PetNotFound('Pet not found')
 
-    async def list(self) -> list[dtos.PetResponseDto]:
-        pets: List[Pet] = await Pet.objects.all()
-        return [dtos.PetResponseDto(**pet.model_dump()) for pet in pets]
+    @read_replica
+    async def list(
+        self,
+        limit: Optional[int] = None,
+        after: Optional[str] = None,
+        with_owner: bool = False,
+        filters: Optional[dtos.PetFilterDto] = None,
+        sort: Optional[str] = None,
+        fields: Optional[str] = None,
+        if_none_match: Optional[str] = None
+    ) -> Union[dtos.RowPage, dtos.PetWithOwnerPageDto, dtos.PartialPageDto]:
+        '''
+        Raises NotModified when `if_none_match` matches the ETag of the page, before any DTO is built.
+        '''
+        order = parse_sort(sort, PET_SORTABLE)
+        columns = parse_fields(fields, PET_FIELDS)
+        if columns is not None and with_owner:
+            raise InvalidFields('fields can not be combined with expand')
+
+        query = self.__filter(Pet.objects, filters)
+        if with_owner:
+            # The owner join can not add rows, so keyset_page can put the LIMIT on the joined query.
+            query = query.select_related('owner')
+        if columns is not None:
+            # The cursor needs the id and the sort column, the ETag the version, even when they are not requested.
+            query = query.fields(list(dict.fromkeys(['id', order.column, 'version', *columns])))
+        rows, next_cursor = await keyset_page(query, limit, after, order)
+
+        owner = relation_prefix(Pet, 'owner')
+        versions: List[Tuple[int, int]] = []
+        for row in rows:
+            versions.append((row['id'], row['version']))
+            if with_owner:
+                versions.append((row['owner_id'], row[f'{owner}_version']))
+        etag = page_etag(versions, next_cursor)
+        if etag_matches(if_none_match, etag):
+            raise NotModified(etag)
+
+        if columns is not None:
+            return dtos.PartialPageDto(
+                data=[self.__project(row, columns) for row in rows],
+                next_cursor=next_cursor,
+                etag=etag
+            )
+        if with_owner:
+            return dtos.PetWithOwnerPageDto(
+                data=[dtos.PetWithOwnerResponseDto.from_joined_row(row, owner) for row in rows],
+                next_cursor=next_cursor,
+                etag=etag
+            )
+        return dtos.RowPage(dtos.PetPageDto, dtos.PetResponseDto, rows, next_cursor, etag)
+
+    @read_replica
+    async def stream(self, filters: Optional[dtos.PetFilterDto] = None) -> AsyncIterator[bytes]:
+        async for rows in iterate_batches(self.__filter(Pet.objects, filters)):
+            yield encoder.encode_lines(dtos.PetResponseDto, rows)
+
+    @read_replica
+    async def search(self, q: str, limit: Optional[int] = None, after: Optional[str] = None) -> dtos.RowPage:
+        '''
+        Ranked matches of `q` in names and breeds (see pets.search), paged by offset
+        up to MAX_SEARCH_RESULTS. The index is kept in sync by the database itself.
+        '''
+        terms = search_terms(q or '')
+        if not terms:
+            raise InvalidQuery(f'q needs a word of at least {MIN_TERM_LENGTH} characters')
+        key = ' '.join(terms)
+        offset = decode_offset_cursor(after, key) if after is not None else 0
+        limit = min(page_size(limit), MAX_SEARCH_RESULTS - offset)
+        if limit <= 0:
+            return dtos.RowPage(dtos.PetPageDto, dtos.PetResponseDto, [])
+
+        query = search_query(Pet.ormar_config.table, database.url.dialect, terms, limit + 1, offset)
+        rows = [row._mapping for row in await database.fetch_all(query)]
+        next_cursor: Optional[str] = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            if offset + limit < MAX_SEARCH_RESULTS:
+                next_cursor = encode_offset_cursor(offset + limit, key)
+        return dtos.RowPage(dtos.PetPageDto, dtos.PetResponseDto, rows, next_cursor)
+
+    @read_replica
+    async def stats(self) -> dtos.PetStatsDto:
+        '''
+        From the aggregate tables kept by the database (see pets.stats), not from the pets.
+        '''
+        rows = await database.fetch_all(STATS_QUERY)
+        return dtos.PetStatsDto(**summarize([row._mapping for row in rows]))
 
     async def create(self, pet_request: dtos.PetCreateRequestDto) -> dtos.PetResponseDto:
         pet: Optional[Pet] = await Pet.objects.create(**pet_request.model_dump())
         return dtos.PetResponseDto(**pet.model_dump())
 
-    async def update(self, id: int, pet_request: dtos.PetUpdateRequestDto) -> dtos.PetResponseDto:
-        async with database.transaction():
-            pet = await Pet.objects.filter(id=id).first_or_none()
-            if pet is None:
-                raise PetNotFound('Pet not found')
-            await pet.update(**pet_request.model_dump())
-            return dtos.PetResponseDto(**pet.model_dump())
+    async def update(
+        self,
+        id: int,
+        pet_request: dtos.PetUpdateRequestDto,
+        version: Optional[int] = None
+    ) -> dtos.PetResponseDto:
+        '''
+        One UPDATE ... RETURNING, guarded by `version` when given (If-Match).
+        '''
+        row = await update_versioned(Pet.ormar_config.table, id, self.__columns(pet_request), version)
+        if row is None:
+            if version is not None and await Pet.objects.filter(id=id).exists():
+                raise VersionMismatch()
+            raise PetNotFound('Pet not found')
+        await cache.invalidate(cache_key('pet', id))
+        return dtos.PetResponseDto.from_row(row)
 
     async def delete(self, pet_id: int) -> None:
-        async with database.transaction():
-            pet_exists: bool = await Pet.objects.filter(id=pet_id).exists()
-            if not pet_exists:
-                raise PetNotFound('Pet not found')
-            await Pet.objects.delete(id=pet_id)
+        if not await delete_returning(Pet.ormar_config.table, 'id', [pet_id]):
+            raise PetNotFound('Pet not found')
+        await cache.invalidate(cache_key('pet', pet_id))
+
+
+    async def bulk_create(self, pets_request: dtos.PetBulkCreateRequestDto) -> dtos.BulkResponseDto:
+        items = pets_request.items
+        owners: Set[int] = await self.__existing_owners([item.owner.id for item in items])
+
+        errors: Dict[int, List[Error]] = {}
+        valid: List[int] = []
+        for index, item in enumerate(items):
+            if item.owner.id not in owners:
+                errors[index] = [Error('owner-not-found', 'Owner not found', 'owner')]
+            else:
+                valid.append(index)
+
+        data: Dict[int, dtos.PetResponseDto] = {}
+        if valid:
+            rows = [
+                {'name': items[index].name, 'breed': items[index].breed, 'age': items[index].age,
+                 'owner_id': items[index].owner.id}
+                for index in valid
+            ]
+            async with database.transaction():
+                ids = await insert_many(Pet.ormar_config.table, rows)
+            for index, id in zip(valid, ids):
+                data[index] = dtos.PetResponseDto(id=id, **items[index].model_dump())
+
+        return bulk_response(len(items), data, errors)
+
+    async def bulk_update(self, pets_request: dtos.PetBulkUpdateRequestDto) -> dtos.BulkResponseDto:
+        items = pets_request.items
+        owners: Set[int] = await self.__existing_owners([item.owner.id for item in items])
+        existing: Set[int] = set(
+            await Pet.objects.filter(id__in=[item.id for item in items]).values_list('id', flatten=True)
+        )
+
+        errors: Dict[int, List[Error]] = {}
+        valid: List[int] = []
+        for index, item in enumerate(items):
+            if item.id not in existing:
+                errors[index] = [Error('pet-not-found', 'Pet not found', '__model__')]
+            elif item.owner.id not in owners:
+                errors[index] = [Error('owner-not-found', 'Owner not found', 'owner')]
+            else:
+                valid.append(index)
+
+        data: Dict[int, dtos.PetResponseDto] = {}
+        if valid:
+            rows = [{'id': items[index].id, **self.__columns(items[index])} for index in valid]
+            async with database.transaction():
+                updated = await update_many_versioned(Pet.ormar_config.table, rows)
+            for index, row in zip(valid, updated):
+                if row is None:
+                    # Deleted between the check and the UPDATE.
+                    errors[index] = [Error('pet-not-found', 'Pet not found', '__model__')]
+                else:
+                    data[index] = dtos.PetResponseDto.from_row(row)
+            await cache.invalidate(*[cache_key('pet', items[index].id) for index in valid])
+
+        return bulk_response(len(items), data, errors)
+
+    async def bulk_delete(self, pets_request: dtos.BulkDeleteRequestDto) -> dtos.BulkResponseDto:
+        ids = pets_request.ids
+        existing: Set[int] = set(await delete_returning(Pet.ormar_config.table, 'id', list(set(ids))))
+        if existing:
+            await cache.invalidate(*[cache_key('pet', id) for id in existing])
+
+        errors: Dict[int, List[Error]] = {
+            index: [Error('pet-not-found', 'Pet not found', '__model__')]
+            for index, id in enumerate(ids) if id not in existing
+        }
+
+        data: Dict[int, int] = {index: id for index, id in enumerate(ids) if id in existing}
+        return bulk_response(len(ids), data, errors)
+
+    async def __existing_owners(self, owner_ids: List[int]) -> Set[int]:
+        return set(
+            await User.objects.filter(id__in=list(set(owner_ids)), deleting=False).values_list('id', flatten=True)
+        )
+
+    def __columns(self, pet: dtos.PetBaseDto) -> Dict[str, Any]:
+        return {'name': pet.name, 'breed': pet.breed, 'age': pet.age, 'owner_id': pet.owner.id}
+
+    def __filter(self, query: QuerySet, filters: Optional[dtos.PetFilterDto]) -> QuerySet:
+        if filters is None:
+            return query
+        if filters.breed is not None:
+            query = query.filter(breed=filters.breed)
+        if filters.age_min is not None:
+            query = query.filter(age__gte=filters.age_min)
+        if filters.age_max is not None:
+            query = query.filter(age__lte=filters.age_max)
+        if filters.owner_id is not None:
+            query = query.filter(owner=filters.owner_id)
+        if filters.name_prefix:
+            # A range instead of `startswith`, whose LIKE ... ESCAPE can not use ix_pets_name_id.
+            query = query.filter(name__gte=filters.name_prefix, name__lt=filters.name_prefix + MAX_CHAR)
+        return query
+
+    def __project(self, row: Mapping[str, Any], columns: List[str]) -> Dict[str, Any]:
+        return {column: {'id': row['owner_id']} if column == 'owner' else row[column] for column in columns}
 
 
 app.add_scoped(APetService, PetServiceDB)
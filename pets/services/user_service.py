@@ -1,24 +1,67 @@
 from __future__ import annotations
-from typing import List, Optional, overload
+from typing import Any, AsyncIterator, Dict, List, Mapping, Optional, Set, Tuple, Union, overload
 from abc import ABC
 
-from pets.models import User, Pet
-from config import app, database
+import sqlalchemy
+from cafeto.errors import Error
+
+from pets.models import DeletionJob, User, Pet
+from pets.cache import cache, cache_key
+from config import USER_DELETE_BATCH_SIZE, app, database
 
 import pets.dtos as dtos
-from pets.errors import UserNotFound
+from pets.replicas import read_replica
+from pets.singleflight import single_flight
+from pets.db import (
+    is_unique_violation, fetch_row, fetch_rows, insert_many, update_many_versioned, update_versioned
+)
+from pets.encoders import encoder
+from pets.etags import etag_matches, page_etag
+from pets.services.bulk import bulk_response
+from pets.errors import UserNotFound, EmailExists, InvalidFields, JobNotFound, NotModified, VersionMismatch
+from pets.jobs import deletion_jobs
+from pets.services.pagination import iterate_batches, keyset_page, parse_fields, parse_sort
+
+
+USER_SORTABLE: Tuple[str, ...] = ('id', 'email')
+USER_FIELDS: Tuple[str, ...] = ('id', 'name', 'email')
 
 
 class AUserService(ABC):
     async def retrieve(self, id: int) -> dtos.UserResponseDto: ...
 
-    async def list(self) -> list[dtos.UserResponseDto]: ...
+    async def retrieve_with_pets(self, id: int) -> dtos.UserWithPetsResponseDto: ...
+
+    async def list(
+        self,
+        limit: Optional[int] = None,
+        after: Optional[str] = None,
+        with_pets: bool = False,
+        sort: Optional[str] = None,
+        fields: Optional[str] = None,
+        if_none_match: Optional[str] = None
+    ) -> Union[dtos.RowPage, dtos.UserWithPetsPageDto, dtos.PartialPageDto]: ...
+
+    def stream(self) -> AsyncIterator[bytes]: ...
 
     async def create(self, user: dtos.UserCreateRequestDto) -> dtos.UserResponseDto: ...
 
-    async def update(self, id: int, user: dtos.UserUpdateRequestDto) -> dtos.UserResponseDto: ...
+    async def update(
+        self,
+        id: int,
+        user: dtos.UserUpdateRequestDto,
+        version: Optional[int] = None
+    ) -> dtos.UserResponseDto: ...
 
-    async def delete(self, id: int) -> bool: ...
+    async def delete(self, id: int) -> Optional[dtos.DeletionJobDto]: ...
+
+    async def retrieve_deletion(self, job_id: int) -> dtos.DeletionJobDto: ...
+
+    async def bulk_create(self, users: dtos.UserBulkCreateRequestDto) -> dtos.BulkResponseDto: ...
+
+    async def bulk_update(self, users: dtos.UserBulkUpdateRequestDto) -> dtos.BulkResponseDto: ...
+
+    async def bulk_delete(self, users: dtos.BulkDeleteRequestDto) -> dtos.UserBulkDeleteResponseDto: ...
 
     @overload
     async def user_exists(self, email: str) -> bool: ...
@@ -28,37 +71,131 @@ class AUserService(ABC):
 
     async def user_exists(self, email: str, id: int=None) -> bool: ...
 
+    async def can_own_pets(self, id: int) -> bool: ...
+
 
 class UserServiceDB(AUserService):
+    @cache.cached('user')
+    @single_flight.coalesce
+    @read_replica
     async def retrieve(self, id: int) -> dtos.UserResponseDto:
-        user: Optional[User] = await User.objects.filter(id=id).first_or_none()
-        if user:
-            return dtos.UserResponseDto(**user.model_dump())
+        row = await fetch_row(User.objects.filter(id=id))
+        if row:
+            return dtos.UserResponseDto.from_row(row)
         raise UserNotFound('User not found')
 
-    async def list(self) -> list[dtos.UserResponseDto]:
-        users: List[User] = await User.objects.all()
-        return [dtos.UserResponseDto(**user.model_dump()) for user in users]
+    @read_replica
+    async def retrieve_with_pets(self, id: int) -> dtos.UserWithPetsResponseDto:
+        row = await fetch_row(User.objects.filter(id=id))
+        if row:
+            return self.__with_pets([row], await self.__pets_of([row]))[0]
+        raise UserNotFound('User not found')
+
+    @read_replica
+    async def list(
+        self,
+        limit: Optional[int] = None,
+        after: Optional[str] = None,
+        with_pets: bool = False,
+        sort: Optional[str] = None,
+        fields: Optional[str] = None,
+        if_none_match: Optional[str] = None
+    ) -> Union[dtos.RowPage, dtos.UserWithPetsPageDto, dtos.PartialPageDto]:
+        '''
+        Raises NotModified when `if_none_match` matches the ETag of the page, before any DTO is built.
+        '''
+        order = parse_sort(sort, USER_SORTABLE)
+        columns = parse_fields(fields, USER_FIELDS)
+        if columns is not None and with_pets:
+            raise InvalidFields('fields can not be combined with expand')
+
+        query = User.objects
+        if columns is not None:
+            # The cursor needs the id and the sort column, the ETag the version, even when they are not requested.
+            query = query.fields(list(dict.fromkeys(['id', order.column, 'version', *columns])))
+        rows, next_cursor = await keyset_page(query, limit, after, order)
+
+        pets = await self.__pets_of(rows) if with_pets else {}
+        versions: List[Tuple[int, int]] = []
+        for row in rows:
+            versions.append((row['id'], row['version']))
+            versions.extend((pet_row['id'], pet_row['version']) for pet_row in pets.get(row['id'], []))
+        etag = page_etag(versions, next_cursor)
+        if etag_matches(if_none_match, etag):
+            raise NotModified(etag)
+
+        if columns is not None:
+            return dtos.PartialPageDto(
+                data=[{column: row[column] for column in columns} for row in rows],
+                next_cursor=next_cursor,
+                etag=etag
+            )
+        if with_pets:
+            return dtos.UserWithPetsPageDto(data=self.__with_pets(rows, pets), next_cursor=next_cursor, etag=etag)
+        return dtos.RowPage(dtos.UserPageDto, dtos.UserResponseDto, rows, next_cursor, etag)
+
+    @read_replica
+    async def stream(self) -> AsyncIterator[bytes]:
+        async for rows in iterate_batches(User.objects):
+            yield encoder.encode_lines(dtos.UserResponseDto, rows)
 
     async def create(self, user_request: dtos.UserCreateRequestDto) -> dtos.UserResponseDto:
-        user: Optional[User] = await User.objects.create(**user_request.model_dump())
+        try:
+            user: Optional[User] = await User.objects.create(**user_request.model_dump())
+        except Exception as e:
+            if is_unique_violation(e):
+                raise EmailExists()
+            raise
         return dtos.UserResponseDto(**user.model_dump())
 
-    async def update(self, id: int, user_request: dtos.UserUpdateRequestDto) -> dtos.UserResponseDto:
-        async with database.transaction():
-            user = await User.objects.filter(id=id).first_or_none()
-            if user is None:
-                raise UserNotFound('User not found')
-            await user.update(**user_request.model_dump())
-            return dtos.UserResponseDto(**user.model_dump())
+    async def update(
+        self,
+        id: int,
+        user_request: dtos.UserUpdateRequestDto,
+        version: Optional[int] = None
+    ) -> dtos.UserResponseDto:
+        '''
+        One UPDATE ... RETURNING, guarded by `version` when given (If-Match).
+        '''
+        try:
+            row = await update_versioned(User.ormar_config.table, id, self.__columns(user_request), version)
+        except Exception as e:
+            if is_unique_violation(e):
+                raise EmailExists()
+            raise
+        if row is None:
+            if version is not None and await User.objects.filter(id=id).exists():
+                raise VersionMismatch()
+            raise UserNotFound('User not found')
+        await cache.invalidate(cache_key('user', id))
+        return dtos.UserResponseDto.from_row(row)
+
+    async def delete(self, id: int) -> Optional[dtos.DeletionJobDto]:
+        '''
+        Users with up to USER_DELETE_BATCH_SIZE pets are deleted right away, returns None:
+        two DELETE ... RETURNING in one transaction, the pets first, each guarded by the
+        checks so nothing is read before. The returned pet ids are needed to invalidate
+        their cache entries, which ON DELETE CASCADE would not give.
 
-    async def delete(self, id: int) -> None:
+        Bigger ones, and users already being deleted, are left to a background job
+        (see pets.jobs), returns the job.
+        '''
         async with database.transaction():
-            user_exists: bool = await User.objects.filter(id=id).exists()
-            if not user_exists:
-                raise UserNotFound('User not found')
-            await Pet.objects.delete(owner=id)
-            await User.objects.delete(id=id)
+            pet_ids, deleted = await self.__delete_small([id])
+        await cache.invalidate(cache_key('user', id), *[cache_key('pet', pet_id) for pet_id in pet_ids])
+        if deleted:
+            return None
+
+        states = await self.__deletion_states([id])
+        if id not in states:
+            raise UserNotFound('User not found')
+        return dtos.DeletionJobDto.from_row(await deletion_jobs.schedule(id, states[id][1]))
+
+    async def retrieve_deletion(self, job_id: int) -> dtos.DeletionJobDto:
+        row = await fetch_row(DeletionJob.objects.filter(id=job_id))
+        if row:
+            return dtos.DeletionJobDto.from_row(row)
+        raise JobNotFound('Job not found')
     
     @overload
     async def user_exists(self, email: str) -> bool: ...
@@ -66,10 +203,211 @@ class UserServiceDB(AUserService):
     @overload
     async def user_exists(self, email: str, id: int=None) -> bool: ...
 
+    @single_flight.coalesce
+    @read_replica
     async def user_exists(self, email: str, id: int=None) -> bool:
         if id is not None:
             return await User.objects.filter(email=email).exclude(id=id).exists()
         return await User.objects.filter(email=email).exists()
 
+    async def can_own_pets(self, id: int) -> bool:
+        '''
+        Whether the user exists and is not being deleted. Read from the primary and
+        never cached: `retrieve` may serve `deleting` from before another worker
+        started the deletion, for up to CACHE_TTL.
+        '''
+        return await User.objects.filter(id=id, deleting=False).exists()
+
+    async def bulk_create(self, users_request: dtos.UserBulkCreateRequestDto) -> dtos.BulkResponseDto:
+        items = users_request.items
+        taken: Dict[str, Optional[int]] = await self.__emails_in_use([item.email for item in items])
+
+        errors: Dict[int, List[Error]] = {}
+        valid: List[int] = []
+        for index, item in enumerate(items):
+            if item.email in taken:
+                errors[index] = [Error('email-exists', 'Email already exists', 'email')]
+            else:
+                taken[item.email] = None
+                valid.append(index)
+
+        data: Dict[int, dtos.UserResponseDto] = {}
+        if valid:
+            rows = [items[index].model_dump() for index in valid]
+            try:
+                async with database.transaction():
+                    ids = await insert_many(User.ormar_config.table, rows)
+            except Exception as e:
+                if is_unique_violation(e):
+                    raise EmailExists()
+                raise
+            for index, id in zip(valid, ids):
+                data[index] = dtos.UserResponseDto(id=id, **items[index].model_dump())
+
+        return bulk_response(len(items), data, errors)
+
+    async def bulk_update(self, users_request: dtos.UserBulkUpdateRequestDto) -> dtos.BulkResponseDto:
+        items = users_request.items
+        existing: Set[int] = set(
+            await User.objects.filter(id__in=[item.id for item in items]).values_list('id', flatten=True)
+        )
+        taken: Dict[str, int] = await self.__emails_in_use([item.email for item in items])
+
+        errors: Dict[int, List[Error]] = {}
+        valid: List[int] = []
+        for index, item in enumerate(items):
+            if item.id not in existing:
+                errors[index] = [Error('user-not-found', 'User not found', '__model__')]
+            elif taken.get(item.email, item.id) != item.id:
+                errors[index] = [Error('email-exists', 'Email already exists', 'email')]
+            else:
+                taken[item.email] = item.id
+                valid.append(index)
+
+        data: Dict[int, dtos.UserResponseDto] = {}
+        if valid:
+            rows = [{'id': items[index].id, **self.__columns(items[index])} for index in valid]
+            try:
+                async with database.transaction():
+                    updated = await update_many_versioned(User.ormar_config.table, rows)
+            except Exception as e:
+                if is_unique_violation(e):
+                    raise EmailExists()
+                raise
+            for index, row in zip(valid, updated):
+                if row is None:
+                    # Deleted between the check and the UPDATE.
+                    errors[index] = [Error('user-not-found', 'User not found', '__model__')]
+                else:
+                    data[index] = dtos.UserResponseDto.from_row(row)
+            await cache.invalidate(*[cache_key('user', items[index].id) for index in valid])
+
+        return bulk_response(len(items), data, errors)
+
+    async def bulk_delete(self, users_request: dtos.BulkDeleteRequestDto) -> dtos.UserBulkDeleteResponseDto:
+        '''
+        Each user goes the way of `delete`: the small ones are deleted right away, in
+        transactions of at most USER_DELETE_BATCH_SIZE pets, the big ones and those
+        already being deleted get their deletion job, returned with their result.
+        '''
+        ids = users_request.ids
+        states = await self.__deletion_states(sorted(set(ids)))
+
+        chunks: List[List[int]] = [[]]
+        pets_in_chunk = 0
+        for id, (deleting, pets) in states.items():
+            if deleting or pets > USER_DELETE_BATCH_SIZE:
+                continue
+            if chunks[-1] and pets_in_chunk + pets > USER_DELETE_BATCH_SIZE:
+                chunks.append([])
+                pets_in_chunk = 0
+            chunks[-1].append(id)
+            pets_in_chunk += pets
+
+        deleted: Set[int] = set()
+        for chunk in chunks:
+            if not chunk:
+                continue
+            async with database.transaction():
+                pet_ids, users = await self.__delete_small(chunk)
+            deleted |= users
+            await cache.invalidate(
+                *[cache_key('user', id) for id in chunk],
+                *[cache_key('pet', pet_id) for pet_id in pet_ids]
+            )
+
+        # Big, being deleted, or grown since the states were read.
+        jobs: Dict[int, dtos.DeletionJobDto] = {}
+        for id, (_, pets) in states.items():
+            if id not in deleted:
+                try:
+                    jobs[id] = dtos.DeletionJobDto.from_row(await deletion_jobs.schedule(id, pets))
+                except UserNotFound:
+                    pass
+
+        results: List[dtos.UserBulkDeleteResultDto] = []
+        for index, id in enumerate(ids):
+            if id in deleted or id in jobs:
+                results.append(dtos.UserBulkDeleteResultDto(index=index, data=id, job=jobs.get(id)))
+            else:
+                results.append(dtos.UserBulkDeleteResultDto(
+                    index=index, errors=[Error('user-not-found', 'User not found', '__model__')]
+                ))
+        return dtos.UserBulkDeleteResponseDto(results=results)
+
+    async def __delete_small(self, ids: List[int]) -> Tuple[List[int], Set[int]]:
+        '''
+        Deletes the pets, then the users of `ids` not being deleted with at most
+        USER_DELETE_BATCH_SIZE pets (counted up to one more), the others are left alone.
+        Returns the ids of the deleted pets and users.
+        '''
+        small = (
+            'SELECT id FROM users WHERE id IN :ids AND NOT deleting AND (SELECT COUNT(*) FROM '
+            '(SELECT 1 FROM pets WHERE pets.owner_id = users.id LIMIT :limit) AS owned) <= :batch'
+        )
+        pets = await database.fetch_all(
+            sqlalchemy.text(f'DELETE FROM pets WHERE owner_id IN ({small}) RETURNING id').bindparams(
+                sqlalchemy.bindparam('ids', ids, expanding=True),
+                limit=USER_DELETE_BATCH_SIZE + 1,
+                batch=USER_DELETE_BATCH_SIZE
+            )
+        )
+        # The pets of a small user are gone now, a big one still has some.
+        users = await database.fetch_all(
+            sqlalchemy.text(
+                'DELETE FROM users WHERE id IN :ids AND NOT deleting '
+                'AND NOT EXISTS (SELECT 1 FROM pets WHERE pets.owner_id = users.id) RETURNING id'
+            ).bindparams(sqlalchemy.bindparam('ids', ids, expanding=True))
+        )
+        return [row[0] for row in pets], {row[0] for row in users}
+
+    async def __deletion_states(self, ids: List[int]) -> Dict[int, Tuple[bool, int]]:
+        '''
+        `deleting` and the number of pets of the existing users of `ids`, in one query.
+        Pets are only counted up to USER_DELETE_BATCH_SIZE + 1, enough to tell the users
+        deleted right away from the others without scanning all the pets of a big one.
+        '''
+        rows = await database.fetch_all(
+            sqlalchemy.text(
+                'SELECT id, deleting, (SELECT COUNT(*) FROM '
+                '(SELECT 1 FROM pets WHERE pets.owner_id = users.id LIMIT :limit) AS owned) AS pets '
+                'FROM users WHERE id IN :ids'
+            ).bindparams(
+                sqlalchemy.bindparam('ids', ids, expanding=True),
+                limit=USER_DELETE_BATCH_SIZE + 1
+            )
+        )
+        return {row[0]: (bool(row[1]), row[2]) for row in rows}
+
+    async def __pets_of(self, rows: List[Mapping]) -> Dict[int, List[Mapping]]:
+        '''
+        Loads the pets of all the users in one query.
+        '''
+        pets: Dict[int, List[Mapping]] = {row['id']: [] for row in rows}
+        if pets:
+            for pet_row in await fetch_rows(Pet.objects.filter(owner__in=list(pets)).order_by('id')):
+                pets[pet_row['owner_id']].append(pet_row)
+        return pets
+
+    def __with_pets(self, rows: List[Mapping], pets: Dict[int, List[Mapping]]) -> List[dtos.UserWithPetsResponseDto]:
+        return [
+            dtos.UserWithPetsResponseDto(
+                id=row['id'],
+                name=row['name'],
+                email=row['email'],
+                version=row['version'],
+                updated_at=row['updated_at'],
+                pets=[dtos.PetResponseDto.from_row(pet_row) for pet_row in pets[row['id']]]
+            )
+            for row in rows
+        ]
+
+    def __columns(self, user: dtos.UserBaseDto) -> Dict[str, Any]:
+        return {'name': user.name, 'email': user.email}
+
+    async def __emails_in_use(self, emails: List[str]) -> Dict[str, int]:
+        rows = await User.objects.filter(email__in=list(set(emails))).values(['id', 'email'])
+        return {row['email']: row['id'] for row in rows}
+
 
 app.add_scoped(AUserService, UserServiceDB)
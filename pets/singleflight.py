@@ -0,0 +1,69 @@
+import asyncio
+import functools
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+from config import database
+from pets.replicas import pinned
+
+
+class SingleFlight:
+    '''
+    Concurrent identical calls share one in-flight call, local to the worker process.
+
+    The call runs in its own task, awaited through `asyncio.shield`: a cancelled
+    caller stops waiting but the others still get the result, and an exception
+    reaches every caller. A call started before `invalidate()` is not shared
+    with the callers that come after it, so they never read older data than
+    they would have without coalescing.
+    '''
+    def __init__(self):
+        self.calls: int = 0
+        self.coalesced: int = 0
+        self._generation: int = 0
+        self._flights: Dict[Hashable, Tuple[int, asyncio.Future]] = {}
+
+    async def do(self, key: Hashable, call: Callable[[], Awaitable[Any]]) -> Any:
+        flight = self._flights.get(key)
+        if flight is not None and flight[0] == self._generation:
+            self.coalesced += 1
+            return await asyncio.shield(flight[1])
+
+        self.calls += 1
+        task = asyncio.ensure_future(call())
+        entry = (self._generation, task)
+        self._flights[key] = entry
+
+        def done(task: asyncio.Future) -> None:
+            if self._flights.get(key) is entry:
+                del self._flights[key]
+            if not task.cancelled():
+                # Marks the exception as retrieved when every caller was cancelled.
+                task.exception()
+
+        task.add_done_callback(done)
+        return await asyncio.shield(task)
+
+    def invalidate(self) -> None:
+        self._generation += 1
+
+    def coalesce(self, method: Callable[..., Awaitable[Any]]) -> Callable[..., Awaitable[Any]]:
+        '''
+        Coalesces a service method on its arguments, the service instance is left out
+        of the key as services are scoped per request. Calls inside a transaction are
+        never shared, calls of clients pinned to the primary only among themselves.
+        '''
+        name = method.__qualname__
+
+        @functools.wraps(method)
+        async def wrapper(service, *args, **kwargs):
+            if database.in_transaction():
+                return await method(service, *args, **kwargs)
+            key = (name, args, tuple(sorted(kwargs.items())), pinned())
+            return await self.do(key, lambda: method(service, *args, **kwargs))
+        return wrapper
+
+    def stats(self) -> Dict[str, int]:
+        return {'calls': self.calls, 'coalesced': self.coalesced, 'in_flight': len(self._flights)}
+
+
+single_flight: SingleFlight = SingleFlight()
@@ -0,0 +1,79 @@
+'''
+Statistics of `GET /pet/stats`, read from the aggregate tables the triggers of
+migration 0006 keep up to date (see pets/migrations/v0006_pet_stats.py),
+never from `pets` itself: a read costs the number of breeds, ages and
+distinct pet counts, whatever the number of pets.
+
+`rebuild` recomputes the tables from scratch, for a database whose counts
+drifted (restored from a backup, edited by hand with the triggers disabled):
+
+    python -m pets.commands.rebuild_stats
+'''
+from typing import Any, Dict, List, Mapping, Sequence
+
+import sqlalchemy
+from sqlalchemy.engine import Connection
+
+
+# Width of the buckets of the age histogram.
+AGE_BUCKET: int = 5
+
+# One statement, so the three aggregates come from the same snapshot.
+STATS_QUERY: sqlalchemy.sql.elements.TextClause = sqlalchemy.text(
+    "SELECT 'breed' AS kind, breed, CAST(NULL AS INTEGER) AS value, pets AS count FROM pet_stats_breeds "
+    "UNION ALL SELECT 'age', NULL, age, pets FROM pet_stats_ages "
+    "UNION ALL SELECT 'owners', NULL, pets, owners FROM pet_stats_owner_counts"
+)
+
+REBUILD: tuple = (
+    'DELETE FROM pet_stats_owner_counts',
+    'DELETE FROM pet_stats_owners',
+    'DELETE FROM pet_stats_ages',
+    'DELETE FROM pet_stats_breeds',
+    'INSERT INTO pet_stats_breeds (breed, pets) SELECT breed, COUNT(*) FROM pets GROUP BY breed',
+    'INSERT INTO pet_stats_ages (age, pets) SELECT age, COUNT(*) FROM pets GROUP BY age',
+    # The triggers on pet_stats_owners fill pet_stats_owner_counts.
+    'INSERT INTO pet_stats_owners (owner_id, pets) '
+    'SELECT owner_id, COUNT(*) FROM pets WHERE owner_id IS NOT NULL GROUP BY owner_id',
+)
+
+
+def rebuild(connection: Connection) -> None:
+    '''
+    Recomputes the aggregate tables, in the transaction of `connection`. On
+    Postgres the pets are locked against writes meanwhile, so no write is counted twice or lost.
+    '''
+    if connection.dialect.name != 'sqlite':
+        connection.execute(sqlalchemy.text('LOCK TABLE pets IN SHARE MODE'))
+    for statement in REBUILD:
+        connection.execute(sqlalchemy.text(statement))
+
+
+def summarize(rows: Sequence[Mapping[str, Any]], age_bucket: int = AGE_BUCKET) -> Dict[str, Any]:
+    '''
+    The rows of STATS_QUERY as the fields of `PetStatsDto`. Breeds go from the most
+    pets down, ages and pet counts up.
+    '''
+    breeds: List[Dict[str, Any]] = []
+    ages: Dict[int, int] = {}
+    owners: Dict[int, int] = {}
+    for row in rows:
+        if row['kind'] == 'breed':
+            breeds.append({'breed': row['breed'], 'pets': row['count']})
+        elif row['kind'] == 'age':
+            bucket = row['value'] // age_bucket * age_bucket
+            ages[bucket] = ages.get(bucket, 0) + row['count']
+        else:
+            owners[row['value']] = row['count']
+
+    breeds.sort(key=lambda breed: (-breed['pets'], breed['breed']))
+    return {
+        'pets': sum(breed['pets'] for breed in breeds),
+        'owners': sum(owners.values()),
+        'breeds': breeds,
+        'ages': [
+            {'age_min': bucket, 'age_max': bucket + age_bucket - 1, 'pets': pets}
+            for bucket, pets in sorted(ages.items())
+        ],
+        'pets_per_owner': [{'pets': pets, 'owners': count} for pets, count in sorted(owners.items())],
+    }
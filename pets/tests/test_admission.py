@@ -0,0 +1,116 @@
+import asyncio
+
+import httpx
+import pytest
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from pets.admission import AdmissionControl, AdmissionMiddleware, RateLimit, RouteGroup
+
+
+def test_rate_limit_per_client(setup_app):
+    async def index(request):
+        return JSONResponse({})
+
+    admission = AdmissionControl([
+        RouteGroup('metrics', r'^/metrics'),
+        RouteGroup('default', r'', rate_limit=RateLimit(0.1, 2)),
+    ], api_keys=['other'])
+    app = Starlette(routes=[Route('/pets', index), Route('/metrics', index)])
+    client = TestClient(AdmissionMiddleware(app, admission))
+
+    assert [client.get('/pets').status_code for _ in range(3)] == [200, 200, 429]
+    response = client.get('/pets')
+    assert response.status_code == 429
+    assert response.json()['errorList'][0]['type'] == 'rate-limited'
+    assert int(response.headers['Retry-After']) >= 1
+
+    # Every API key has its own bucket, and /metrics is never limited.
+    assert client.get('/pets', headers={'X-API-Key': 'other'}).status_code == 200
+    assert all(client.get('/metrics').status_code == 200 for _ in range(5))
+
+    # Unknown keys do not buy a bucket, they are limited by the IP like no key.
+    assert [client.get('/pets', headers={'X-API-Key': f'fake-{i}'}).status_code for i in range(5)] == [429] * 5
+
+
+@pytest.mark.asyncio
+async def test_metrics_never_shed(setup_app):
+    release = asyncio.Event()
+
+    async def slow(request):
+        await release.wait()
+        return JSONResponse({})
+
+    async def index(request):
+        return JSONResponse({})
+
+    admission = AdmissionControl(
+        [RouteGroup('metrics', r'^/metrics'), RouteGroup('default', r'', rate_limit=RateLimit(100, 100))],
+        max_concurrency=1,
+        max_waiting=0,
+        queue_timeout=0.05
+    )
+    routes = [Route('/slow', slow), Route('/metrics', index)]
+    app = AdmissionMiddleware(Starlette(routes=routes), admission)
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url='http://test') as client:
+        first = asyncio.create_task(client.get('/slow'))
+        await asyncio.sleep(0.01)
+
+        # The global cap is full: other routes are shed, the metrics still answer.
+        assert (await client.get('/slow')).status_code == 503
+        assert (await client.get('/metrics')).status_code == 200
+
+        release.set()
+        assert (await first).status_code == 200
+
+
+def test_rate_limit_needs_burst(setup_app):
+    with pytest.raises(ValueError):
+        AdmissionControl([RouteGroup('default', r'', rate_limit=RateLimit(10, 0))])
+    # A rate of 0 turns the limit off, the burst does not matter then.
+    AdmissionControl([RouteGroup('default', r'', rate_limit=RateLimit(0, 0))])
+
+
+@pytest.mark.asyncio
+async def test_concurrency_limit(setup_app):
+    from pets.metrics import metrics
+
+    release = asyncio.Event()
+
+    async def slow(request):
+        await release.wait()
+        return JSONResponse({})
+
+    admission = AdmissionControl(
+        [RouteGroup('lists', r'^/slow$', max_concurrency=1)],
+        max_concurrency=10,
+        max_waiting=1,
+        queue_timeout=0.05
+    )
+    app = AdmissionMiddleware(Starlette(routes=[Route('/slow', slow)]), admission)
+    shed = metrics.shed_requests._values.get(('lists', 'overloaded'), 0)
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url='http://test') as client:
+        first = asyncio.create_task(client.get('/slow'))
+        await asyncio.sleep(0.01)
+        queued = asyncio.create_task(client.get('/slow'))
+        await asyncio.sleep(0.01)
+        assert admission.group_stats() == {'lists': {'in_flight': 1, 'waiting': 1}}
+        assert admission.stats()['waiting'] == 0
+
+        # The queue is full: rejected at once. The queued one times out.
+        response = await client.get('/slow')
+        assert response.status_code == 503
+        assert response.headers['Retry-After'] == '1'
+        assert (await queued).status_code == 503
+
+        release.set()
+        assert (await first).status_code == 200
+        assert (await client.get('/slow')).status_code == 200
+
+    assert metrics.shed_requests._values[('lists', 'overloaded')] == shed + 2
+    assert admission.stats()['in_flight'] == 0
+    assert admission.group_stats() == {'lists': {'in_flight': 0, 'waiting': 0}}
@@ -0,0 +1,95 @@
+import pytest
+
+from cafeto.responses import codes
+
+
+@pytest.mark.asyncio
+async def test_memory_backend_lru(setup_app):
+    from pets.cache import MemoryCacheBackend, MISSING
+
+    backend = MemoryCacheBackend(max_size=2)
+    await backend.set('a', 1, 60)
+    await backend.set('b', 2, 60)
+    assert await backend.get('a') == 1
+
+    await backend.set('c', 3, 60)
+    assert await backend.get('b') is MISSING
+    assert await backend.get('a') == 1
+    assert backend.stats() == {'size': 2, 'evictions': 1}
+
+@pytest.mark.asyncio
+async def test_memory_backend_ttl(setup_app):
+    from pets.cache import MemoryCacheBackend, MISSING
+
+    backend = MemoryCacheBackend()
+    await backend.set('a', 1, 0)
+    assert await backend.get('a') is MISSING
+
+@pytest.mark.asyncio
+async def test_invalidation_during_load(setup_app):
+    from pets.cache import Cache, MemoryCacheBackend, MISSING
+
+    cache = Cache(MemoryCacheBackend())
+
+    async def loader():
+        await cache.invalidate('pet:1')
+        return 'stale'
+
+    assert await cache.get_or_load('pet:1', loader) == 'stale'
+    assert await cache.backend.get('pet:1') is MISSING
+
+@pytest.mark.asyncio
+async def test_retrieve_cached(setup_app):
+    client = setup_app
+
+    from pets.cache import cache
+    from pets.models import User, Pet
+
+    user = await User.objects.create(name='John Doe', email='john@doe.com')
+    await Pet.objects.create(name='Buddy', breed='Golden Retriever', age=3, owner=user)
+
+    hits, misses = cache.hits, cache.misses
+    client.get('/pet/pet/1')
+    client.get('/pet/pet/1')
+    assert (cache.hits - hits, cache.misses - misses) == (1, 1)
+
+    update_data = {'name': 'Buddy Updated', 'breed': 'Golden Retriever', 'age': 4, 'owner': {'id': user.id}}
+    client.put('/pet/pet/1', json=update_data)
+    assert client.get('/pet/pet/1').json()['name'] == 'Buddy Updated'
+
+    response = client.get('/cache/stats')
+    assert response.status_code == codes.CODE_200_OK.value
+    assert response.json()['data']['hits'] == cache.hits
+
+@pytest.mark.asyncio
+async def test_owner_check_bypasses_cache(setup_app):
+    client = setup_app
+
+    from pets.models import User
+
+    user = await User.objects.create(name='John Doe', email='john@doe.com')
+    assert client.get(f'/user/user/{user.id}').json()['id'] == user.id
+
+    # Another worker starts deleting the user, this worker still has it cached.
+    await User.objects.filter(id=user.id).update(deleting=True)
+    assert client.get(f'/user/user/{user.id}').status_code == codes.CODE_200_OK.value
+
+    response = client.post('/pet/pet', json={'name': 'Buddy', 'breed': 'Mutt', 'age': 3, 'owner': {'id': user.id}})
+    assert response.status_code == codes.CODE_400_BAD_REQUEST.value
+    assert response.json()['errorList'][0]['type'] == 'owner-not-found'
+
+@pytest.mark.asyncio
+async def test_user_delete_invalidates_pets(setup_app):
+    client = setup_app
+
+    from pets.models import User, Pet
+
+    user = await User.objects.create(name='John Doe', email='john@doe.com')
+    await Pet.objects.create(name='Buddy', breed='Golden Retriever', age=3, owner=user)
+
+    assert client.get('/pet/pet/1').status_code == codes.CODE_200_OK.value
+    assert client.get('/user/user/1').status_code == codes.CODE_200_OK.value
+
+    client.delete('/user/user/1')
+    assert client.get('/pet/pet/1').status_code == codes.CODE_404_NOT_FOUND.value
+    assert client.get('/user/user/1').status_code == codes.CODE_404_NOT_FOUND.value
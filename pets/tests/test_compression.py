@@ -0,0 +1,119 @@
+import os
+import gzip
+import json
+
+import pytest
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Mount, Route
+from starlette.testclient import TestClient
+
+from pets.compression import CompressionMiddleware, PrecompressedStaticFiles, negotiate
+
+
+def test_negotiate():
+    assert negotiate('gzip, deflate, br', ('br', 'gzip')) == 'br'
+    assert negotiate('br;q=0.5, gzip', ('br', 'gzip')) == 'gzip'
+    assert negotiate('*;q=0.1', ('br', 'gzip')) == 'br'
+    assert negotiate('br;q=0, identity', ('br', 'gzip')) == 'identity'
+    assert negotiate(None, ('br', 'gzip')) == 'identity'
+
+
+def test_compression_middleware():
+    rows = [{'id': index, 'name': f'Pet {index}'} for index in range(200)]
+
+    async def large(request):
+        return JSONResponse(rows, headers={'ETag': '"1"'})
+
+    async def small(request):
+        return JSONResponse({'id': 1})
+
+    async def stream(request):
+        async def chunks():
+            for row in rows:
+                yield json.dumps(row).encode() + b'\n'
+        return StreamingResponse(chunks(), media_type='application/json')
+
+    app = Starlette(routes=[Route('/large', large), Route('/small', small), Route('/stream', stream)])
+    client = TestClient(CompressionMiddleware(app, minimum_size=512, encodings=('gzip',)))
+
+    response = client.get('/large', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert response.headers['Vary'] == 'Accept-Encoding'
+    assert response.headers['ETag'] == 'W/"1"'
+    assert int(response.headers['Content-Length']) < len(json.dumps(rows))
+    assert response.json() == rows
+
+    response = client.get('/small', headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in response.headers
+    assert response.json() == {'id': 1}
+
+    response = client.get('/large', headers={'Accept-Encoding': 'identity'})
+    assert 'Content-Encoding' not in response.headers
+    assert response.headers['ETag'] == '"1"'
+
+    response = client.get('/stream', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Content-Length' not in response.headers
+    assert [json.loads(line) for line in response.text.splitlines()] == rows
+
+
+def test_precompressed_static_files(tmp_path):
+    body = json.dumps([{'id': index} for index in range(100)]).encode()
+    (tmp_path / 'breeds.json').write_bytes(body)
+    (tmp_path / 'breeds.json.gz').write_bytes(gzip.compress(body))
+
+    app = Starlette(routes=[Mount('/static', PrecompressedStaticFiles(directory=str(tmp_path)))])
+    client = TestClient(app)
+
+    response = client.get('/static/breeds.json', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert response.headers['Content-Type'] == 'application/json'
+    assert response.content == body
+
+    response = client.get(
+        '/static/breeds.json', headers={'Accept-Encoding': 'gzip', 'If-None-Match': response.headers['ETag']}
+    )
+    assert response.status_code == 304
+
+    response = client.get('/static/breeds.json', headers={'Accept-Encoding': 'identity'})
+    assert 'Content-Encoding' not in response.headers
+    assert response.content == body
+
+    # A sibling older than its file is stale.
+    stat = os.stat(tmp_path / 'breeds.json')
+    os.utime(tmp_path / 'breeds.json.gz', (stat.st_atime, stat.st_mtime - 10))
+    response = client.get('/static/breeds.json', headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in response.headers
+
+
+def test_app_compresses_static(setup_app):
+    client = setup_app
+
+    response = client.get('/static/breeds.json', headers={'Accept-Encoding': 'gzip'})
+    assert response.status_code == 200
+    assert response.headers['Content-Encoding'] == 'gzip'
+    with open(os.path.join('static', 'breeds.json'), 'rb') as file:
+        assert response.content == file.read()
+
+
+@pytest.mark.asyncio
+async def test_app_compresses_ndjson_stream(setup_app):
+    client = setup_app
+
+    from pets.db import insert_many
+    from pets.models import User, Pet
+
+    owner = (await insert_many(User.ormar_config.table, [{'name': 'Owner', 'email': 'owner@pets.com'}]))[0]
+    await insert_many(
+        Pet.ormar_config.table,
+        [{'name': f'Pet {i}', 'breed': 'Mutt', 'age': i % 20, 'owner_id': owner} for i in range(200)]
+    )
+
+    response = client.get('/pet/pet', params={'stream': 1}, headers={'Accept-Encoding': 'gzip'})
+    assert response.status_code == 200
+    assert response.headers['Content-Type'].startswith('application/x-ndjson')
+    assert response.headers['Content-Encoding'] == 'gzip'
+    lines = response.text.splitlines()
+    assert len(lines) == 200
+    assert json.loads(lines[0])['name'] == 'Pet 0'
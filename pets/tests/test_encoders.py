@@ -0,0 +1,58 @@
+from datetime import datetime
+
+import pytest
+
+
+PET_ROWS = [
+    {
+        'id': index, 'name': f'Pet {index} ñ "quoted"', 'breed': 'Mutt', 'age': index % 20, 'owner_id': 1,
+        'version': 2, 'updated_at': datetime(2024, 1, 1)
+    }
+    for index in range(50)
+]
+USER_ROWS = [
+    {'id': 1, 'name': 'Owner', 'email': 'owner@pets.com', 'version': 1, 'updated_at': None, 'deleting': False}
+]
+
+
+def test_encoders_write_the_same_bytes(setup_app):
+    import pets.dtos as dtos
+    from pets.encoders import ENCODERS, OrjsonEncoder, PydanticEncoder
+
+    if OrjsonEncoder.name not in ENCODERS:
+        pytest.skip('orjson is not installed')
+    fast, default = OrjsonEncoder(), PydanticEncoder()
+    pages = [
+        dtos.RowPage(dtos.PetPageDto, dtos.PetResponseDto, PET_ROWS, 'cursor', '"etag"'),
+        dtos.RowPage(dtos.PetPageDto, dtos.PetResponseDto, []),
+        dtos.RowPage(dtos.UserPageDto, dtos.UserResponseDto, USER_ROWS),
+    ]
+    for page in pages:
+        assert fast.encode(page) == default.encode(page) == page.to_dto().model_dump_json().encode()
+
+    assert fast.encode_lines(dtos.PetResponseDto, PET_ROWS) == default.encode_lines(dtos.PetResponseDto, PET_ROWS)
+    assert fast.encode_lines(dtos.PetResponseDto, PET_ROWS).count(b'\n') == len(PET_ROWS)
+
+    user = dtos.UserResponseDto.from_row(USER_ROWS[0])
+    assert fast.encode(user) == default.encode(user)
+
+
+def test_row_fields_follow_the_dtos(setup_app):
+    import pets.dtos as dtos
+    from pets.encoders import row_fields
+
+    assert row_fields(dtos.PetResponseDto) == (
+        ('name', 'name', False), ('breed', 'breed', False), ('age', 'age', False), ('owner', 'owner_id', True),
+        ('id', 'id', False)
+    )
+    assert [name for name, _, _ in row_fields(dtos.UserResponseDto)] == list(
+        dtos.UserResponseDto.from_row(USER_ROWS[0]).model_dump()
+    )
+
+
+def test_select_encoder(setup_app):
+    from pets.encoders import ENCODERS, OrjsonEncoder, select_encoder
+
+    assert select_encoder('pydantic').name == 'pydantic'
+    assert select_encoder('missing').name == 'pydantic'
+    assert select_encoder('auto').name == ('orjson' if OrjsonEncoder.name in ENCODERS else 'pydantic')
@@ -0,0 +1,48 @@
+import argparse
+
+import pytest
+
+
+def test_percentile():
+    from benchmarks.load_test import percentile
+
+    samples = [float(value) for value in range(100, 0, -1)]
+    assert percentile(samples, 50) == 50.0
+    assert percentile(samples, 95) == 95.0
+    assert percentile(samples, 100) == 100.0
+    assert percentile([3.0], 99) == 3.0
+
+
+def test_compare():
+    from benchmarks.load_test import compare
+
+    baseline = {'routes': {
+        'GET /pet/pet': {'p95_ms': 10.0, 'throughput_rps': 1000.0},
+        'GET /user/user': {'p95_ms': 10.0, 'throughput_rps': 1000.0},
+    }}
+    result = {'routes': {
+        'GET /pet/pet': {'p95_ms': 11.0, 'throughput_rps': 900.0},
+        'GET /user/user': {'p95_ms': 13.0, 'throughput_rps': 700.0},
+        'POST /pet/pet': {'p95_ms': 50.0, 'throughput_rps': 10.0},
+    }}
+
+    assert compare(result, baseline, 0.2) == [
+        'GET /user/user: p95 10.00ms -> 13.00ms',
+        'GET /user/user: throughput 1000 -> 700 rps',
+    ]
+    assert compare(result, baseline, 0.5) == []
+
+
+@pytest.mark.asyncio
+async def test_main(setup_app):
+    from benchmarks.load_test import main
+
+    args = argparse.Namespace(users=3, pets=10, requests=4, concurrency=2, seed=1, timeout=10.0, url=None)
+    result = await main(args)
+
+    assert len(result['routes']) == 11
+    for route, stats in result['routes'].items():
+        assert stats['requests'] == 4, route
+        assert stats['errors'] == 0, route
+        assert stats['p50_ms'] <= stats['p95_ms'] <= stats['p99_ms'], route
+    assert result['peak_rss_mb'] > 0
@@ -0,0 +1,59 @@
+import logging
+
+import pytest
+
+from cafeto.responses import codes
+
+
+@pytest.mark.asyncio
+async def test_server_timing(setup_app):
+    client = setup_app
+
+    from pets.models import User
+
+    await User.objects.create(name='John Doe', email='john@doe.com')
+
+    response = client.get('/user/user/1')
+    assert response.status_code == codes.CODE_200_OK.value
+
+    timing = response.headers['server-timing']
+    for stage in ('resolve;', 'action;', 'db;desc="1 queries"', 'render;', 'total;'):
+        assert stage in timing
+
+@pytest.mark.asyncio
+async def test_metrics(setup_app):
+    client = setup_app
+
+    from pets.models import User
+
+    await User.objects.create(name='John Doe', email='john@doe.com')
+    client.get('/user/user/1')
+    client.get('/user/user/1')
+
+    response = client.get('/metrics')
+    assert response.status_code == codes.CODE_200_OK.value
+    assert response.headers['content-type'].startswith('text/plain')
+
+    text = response.text
+    assert 'pets_http_request_duration_seconds_bucket{method="GET",route="/user/user/{id}",status="200",le="+Inf"}' in text
+    assert 'pets_http_request_db_queries_count{method="GET",route="/user/user/{id}"}' in text
+    assert 'pets_db_query_duration_seconds_count' in text
+    assert 'pets_cache_hits_total' in text
+    assert 'pets_cache_size' in text
+    assert '# TYPE pets_admission_group_in_flight gauge\npets_admission_group_in_flight{group="lists"} 0' in text
+    assert 'pets_admission_group_waiting{group="lists"} 0' in text
+
+@pytest.mark.asyncio
+async def test_slow_query_log(setup_app, caplog):
+    client = setup_app
+
+    from config import database
+
+    database.slow_query_ms = 0
+    try:
+        with caplog.at_level(logging.WARNING, logger='pets.sql'):
+            client.get('/user/user')
+    finally:
+        database.slow_query_ms = None
+
+    assert any(record.message.startswith('Slow query') for record in caplog.records)
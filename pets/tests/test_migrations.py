@@ -0,0 +1,41 @@
+import sqlalchemy
+
+
+def test_schema_matches_models(setup_app):
+    from config import DATABASE_URL, base_ormar_config
+    from pets.migrations import migrate, pending, sync_engine
+
+    engine = sync_engine(DATABASE_URL)
+    assert pending(engine) == []
+    assert migrate(engine) == []
+
+    inspector = sqlalchemy.inspect(engine)
+    for table in base_ormar_config.metadata.sorted_tables:
+        # The search index is an expression index on Postgres, the models can not declare it.
+        indexes = {index['name'] for index in inspector.get_indexes(table.name)} - {'ix_pets_search_trgm'}
+        assert {column['name'] for column in inspector.get_columns(table.name)} == set(table.columns.keys())
+        assert indexes == {index.name for index in table.indexes}
+
+def test_adopt_existing_database(setup_app, tmp_path):
+    from pets.migrations import migrate, migrations, sync_engine
+
+    engine = sync_engine(f'sqlite:///{tmp_path}/legacy.db')
+    with engine.begin() as connection:
+        connection.execute(sqlalchemy.text(
+            'CREATE TABLE users (id INTEGER PRIMARY KEY, name VARCHAR(100) NOT NULL, email VARCHAR(100) NOT NULL)'
+        ))
+        connection.execute(sqlalchemy.text("INSERT INTO users (name, email) VALUES ('John Doe', 'john@doe.com')"))
+
+    assert [migration.version for migration in migrate(engine, target=2)] == [1, 2]
+    assert [migration.version for migration in migrate(engine)] == [migration.version for migration in migrations()][2:]
+    assert migrate(engine) == []
+
+    with engine.connect() as connection:
+        row = connection.execute(sqlalchemy.text('SELECT version, updated_at FROM users')).one()
+    assert row.version == 1 and row.updated_at is not None
+    assert 'ix_users_email' in {index['name'] for index in sqlalchemy.inspect(engine).get_indexes('users')}
+
+def test_import_opens_no_connection(setup_app):
+    from config import base_ormar_config
+
+    assert base_ormar_config.engine is None
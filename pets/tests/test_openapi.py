@@ -0,0 +1,66 @@
+import gzip
+import json
+
+import yaml
+
+from pets.openapi import SCHEMA_FILE, dump_schema, generate_schema
+
+
+def test_precomputed_schema(setup_app):
+    client = setup_app
+
+    from cafeto.schema.openapi import create_schema
+
+    schema = json.loads(json.dumps(create_schema(client.app, '3.0.1', None, None, None)))
+    assert client.get('/schema/openapi.json').json() == schema
+    assert yaml.safe_load(client.get('/schema/openapi.yaml').text) == schema
+    assert client.app.state.openapi.json is client.app.state.openapi.json
+
+
+def test_schema_up_to_date(setup_app):
+    client = setup_app
+
+    with open(SCHEMA_FILE, 'r', encoding='utf-8') as file:
+        assert file.read() == dump_schema(generate_schema(client.app)), \
+            'pets/openapi.json is out of date, run python -m pets.commands.openapi'
+
+
+def test_schema_etag_and_compression(setup_app):
+    client = setup_app
+
+    response = client.get('/schema/openapi.json', headers={'Accept-Encoding': 'identity'})
+    assert response.status_code == 200
+    assert 'Content-Encoding' not in response.headers
+    assert response.headers['Vary'] == 'Accept-Encoding'
+    assert response.headers['Cache-Control'] == 'public, max-age=3600'
+    etag = response.headers['ETag']
+
+    response = client.get('/schema/openapi.json', headers={'Accept-Encoding': 'identity', 'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.content == b''
+
+    document = client.app.state.openapi
+    response = client.get(
+        f'/schema/openapi.json?v={document.json.version}', headers={'Accept-Encoding': 'gzip;q=1, br;q=0'}
+    )
+    assert response.status_code == 200
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert response.headers['ETag'] == document.json.etag('gzip') != etag
+    assert response.headers['Cache-Control'] == 'public, max-age=31536000, immutable'
+    assert gzip.decompress(document.json.variant('gzip')) == document.json.body
+
+
+def test_swagger(setup_app):
+    client = setup_app
+
+    response = client.get('/schema/swagger-ui.html')
+    assert response.status_code == 200
+    assert f'/schema/openapi.yaml?v={client.app.state.openapi.yaml.version}' in response.text
+
+    for name in ('swagger-ui.css', 'swagger-ui-bundle.js', 'swagger-ui-standalone-preset.js'):
+        url = next(line for line in response.text.split('"') if line.startswith(f'/schema/assets/{name}?v='))
+        asset = client.get(url)
+        assert asset.status_code == 200
+        assert asset.headers['Cache-Control'] == 'public, max-age=31536000, immutable'
+
+    assert client.get('/schema/assets/unknown.js').status_code == 404
@@ -130,11 +130,179 @@ async def test_list(setup_app):
 
     response = client.get('/pet/pet')
     assert response.status_code == 200
-    assert response.json() == [
-        {'id': 1, 'name': 'Buddy', 'breed': 'Golden Retriever', 'age': 3, 'owner': {'id': user.id}},
-        {'id': 2, 'name': 'Max', 'breed': 'Labrador', 'age': 5, 'owner': {'id': user.id}}
+    assert response.json() == {
+        'data': [
+            {'id': 1, 'name': 'Buddy', 'breed': 'Golden Retriever', 'age': 3, 'owner': {'id': user.id}},
+            {'id': 2, 'name': 'Max', 'breed': 'Labrador', 'age': 5, 'owner': {'id': user.id}}
+        ],
+        'next_cursor': None
+    }
+
+@pytest.mark.asyncio
+async def test_list_paginated(setup_app):
+    client = setup_app
+
+    from pets.models import User, Pet
+
+    user = await User.objects.create(name='John Doe', email='john@doe.com')
+    for name in ['Buddy', 'Max', 'Luna']:
+        await Pet.objects.create(name=name, breed='Mutt', age=1, owner=user)
+
+    response = client.get('/pet/pet', params={'limit': 2}).json()
+    assert [pet['name'] for pet in response['data']] == ['Buddy', 'Max']
+    assert response['next_cursor'] is not None
+
+    response = client.get('/pet/pet', params={'limit': 2, 'after': response['next_cursor']}).json()
+    assert [pet['name'] for pet in response['data']] == ['Luna']
+    assert response['next_cursor'] is None
+
+@pytest.mark.asyncio
+async def test_list_invalid_cursor(setup_app):
+    client = setup_app
+
+    response = client.get('/pet/pet', params={'after': 'not-a-cursor'})
+    assert response.status_code == codes.CODE_400_BAD_REQUEST.value
+    assert response.json() == [{'type': 'invalid-cursor', 'msg': 'Invalid cursor', 'loc': ['after']}]
+
+@pytest.mark.asyncio
+async def test_list_stream(setup_app):
+    client = setup_app
+
+    import json
+    from pets.models import User, Pet
+
+    user = await User.objects.create(name='John Doe', email='john@doe.com')
+
+    await Pet.objects.create(name='Buddy', breed='Golden Retriever', age=3, owner=user)
+    await Pet.objects.create(name='Max', breed='Labrador', age=5, owner=user)
+
+    for response in [
+        client.get('/pet/pet', params={'stream': 1}),
+        client.get('/pet/pet', headers={'Accept': 'application/x-ndjson'})
+    ]:
+        assert response.status_code == codes.CODE_200_OK.value
+        assert response.headers['content-type'].startswith('application/x-ndjson')
+        assert [json.loads(line) for line in response.text.splitlines()] == [
+            {'id': 1, 'name': 'Buddy', 'breed': 'Golden Retriever', 'age': 3, 'owner': {'id': user.id}},
+            {'id': 2, 'name': 'Max', 'breed': 'Labrador', 'age': 5, 'owner': {'id': user.id}}
+        ]
+
+@pytest.mark.asyncio
+async def test_list_filter_sort_fields(setup_app):
+    client = setup_app
+
+    from pets.models import User, Pet
+
+    john = await User.objects.create(name='John Doe', email='john@doe.com')
+    jane = await User.objects.create(name='Jane Doe', email='jane@doe.com')
+    await Pet.objects.create(name='Buddy', breed='Beagle', age=3, owner=john)
+    await Pet.objects.create(name='Bella', breed='Beagle', age=5, owner=jane)
+    await Pet.objects.create(name='Max', breed='Bulldog', age=5, owner=john)
+    await Pet.objects.create(name='Bruno', breed='Beagle', age=5, owner=john)
+    await Pet.objects.create(name='Oreo', breed='Beagle', age=12, owner=john)
+
+    params = {'breed': 'Beagle', 'age_min': 3, 'age_max': 10, 'sort': '-age', 'limit': 2}
+    response = client.get('/pet/pet', params=params).json()
+    assert [pet['name'] for pet in response['data']] == ['Bruno', 'Bella']
+
+    cursor = response['next_cursor']
+    response = client.get('/pet/pet', params={**params, 'after': cursor}).json()
+    assert [pet['name'] for pet in response['data']] == ['Buddy']
+    assert response['next_cursor'] is None
+
+    response = client.get('/pet/pet', params={'after': cursor})
+    assert response.status_code == codes.CODE_400_BAD_REQUEST.value
+
+    response = client.get('/pet/pet', params={'owner_id': john.id, 'name_prefix': 'B', 'fields': 'name,owner'})
+    assert response.json() == {
+        'data': [{'name': 'Buddy', 'owner': {'id': john.id}}, {'name': 'Bruno', 'owner': {'id': john.id}}],
+        'next_cursor': None
+    }
+
+    response = client.get('/pet/pet', params={'sort': 'owner'})
+    assert response.status_code == codes.CODE_400_BAD_REQUEST.value
+    assert response.json()[0]['type'] == 'invalid-sort'
+
+    response = client.get('/pet/pet', params={'fields': 'id,color'})
+    assert response.status_code == codes.CODE_400_BAD_REQUEST.value
+    assert response.json()[0]['type'] == 'invalid-fields'
+
+@pytest.mark.asyncio
+async def test_name_prefix_uses_index(setup_app):
+    client = setup_app
+
+    import os
+    import sqlalchemy
+    import pets.dtos as dtos
+    from pets.models import User, Pet
+    from pets.migrations import sync_engine
+    from pets.services.pet_service import PetServiceDB
+
+    user = await User.objects.create(name='John Doe', email='john@doe.com')
+    for name in ('Bo', 'Bob', 'Bo\U0001f436', 'Bp', 'B', 'bob'):
+        await Pet.objects.create(name=name, breed='Mutt', age=3, owner=user)
+
+    response = client.get('/pet/pet', params={'name_prefix': 'Bo', 'sort': 'name', 'fields': 'name'}).json()
+    assert [pet['name'] for pet in response['data']] == ['Bo', 'Bob', 'Bo\U0001f436']
+
+    engine = sync_engine(os.environ['DATABASE_URL'])
+    query = PetServiceDB()._PetServiceDB__filter(Pet.objects, dtos.PetFilterDto(name_prefix='Bo'))
+    sql = query.build_select_expression().compile(dialect=engine.dialect, compile_kwargs={'literal_binds': True})
+    with engine.connect() as connection:
+        plan = [row[3] for row in connection.execute(sqlalchemy.text(f'EXPLAIN QUERY PLAN {sql}'))]
+    assert any('USING INDEX ix_pets_name_id' in step for step in plan), plan
+
+@pytest.mark.asyncio
+async def test_from_row_matches_orm(setup_app):
+    import pets.dtos as dtos
+    from pets.db import fetch_rows
+    from pets.models import User, Pet
+
+    user = await User.objects.create(name='John Doe', email='john@doe.com')
+    await Pet.objects.create(name='Buddy', breed='Beagle', age=3, owner=user)
+    await Pet.objects.create(name='Max ñ "quoted"', breed='Bulldog', age=0, owner=user)
+
+    from_orm = [dtos.PetResponseDto(**pet.model_dump()) for pet in await Pet.objects.order_by('id').all()]
+    from_row = [dtos.PetResponseDto.from_row(row) for row in await fetch_rows(Pet.objects.order_by('id'))]
+    assert from_row == from_orm
+    assert dtos.PetResponseDto.model_dump_json_many(from_row) == dtos.PetResponseDto.model_dump_json_many(from_orm)
+
+@pytest.mark.asyncio
+async def test_expand_owner(setup_app):
+    client = setup_app
+
+    from pets.models import User, Pet
+
+    john = await User.objects.create(name='John Doe', email='john@doe.com')
+    jane = await User.objects.create(name='Jane Doe', email='jane@doe.com')
+    await Pet.objects.create(name='Buddy', breed='Golden Retriever', age=3, owner=john)
+    await Pet.objects.create(name='Max', breed='Bulldog', age=5, owner=jane)
+    await Pet.objects.create(name='Oreo', breed='Mutt', age=2, owner=john)
+
+    response = client.get('/pet/pet', params={'expand': 'owner', 'limit': 2})
+    assert response.status_code == codes.CODE_200_OK.value
+    assert 'db;desc="1 queries"' in response.headers['server-timing']
+
+    response = response.json()
+    assert [pet['owner'] for pet in response['data']] == [
+        {'id': john.id, 'name': 'John Doe', 'email': 'john@doe.com'},
+        {'id': jane.id, 'name': 'Jane Doe', 'email': 'jane@doe.com'}
     ]
 
+    response = client.get('/pet/pet', params={'expand': 'owner', 'after': response['next_cursor']}).json()
+    assert [pet['name'] for pet in response['data']] == ['Oreo']
+    assert response['next_cursor'] is None
+
+    response = client.get('/pet/pet/2', params={'expand': 'owner'})
+    assert response.status_code == codes.CODE_200_OK.value
+    assert response.json()['owner'] == {'id': jane.id, 'name': 'Jane Doe', 'email': 'jane@doe.com'}
+
+    assert client.get('/pet/pet/4', params={'expand': 'owner'}).status_code == codes.CODE_404_NOT_FOUND.value
+
+    response = client.get('/pet/pet', params={'expand': 'pets'})
+    assert response.status_code == codes.CODE_400_BAD_REQUEST.value
+    assert response.json()[0]['type'] == 'invalid-expand'
+
 @pytest.mark.asyncio
 async def test_update(setup_app):
     client = setup_app
@@ -207,6 +375,26 @@ async def test_delete(setup_app):
 
     assert await Pet.objects.filter(id=1).first_or_none() is None
 
+
+@pytest.mark.asyncio
+async def test_delete_query_count(setup_app):
+    client = setup_app
+
+    from pets.models import User, Pet
+
+    user = await User.objects.create(name='John Doe', email='john@doe.com')
+    pet = await Pet.objects.create(name='Pinto', breed='Mutt', age=5, owner=user)
+
+    # One DELETE ... RETURNING, no exists() first.
+    response = client.delete(f'/pet/pet/{pet.id}')
+    assert response.status_code == codes.CODE_204_NO_CONTENT.value
+    assert 'db;desc="1 queries"' in response.headers['server-timing']
+
+    response = client.delete(f'/pet/pet/{pet.id}')
+    assert response.status_code == codes.CODE_404_NOT_FOUND.value
+    assert 'db;desc="1 queries"' in response.headers['server-timing']
+
+
 @pytest.mark.asyncio
 async def test_delete_not_found(setup_app):
     client = setup_app
@@ -230,3 +418,300 @@ async def test_get_breeds_animal_not_found(setup_breed_service_app):
     response = client.get('/pet/breeds/dinasour')
     assert response.status_code == codes.CODE_200_OK.value
     assert response.json() == {'data': []}
+
+@pytest.mark.asyncio
+async def test_get_breeds_from_catalog(setup_app):
+    from pets.services.breeds_service import ABreedsService, BreedsService
+
+    client = setup_app
+    client.app.add_scoped(ABreedsService, BreedsService, override=True)
+
+    response = client.get('/pet/breeds/dog')
+    assert response.status_code == codes.CODE_200_OK.value
+    assert response.json()['data'][:2] == ['Mixed Breed', 'Labrador Retriever']
+
+    response = client.get('/pet/breeds/dinasour')
+    assert response.json() == {'data': []}
+
+def test_breeds_catalog_reload(tmp_path):
+    import json
+    import os
+    from pets.breeds import BreedsCatalog
+
+    path = tmp_path / 'breeds.json'
+    path.write_text(json.dumps({'dog': ['Poodle']}))
+
+    catalog = BreedsCatalog(str(path), check_interval=0)
+    assert catalog.get('dog') == ('Poodle',)
+
+    path.write_text(json.dumps({'dog': ['Boxer', 'Beagle']}))
+    stat = os.stat(path)
+    os.utime(path, (stat.st_atime, stat.st_mtime + 10))
+    assert catalog.get('dog') == ('Boxer', 'Beagle')
+    assert catalog.get('cat') == ()
+
+@pytest.mark.asyncio
+async def test_bulk_create(setup_app):
+    client = setup_app
+
+    from pets.models import User, Pet
+
+    user = await User.objects.create(name='John Doe', email='john@doe.com')
+
+    items = [
+        {'name': 'Buddy', 'breed': 'Golden Retriever', 'age': 3, 'owner': {'id': user.id}},
+        {'name': 'Ghost', 'breed': 'Mutt', 'age': 1, 'owner': {'id': 999}},
+        {'name': 'Max', 'breed': 'Labrador', 'age': 5, 'owner': {'id': user.id}}
+    ]
+    response = client.post('/pet/pet/bulk', json={'items': items})
+    assert response.status_code == codes.CODE_200_OK.value
+    assert response.json() == {
+        'results': [
+            {'index': 0, 'data': {'id': 1, **items[0]}, 'errors': []},
+            {'index': 1, 'data': None, 'errors': [{'type': 'owner-not-found', 'msg': 'Owner not found', 'loc': ['owner']}]},
+            {'index': 2, 'data': {'id': 2, **items[2]}, 'errors': []}
+        ]
+    }
+    assert await Pet.objects.count() == 2
+
+@pytest.mark.asyncio
+async def test_bulk_create_too_many(setup_app, monkeypatch):
+    client = setup_app
+
+    from pets.dtos import bulk_dtos
+
+    monkeypatch.setattr(bulk_dtos, 'MAX_BULK_SIZE', 1)
+    item = {'name': 'Buddy', 'breed': 'Golden Retriever', 'age': 3, 'owner': {'id': 1}}
+    response = client.post('/pet/pet/bulk', json={'items': [item, item]})
+    assert response.status_code == codes.CODE_400_BAD_REQUEST.value
+    assert response.json()['errorList'][0]['type'] == 'too-many-items'
+
+@pytest.mark.asyncio
+async def test_bulk_update_and_delete(setup_app):
+    client = setup_app
+
+    from pets.models import User, Pet
+
+    user = await User.objects.create(name='John Doe', email='john@doe.com')
+    await Pet.objects.create(name='Buddy', breed='Golden Retriever', age=3, owner=user)
+    await Pet.objects.create(name='Max', breed='Labrador', age=5, owner=user)
+
+    items = [
+        {'id': 1, 'name': 'Buddy', 'breed': 'Golden Retriever', 'age': 4, 'owner': {'id': user.id}},
+        {'id': 7, 'name': 'Ghost', 'breed': 'Mutt', 'age': 1, 'owner': {'id': user.id}}
+    ]
+    response = client.put('/pet/pet/bulk', json={'items': items}).json()
+    assert response['results'][0]['data'] == items[0]
+    assert response['results'][1]['errors'][0]['type'] == 'pet-not-found'
+    assert (await Pet.objects.get(id=1)).age == 4
+
+    response = client.request('DELETE', '/pet/pet/bulk', json={'ids': [2, 7]}).json()
+    assert response['results'][0] == {'index': 0, 'data': 2, 'errors': []}
+    assert response['results'][1]['errors'][0]['type'] == 'pet-not-found'
+    assert await Pet.objects.count() == 1
+
+
+@pytest.mark.asyncio
+async def test_bulk_update_single_statement(setup_app, monkeypatch):
+    client = setup_app
+
+    import pets.services.pet_service as pet_service
+    from pets.models import User, Pet
+
+    user = await User.objects.create(name='John Doe', email='john@doe.com')
+    for name in ('Buddy', 'Max', 'Rex'):
+        await Pet.objects.create(name=name, breed='Mutt', age=3, owner=user)
+
+    items = [
+        {'id': 1, 'name': 'Buddy', 'breed': 'Mutt', 'age': 4, 'owner': {'id': user.id}},
+        {'id': 2, 'name': 'Max', 'breed': 'Mutt', 'age': 5, 'owner': {'id': user.id}},
+        {'id': 1, 'name': 'Buddy', 'breed': 'Mutt', 'age': 6, 'owner': {'id': user.id}},
+    ]
+    # Owners, pets and the UPDATE, plus a second UPDATE for the repeated id.
+    response = client.put('/pet/pet/bulk', json={'items': items})
+    assert 'db;desc="4 queries"' in response.headers['server-timing']
+    assert [result['data']['age'] for result in response.json()['results']] == [4, 5, 6]
+    assert [(pet.age, pet.version) for pet in await Pet.objects.order_by('id').all()] == [(6, 3), (5, 2), (3, 1)]
+
+    update_many_versioned = pet_service.update_many_versioned
+
+    async def deleted_meanwhile(table, rows):
+        await Pet.objects.filter(id=2).delete()
+        return await update_many_versioned(table, rows)
+
+    monkeypatch.setattr(pet_service, 'update_many_versioned', deleted_meanwhile)
+    items = [
+        {'id': 2, 'name': 'Max', 'breed': 'Mutt', 'age': 7, 'owner': {'id': user.id}},
+        {'id': 3, 'name': 'Rex', 'breed': 'Mutt', 'age': 7, 'owner': {'id': user.id}},
+    ]
+    response = client.put('/pet/pet/bulk', json={'items': items})
+    assert response.status_code == 200
+    assert response.json()['results'][0] == {
+        'index': 0, 'data': None,
+        'errors': [{'loc': ['__model__'], 'type': 'pet-not-found', 'msg': 'Pet not found'}]
+    }
+    assert response.json()['results'][1]['data']['age'] == 7
+
+
+@pytest.mark.asyncio
+async def test_conditional_get(setup_app):
+    client = setup_app
+
+    from pets.models import User, Pet
+
+    user = await User.objects.create(name='John Doe', email='john@doe.com')
+    await Pet.objects.create(name='Buddy', breed='Golden Retriever', age=3, owner=user)
+
+    response = client.get('/pet/pet/1')
+    assert response.headers['etag'] == '"1"'
+    assert client.get('/pet/pet/1', headers={'If-None-Match': '"1"'}).status_code == 304
+    response = client.get('/pet/pet/1', headers={'If-Modified-Since': response.headers['last-modified']})
+    assert response.status_code == 304
+
+    page = client.get('/pet/pet')
+    etag = page.headers['etag']
+    response = client.get('/pet/pet', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert 'db;desc="1 queries"' in response.headers['server-timing']
+
+    update_data = {'name': 'Buddy Updated', 'breed': 'Golden Retriever', 'age': 4, 'owner': {'id': user.id}}
+    response = client.put('/pet/pet/1', json=update_data)
+    assert response.headers['etag'] == '"2"'
+    assert client.get('/pet/pet/1', headers={'If-None-Match': '"1"'}).status_code == codes.CODE_200_OK.value
+    assert client.get('/pet/pet', headers={'If-None-Match': etag}).status_code == codes.CODE_200_OK.value
+
+@pytest.mark.asyncio
+async def test_update_if_match(setup_app):
+    client = setup_app
+
+    from pets.models import User, Pet
+
+    user = await User.objects.create(name='John Doe', email='john@doe.com')
+    await Pet.objects.create(name='Buddy', breed='Golden Retriever', age=3, owner=user)
+
+    update_data = {'name': 'Buddy Updated', 'breed': 'Golden Retriever', 'age': 4, 'owner': {'id': user.id}}
+    response = client.put('/pet/pet/1', json=update_data, headers={'If-Match': '"1"'})
+    assert response.status_code == codes.CODE_200_OK.value
+
+    response = client.put('/pet/pet/1', json=update_data, headers={'If-Match': '"1"'})
+    assert response.status_code == 412
+    assert response.json()[0]['type'] == 'version-mismatch'
+
+    response = client.put('/pet/pet/9', json=update_data, headers={'If-Match': '"1"'})
+    assert response.status_code == codes.CODE_404_NOT_FOUND.value
+
+    pet = await Pet.objects.get(id=1)
+    assert (pet.name, pet.version) == ('Buddy Updated', 2)
+
+@pytest.mark.asyncio
+async def test_search(setup_app):
+    client = setup_app
+
+    from pets.models import User, Pet
+
+    user = await User.objects.create(name='John Doe', email='john@doe.com')
+    await Pet.objects.create(name='Buddy', breed='Golden Retriever', age=3, owner=user)
+    await Pet.objects.create(name='Max', breed='Labrador', age=5, owner=user)
+    await Pet.objects.create(name='Maximus', breed='Beagle', age=2, owner=user)
+    await Pet.objects.create(name='Oreo', breed='Beagle', age=4, owner=user)
+
+    def names(params):
+        response = client.get('/pet/search', params=params)
+        assert response.status_code == codes.CODE_200_OK.value
+        return [pet['name'] for pet in response.json()['data']]
+
+    assert names({'q': 'max'}) == ['Max', 'Maximus']
+    assert names({'q': 'retr'}) == ['Buddy']
+    assert sorted(names({'q': 'beagel'})[:2]) == ['Maximus', 'Oreo']
+    assert names({'q': 'zzz'}) == []
+
+    ranked = names({'q': 'bea'})
+    assert sorted(ranked) == ['Maximus', 'Oreo']
+    response = client.get('/pet/search', params={'q': 'bea', 'limit': 1}).json()
+    assert [pet['name'] for pet in response['data']] == ranked[:1]
+    response = client.get('/pet/search', params={'q': 'bea', 'limit': 1, 'after': response['next_cursor']}).json()
+    assert [pet['name'] for pet in response['data']] == ranked[1:]
+    assert response['next_cursor'] is None
+
+    # The index follows creates, updates and deletes.
+    pet = client.post('/pet/pet', json={'name': 'Rex', 'breed': 'Poodle', 'age': 1, 'owner': {'id': user.id}}).json()
+    assert names({'q': 'poodle'}) == ['Rex']
+    client.put(f'/pet/pet/{pet["id"]}', json={'name': 'Rex', 'breed': 'Boxer', 'age': 1, 'owner': {'id': user.id}})
+    assert names({'q': 'poodle'}) == []
+    assert names({'q': 'boxer'}) == ['Rex']
+    client.delete(f'/pet/pet/{pet["id"]}')
+    assert names({'q': 'boxer'}) == []
+
+    response = client.get('/pet/search', params={'q': 'ab'})
+    assert response.status_code == codes.CODE_400_BAD_REQUEST.value
+    assert response.json()[0]['type'] == 'invalid-query'
+
+    response = client.get('/pet/search', params={'q': 'max', 'after': 'abc'})
+    assert response.status_code == codes.CODE_400_BAD_REQUEST.value
+
+
+@pytest.mark.asyncio
+async def test_stats(setup_app):
+    client = setup_app
+
+    from config import DATABASE_URL
+    from pets.migrations import sync_engine
+    from pets.models import User, Pet
+    from pets.stats import rebuild
+
+    john = await User.objects.create(name='John Doe', email='john@doe.com')
+    jane = await User.objects.create(name='Jane Doe', email='jane@doe.com')
+    await Pet.objects.create(name='Buddy', breed='Beagle', age=3, owner=john)
+    await Pet.objects.create(name='Max', breed='Beagle', age=7, owner=john)
+    pet = client.post('/pet/pet', json={'name': 'Rex', 'breed': 'Poodle', 'age': 1, 'owner': {'id': jane.id}}).json()
+    client.post('/pet/pet/bulk', json={'items': [
+        {'name': 'Oreo', 'breed': 'Boxer', 'age': 12, 'owner': {'id': jane.id}},
+        {'name': 'Luna', 'breed': 'Boxer', 'age': 4, 'owner': {'id': jane.id}},
+    ]})
+
+    response = client.get('/pet/stats')
+    assert response.status_code == codes.CODE_200_OK.value
+    assert response.json() == {
+        'pets': 5,
+        'owners': 2,
+        'breeds': [{'breed': 'Beagle', 'pets': 2}, {'breed': 'Boxer', 'pets': 2}, {'breed': 'Poodle', 'pets': 1}],
+        'ages': [
+            {'age_min': 0, 'age_max': 4, 'pets': 3},
+            {'age_min': 5, 'age_max': 9, 'pets': 1},
+            {'age_min': 10, 'age_max': 14, 'pets': 1},
+        ],
+        'pets_per_owner': [{'pets': 2, 'owners': 1}, {'pets': 3, 'owners': 1}],
+    }
+
+    # Updates move the counts, deletes (also of the owner) remove them.
+    client.put(f'/pet/pet/{pet["id"]}', json={'name': 'Rex', 'breed': 'Beagle', 'age': 1, 'owner': {'id': john.id}})
+    stats = client.get('/pet/stats').json()
+    assert stats['breeds'] == [{'breed': 'Beagle', 'pets': 3}, {'breed': 'Boxer', 'pets': 2}]
+    assert stats['pets_per_owner'] == [{'pets': 2, 'owners': 1}, {'pets': 3, 'owners': 1}]
+
+    assert client.delete(f'/user/user/{jane.id}').status_code == codes.CODE_204_NO_CONTENT.value
+    client.delete(f'/pet/pet/{pet["id"]}')
+    stats = client.get('/pet/stats').json()
+    assert stats['breeds'] == [{'breed': 'Beagle', 'pets': 2}]
+    assert stats['ages'] == [{'age_min': 0, 'age_max': 4, 'pets': 1}, {'age_min': 5, 'age_max': 9, 'pets': 1}]
+    assert stats['pets_per_owner'] == [{'pets': 2, 'owners': 1}]
+
+    with sync_engine(DATABASE_URL).begin() as connection:
+        rebuild(connection)
+    assert client.get('/pet/stats').json() == stats
+
+    # A pet without owner counts as a pet, not as an owner, also when it gets one later.
+    stray = await Pet.objects.create(name='Stray', breed='Mutt', age=2)
+    stats = client.get('/pet/stats').json()
+    assert stats['pets'] == 3
+    assert stats['pets_per_owner'] == [{'pets': 2, 'owners': 1}]
+
+    await Pet.objects.filter(id=stray.id).update(owner=john.id)
+    assert client.get('/pet/stats').json()['pets_per_owner'] == [{'pets': 3, 'owners': 1}]
+    await Pet.objects.filter(id=stray.id).update(owner=None)
+    stats = client.get('/pet/stats').json()
+    assert stats['pets_per_owner'] == [{'pets': 2, 'owners': 1}]
+
+    with sync_engine(DATABASE_URL).begin() as connection:
+        rebuild(connection)
+    assert client.get('/pet/stats').json() == stats
@@ -0,0 +1,43 @@
+import pytest
+
+from cafeto.responses import codes
+
+
+@pytest.mark.asyncio
+async def test_limiter_timeout(setup_app):
+    from pets.errors import PoolExhausted
+    from pets.pool import PoolLimiter
+
+    limiter = PoolLimiter(1, 0.01)
+    await limiter.acquire()
+    assert limiter.stats() == {'max_size': 1, 'in_use': 1, 'waiting': 0, 'timeouts': 0}
+
+    with pytest.raises(PoolExhausted):
+        await limiter.acquire()
+    assert limiter.stats() == {'max_size': 1, 'in_use': 1, 'waiting': 0, 'timeouts': 1}
+
+    limiter.release()
+    await limiter.acquire()
+    assert limiter.in_use == 1
+
+@pytest.mark.asyncio
+async def test_pool_exhausted(setup_app):
+    client = setup_app
+
+    from config import database
+    from pets.pool import PoolLimiter
+
+    limiter = database.limiter
+    database.limiter = PoolLimiter(0, 0.01)
+    try:
+        response = client.get('/user/user')
+    finally:
+        database.limiter = limiter
+
+    assert response.status_code == codes.CODE_503_SERVICE_UNAVAILABLE.value
+    assert response.headers['retry-after'] == '1'
+    assert response.json()['errorList'][0]['type'] == 'pool-exhausted'
+
+    response = client.get('/metrics')
+    assert 'pets_db_pool_in_use 0' in response.text
+    assert 'pets_db_pool_max_size' in response.text
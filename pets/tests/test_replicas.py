@@ -0,0 +1,58 @@
+import pytest
+import sqlalchemy
+
+from cafeto.responses import codes
+
+
+@pytest.mark.asyncio
+async def test_replica_strategies(setup_app):
+    from pets.pool import PooledDatabase, PoolLimiter
+    from pets.replicas import ReplicaSet, LEAST_BUSY
+
+    first = PooledDatabase('sqlite:///first.db', limiter=PoolLimiter(2, 1))
+    second = PooledDatabase('sqlite:///second.db', limiter=PoolLimiter(2, 1))
+
+    replicas = ReplicaSet([first, second])
+    assert [replicas.pick() for _ in range(3)] == [first, second, first]
+
+    replicas = ReplicaSet([first, second], strategy=LEAST_BUSY)
+    await first.limiter.acquire()
+    assert replicas.pick() is second
+
+    with pytest.raises(ValueError):
+        ReplicaSet([first], strategy='random')
+
+@pytest.mark.asyncio
+async def test_reads_from_replica(setup_app, tmp_path):
+    client = setup_app
+
+    from config import database, base_ormar_config
+    from pets.models import User
+    from pets.pool import PooledDatabase, PoolLimiter
+    from pets.replicas import ReplicaSet, LAST_WRITE_COOKIE
+
+    url = f'sqlite:///{tmp_path}/replica.db'
+    replica_engine = sqlalchemy.create_engine(url)
+    base_ormar_config.metadata.create_all(replica_engine)
+    with replica_engine.begin() as connection:
+        connection.execute(User.ormar_config.table.insert().values(name='Replica', email='replica@doe.com'))
+
+    await User.objects.create(name='Primary', email='primary@doe.com')
+
+    replicas = database.replicas
+    database.replicas = ReplicaSet([PooledDatabase(url, limiter=PoolLimiter(2, 1))], pin_seconds=5)
+    try:
+        assert client.get('/user/user/1').json()['name'] == 'Replica'
+        assert client.get('/user/user').json()['data'][0]['name'] == 'Replica'
+
+        update_data = {'id': 1, 'name': 'Updated', 'email': 'primary@doe.com'}
+        response = client.put('/user/user/1', json=update_data)
+        assert response.status_code == codes.CODE_200_OK.value
+        assert LAST_WRITE_COOKIE in client.cookies
+
+        assert client.get('/user/user').json()['data'][0]['name'] == 'Updated'
+
+        client.cookies.clear()
+        assert client.get('/user/user').json()['data'][0]['name'] == 'Replica'
+    finally:
+        database.replicas = replicas
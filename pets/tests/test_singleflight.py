@@ -0,0 +1,69 @@
+import asyncio
+
+import pytest
+
+
+@pytest.mark.asyncio
+async def test_coalesce(setup_app):
+    from pets.singleflight import SingleFlight
+
+    flights = SingleFlight()
+    release = asyncio.Event()
+    runs = 0
+
+    async def load():
+        nonlocal runs
+        runs += 1
+        await release.wait()
+        return 'pet'
+
+    callers = [asyncio.ensure_future(flights.do('pet:1', load)) for _ in range(5)]
+    await asyncio.sleep(0)
+    release.set()
+    assert await asyncio.gather(*callers) == ['pet'] * 5
+    assert runs == 1
+    assert flights.stats() == {'calls': 1, 'coalesced': 4, 'in_flight': 0}
+
+@pytest.mark.asyncio
+async def test_exception_and_cancellation(setup_app):
+    from pets.singleflight import SingleFlight
+
+    flights = SingleFlight()
+    release = asyncio.Event()
+
+    async def fail():
+        await release.wait()
+        raise ValueError('boom')
+
+    leader = asyncio.ensure_future(flights.do('pet:1', fail))
+    follower = asyncio.ensure_future(flights.do('pet:1', fail))
+    await asyncio.sleep(0)
+
+    leader.cancel()
+    await asyncio.sleep(0)
+    release.set()
+    with pytest.raises(ValueError):
+        await follower
+    assert leader.cancelled()
+
+@pytest.mark.asyncio
+async def test_invalidate(setup_app):
+    from pets.singleflight import SingleFlight
+
+    flights = SingleFlight()
+    release = asyncio.Event()
+    values = iter(['old', 'new'])
+
+    async def load():
+        value = next(values)
+        await release.wait()
+        return value
+
+    before = asyncio.ensure_future(flights.do('pet:1', load))
+    await asyncio.sleep(0)
+    flights.invalidate()
+    after = asyncio.ensure_future(flights.do('pet:1', load))
+    await asyncio.sleep(0)
+    release.set()
+    assert (await before, await after) == ('old', 'new')
+    assert flights.coalesced == 0
@@ -51,6 +51,32 @@ async def test_create_validate(setup_app):
         ]
     }
 
+@pytest.mark.asyncio
+async def test_create_unique_violation(setup_app, monkeypatch):
+    client = setup_app
+
+    from pets.models import User
+    from pets.services.user_service import UserServiceDB
+
+    async def user_exists(self, email, id=None):
+        return False
+
+    # Simulates a concurrent insert that happened after the validator ran.
+    monkeypatch.setattr(UserServiceDB, 'user_exists', user_exists)
+    await User.objects.create(name='John Doe', email='john@doe.com')
+
+    response = client.post('/user/user', json={'name': 'John Doe', 'email': 'john@doe.com'})
+    assert response.status_code == codes.CODE_400_BAD_REQUEST.value
+    assert response.json() == {
+        'errorList': [
+            {
+                'loc': ['email'],
+                'type': 'email-exists',
+                'msg': 'Email already exists'
+            }
+        ]
+    }
+
 @pytest.mark.asyncio
 async def test_view(setup_app):
     client = setup_app
@@ -91,10 +117,97 @@ async def test_list(setup_app):
 
     response = client.get('/user/user')
     assert response.status_code == 200
-    assert response.json() == [
-        {'id': 1, 'name': 'John Doe', 'email': 'john@doe.com'},
-        {'id': 2, 'name': 'Jane Doe', 'email': 'jane@doe.com'}
-    ]
+    assert response.json() == {
+        'data': [
+            {'id': 1, 'name': 'John Doe', 'email': 'john@doe.com'},
+            {'id': 2, 'name': 'Jane Doe', 'email': 'jane@doe.com'}
+        ],
+        'next_cursor': None
+    }
+
+@pytest.mark.asyncio
+async def test_list_paginated(setup_app):
+    client = setup_app
+
+    from pets.models import User
+
+    await User.objects.create(name='John Doe', email='john@doe.com')
+    await User.objects.create(name='Jane Doe', email='jane@doe.com')
+
+    response = client.get('/user/user', params={'limit': 1}).json()
+    assert [user['id'] for user in response['data']] == [1]
+
+    response = client.get('/user/user', params={'limit': 1, 'after': response['next_cursor']}).json()
+    assert [user['id'] for user in response['data']] == [2]
+    assert response['next_cursor'] is None
+
+@pytest.mark.asyncio
+async def test_list_stream(setup_app, monkeypatch):
+    client = setup_app
+
+    import json
+    from pets.models import User
+    from pets.services import pagination
+
+    monkeypatch.setattr(pagination, 'EXPORT_BATCH_SIZE', 2)
+    for i in range(5):
+        await User.objects.create(name=f'User {i}', email=f'user{i}@doe.com')
+
+    response = client.get('/user/user', params={'stream': 'true'})
+    assert response.status_code == codes.CODE_200_OK.value
+    assert [json.loads(line)['id'] for line in response.text.splitlines()] == [1, 2, 3, 4, 5]
+
+@pytest.mark.asyncio
+async def test_list_sort_fields(setup_app):
+    client = setup_app
+
+    from pets.models import User
+
+    await User.objects.create(name='John Doe', email='john@doe.com')
+    await User.objects.create(name='Jane Doe', email='jane@doe.com')
+    await User.objects.create(name='Adam Doe', email='adam@doe.com')
+
+    response = client.get('/user/user', params={'sort': 'email', 'fields': 'email', 'limit': 2}).json()
+    assert response['data'] == [{'email': 'adam@doe.com'}, {'email': 'jane@doe.com'}]
+
+    response = client.get(
+        '/user/user', params={'sort': 'email', 'fields': 'email', 'after': response['next_cursor']}
+    ).json()
+    assert response == {'data': [{'email': 'john@doe.com'}], 'next_cursor': None}
+
+    response = client.get('/user/user', params={'sort': 'name'})
+    assert response.status_code == codes.CODE_400_BAD_REQUEST.value
+    assert response.json()[0]['type'] == 'invalid-sort'
+
+@pytest.mark.asyncio
+async def test_expand_pets(setup_app):
+    client = setup_app
+
+    from pets.models import User, Pet
+
+    john = await User.objects.create(name='John Doe', email='john@doe.com')
+    jane = await User.objects.create(name='Jane Doe', email='jane@doe.com')
+    await User.objects.create(name='Jim Doe', email='jim@doe.com')
+    await Pet.objects.create(name='Buddy', breed='Golden Retriever', age=3, owner=john)
+    await Pet.objects.create(name='Max', breed='Bulldog', age=5, owner=jane)
+    await Pet.objects.create(name='Oreo', breed='Mutt', age=2, owner=john)
+
+    response = client.get('/user/user', params={'expand': 'pets'})
+    assert response.status_code == codes.CODE_200_OK.value
+    assert 'db;desc="2 queries"' in response.headers['server-timing']
+
+    response = response.json()
+    assert [[pet['name'] for pet in user['pets']] for user in response['data']] == [['Buddy', 'Oreo'], ['Max'], []]
+    assert response['data'][1]['pets'][0] == {
+        'id': 2, 'name': 'Max', 'breed': 'Bulldog', 'age': 5, 'owner': {'id': jane.id}
+    }
+
+    response = client.get('/user/user/1', params={'expand': 'pets'})
+    assert response.status_code == codes.CODE_200_OK.value
+    assert [pet['name'] for pet in response.json()['pets']] == ['Buddy', 'Oreo']
+
+    assert client.get('/user/user/4', params={'expand': 'pets'}).status_code == codes.CODE_404_NOT_FOUND.value
+    assert client.get('/user/user/1', params={'expand': 'owner'}).status_code == codes.CODE_400_BAD_REQUEST.value
 
 @pytest.mark.asyncio
 async def test_update(setup_app):
@@ -188,6 +301,157 @@ async def test_delete(setup_app):
     assert await Pet.objects.filter(owner=1).first_or_none() is None
 
 
+@pytest.mark.asyncio
+async def test_delete_in_background(setup_app, monkeypatch):
+    import asyncio
+
+    client = setup_app
+
+    from pets.models import DeletionJob, User, Pet
+    from pets.jobs import deletion_jobs
+
+    monkeypatch.setattr('pets.services.user_service.USER_DELETE_BATCH_SIZE', 2)
+    monkeypatch.setattr(deletion_jobs, 'batch_size', 2)
+
+    user = await User.objects.create(name='John Doe', email='john@doe.com')
+    for index in range(5):
+        await Pet.objects.create(name=f'Pet {index}', breed='Mutt', age=1, owner=user)
+
+    response = client.delete(f'/user/user/{user.id}')
+    assert response.status_code == 202
+    job = response.json()
+    # Counted up to the batch size + 1 by the request, exactly by the job.
+    assert job['status'] == 'pending' and job['pets_total'] == 3 and job['pets_deleted'] == 0
+    assert response.headers['Location'] == f'/user/deletions/{job["id"]}'
+
+    # No new pets for a user being deleted, deleting it again returns the same job.
+    response = client.post('/pet/pet', json={'name': 'Rex', 'breed': 'Mutt', 'age': 1, 'owner': {'id': user.id}})
+    assert response.status_code == codes.CODE_400_BAD_REQUEST.value
+    assert client.delete(f'/user/user/{user.id}').json()['id'] == job['id']
+
+    # Nothing ran it yet (no lifespan in the test client), a starting worker picks it up.
+    # Waits on the event loop of the runner, a request of the test client would block it.
+    await deletion_jobs.start()
+    try:
+        for _ in range(100):
+            if (await DeletionJob.objects.get(id=job['id'])).status == 'done':
+                break
+            await asyncio.sleep(0.02)
+    finally:
+        await deletion_jobs.stop()
+
+    job = client.get(f'/user/deletions/{job["id"]}').json()
+    assert job['status'] == 'done' and job['pets_total'] == job['pets_deleted'] == 5
+    assert await User.objects.filter(id=user.id).count() == 0
+    assert await Pet.objects.count() == 0
+    assert not await deletion_jobs.claim(job['id'])
+
+    response = client.get('/user/deletions/999')
+    assert response.status_code == codes.CODE_404_NOT_FOUND.value
+    assert response.json()[0]['type'] == 'job-not-found'
+
+
+@pytest.mark.asyncio
+async def test_concurrent_deletion_jobs(setup_app, monkeypatch):
+    import asyncio
+
+    client = setup_app
+
+    from pets.models import DeletionJob, User, Pet
+    from pets.jobs import deletion_jobs
+
+    monkeypatch.setattr('pets.services.user_service.USER_DELETE_BATCH_SIZE', 2)
+    monkeypatch.setattr(deletion_jobs, 'batch_size', 2)
+
+    users = [
+        await User.objects.create(name='John Doe', email='john@doe.com'),
+        await User.objects.create(name='Jane Doe', email='jane@doe.com'),
+    ]
+    for user in users:
+        for index in range(5):
+            await Pet.objects.create(name=f'Pet {index}', breed='Mutt', age=1, owner=user)
+
+    response = client.request('DELETE', '/user/user/bulk', json={'ids': [user.id for user in users]}).json()
+    jobs = [result['job']['id'] for result in response['results']]
+
+    # Both jobs run at once, each on its own connection.
+    await deletion_jobs.start()
+    try:
+        for _ in range(100):
+            if await DeletionJob.objects.filter(id__in=jobs, status='done').count() == 2:
+                break
+            await asyncio.sleep(0.02)
+    finally:
+        await deletion_jobs.stop()
+
+    assert [job.status for job in await DeletionJob.objects.order_by('id').all()] == ['done', 'done']
+    assert await User.objects.count() == 0
+    assert await Pet.objects.count() == 0
+
+
+@pytest.mark.asyncio
+async def test_from_row_matches_orm(setup_app):
+    import pets.dtos as dtos
+    from pets.db import fetch_rows
+    from pets.models import User
+
+    await User.objects.create(name='John Doe', email='john@doe.com')
+    await User.objects.create(name='Jane ñ "quoted"', email='jane@doe.com', deleting=True)
+
+    from_orm = [dtos.UserResponseDto(**user.model_dump()) for user in await User.objects.order_by('id').all()]
+    from_row = [dtos.UserResponseDto.from_row(row) for row in await fetch_rows(User.objects.order_by('id'))]
+    assert from_row == from_orm
+    assert dtos.UserResponseDto.model_dump_json_many(from_row) == dtos.UserResponseDto.model_dump_json_many(from_orm)
+
+
+@pytest.mark.asyncio
+async def test_delete_query_count(setup_app):
+    client = setup_app
+
+    from pets.models import User, Pet
+
+    user = await User.objects.create(name='John Doe', email='john@doe.com')
+    await Pet.objects.create(name='Pinto', breed='Mutt', age=5, owner=user)
+    await Pet.objects.create(name='Oreo', breed='Mutt', age=2, owner=user)
+
+    # The checks live in the two DELETE statements, nothing is read before (see the Timings counter).
+    response = client.delete(f'/user/user/{user.id}')
+    assert response.status_code == codes.CODE_204_NO_CONTENT.value
+    assert 'db;desc="2 queries"' in response.headers['server-timing']
+
+
+@pytest.mark.asyncio
+async def test_bulk_delete_in_background(setup_app, monkeypatch):
+    client = setup_app
+
+    from pets.models import User, Pet
+
+    monkeypatch.setattr('pets.services.user_service.USER_DELETE_BATCH_SIZE', 2)
+
+    small = await User.objects.create(name='John Doe', email='john@doe.com')
+    big = await User.objects.create(name='Jane Doe', email='jane@doe.com')
+    empty = await User.objects.create(name='Jim Doe', email='jim@doe.com')
+    await Pet.objects.create(name='Pinto', breed='Mutt', age=5, owner=small)
+    for index in range(3):
+        await Pet.objects.create(name=f'Pet {index}', breed='Mutt', age=1, owner=big)
+
+    response = client.request('DELETE', '/user/user/bulk', json={'ids': [small.id, big.id, 999, empty.id]})
+    assert response.status_code == codes.CODE_200_OK.value
+    results = response.json()['results']
+    assert results[0] == {'index': 0, 'data': small.id, 'errors': [], 'job': None}
+    assert results[1]['data'] == big.id and results[1]['errors'] == []
+    assert results[1]['job']['user_id'] == big.id and results[1]['job']['status'] == 'pending'
+    assert results[2]['errors'][0]['type'] == 'user-not-found'
+    assert results[3] == {'index': 3, 'data': empty.id, 'errors': [], 'job': None}
+
+    # The big user is left to its job, deleting it again returns the same job.
+    assert (await User.objects.get(id=big.id)).deleting
+    assert await Pet.objects.filter(owner=big.id).count() == 3
+    assert await User.objects.filter(id__in=[small.id, empty.id]).count() == 0
+    response = client.request('DELETE', '/user/user/bulk', json={'ids': [big.id]}).json()
+    assert response['results'][0]['job']['id'] == results[1]['job']['id']
+
+
 @pytest.mark.asyncio
 async def test_delete_not_found(setup_app):
     client = setup_app
@@ -197,3 +461,105 @@ async def test_delete_not_found(setup_app):
 
     response = response.json()
     assert response == [{'type': 'user-not-found', 'msg': 'User not found', 'loc': ['__model__']}]
+
+
+@pytest.mark.asyncio
+async def test_bulk_create(setup_app):
+    client = setup_app
+
+    from pets.models import User
+
+    await User.objects.create(name='John Doe', email='john@doe.com')
+
+    items = [
+        {'name': 'Jane Doe', 'email': 'jane@doe.com'},
+        {'name': 'John Again', 'email': 'john@doe.com'},
+        {'name': 'Jane Again', 'email': 'jane@doe.com'}
+    ]
+    response = client.post('/user/user/bulk', json={'items': items})
+    assert response.status_code == codes.CODE_200_OK.value
+
+    email_exists = [{'type': 'email-exists', 'msg': 'Email already exists', 'loc': ['email']}]
+    assert response.json() == {
+        'results': [
+            {'index': 0, 'data': {'id': 2, **items[0]}, 'errors': []},
+            {'index': 1, 'data': None, 'errors': email_exists},
+            {'index': 2, 'data': None, 'errors': email_exists}
+        ]
+    }
+
+
+@pytest.mark.asyncio
+async def test_bulk_update_and_delete(setup_app):
+    client = setup_app
+
+    from pets.models import User, Pet
+
+    await User.objects.create(name='John Doe', email='john@doe.com')
+    await User.objects.create(name='Jane Doe', email='jane@doe.com')
+    await Pet.objects.create(name='Pinto', breed='Mutt', age=5, owner={'id': 2})
+
+    items = [
+        {'id': 1, 'name': 'New John Doe', 'email': 'john@doe.com'},
+        {'id': 2, 'name': 'Jane Doe', 'email': 'john@doe.com'}
+    ]
+    response = client.put('/user/user/bulk', json={'items': items}).json()
+    assert response['results'][0]['data'] == items[0]
+    assert response['results'][1]['errors'][0]['type'] == 'email-exists'
+    assert (await User.objects.get(id=1)).name == 'New John Doe'
+
+    response = client.request('DELETE', '/user/user/bulk', json={'ids': [2, 3]}).json()
+    assert response['results'][0] == {'index': 0, 'data': 2, 'errors': [], 'job': None}
+    assert response['results'][1]['errors'][0]['type'] == 'user-not-found'
+    assert await User.objects.count() == 1
+    assert await Pet.objects.count() == 0
+
+
+@pytest.mark.asyncio
+async def test_bulk_update_deleted_meanwhile(setup_app, monkeypatch):
+    client = setup_app
+
+    import pets.services.user_service as user_service
+    from pets.models import User
+
+    await User.objects.create(name='John Doe', email='john@doe.com')
+    await User.objects.create(name='Jane Doe', email='jane@doe.com')
+
+    update_many_versioned = user_service.update_many_versioned
+
+    async def deleted_meanwhile(table, rows):
+        await User.objects.filter(id=1).delete()
+        return await update_many_versioned(table, rows)
+
+    monkeypatch.setattr(user_service, 'update_many_versioned', deleted_meanwhile)
+    items = [
+        {'id': 1, 'name': 'New John Doe', 'email': 'john@doe.com'},
+        {'id': 2, 'name': 'New Jane Doe', 'email': 'jane@doe.com'}
+    ]
+    response = client.put('/user/user/bulk', json={'items': items})
+    assert response.status_code == 200
+    assert response.json()['results'][0]['errors'][0]['type'] == 'user-not-found'
+    assert response.json()['results'][1]['data'] == items[1]
+    assert (await User.objects.get(id=2)).version == 2
+
+
+@pytest.mark.asyncio
+async def test_conditional_get_and_if_match(setup_app):
+    client = setup_app
+
+    from pets.models import User
+
+    await User.objects.create(name='John Doe', email='john@doe.com')
+
+    etag = client.get('/user/user/1?expand=pets').headers['etag']
+    assert client.get('/user/user/1?expand=pets', headers={'If-None-Match': etag}).status_code == 304
+    page_etag = client.get('/user/user').headers['etag']
+    assert client.get('/user/user', headers={'If-None-Match': f'W/{page_etag}'}).status_code == 304
+
+    update_data = {'id': 1, 'name': 'John Updated', 'email': 'john@doe.com'}
+    response = client.put('/user/user/1', json=update_data, headers={'If-Match': '"1"'})
+    assert response.headers['etag'] == '"2"'
+    assert client.put('/user/user/1', json=update_data, headers={'If-Match': '"1"'}).status_code == 412
+
+    assert client.get('/user/user/1?expand=pets', headers={'If-None-Match': etag}).status_code == codes.CODE_200_OK.value
+    assert client.get('/user/user', headers={'If-None-Match': page_etag}).status_code == codes.CODE_200_OK.value